@@ -0,0 +1,64 @@
+"""Synthetic media fixtures generated with ffmpeg's lavfi sources.
+
+Each fixture is an MKV with one test-pattern video stream, any number of
+sine-tone audio streams and SRT subtitle streams, each tagged with a
+different language. Fixtures are cached by their parameters, so repeated
+benchmark runs reuse them.
+"""
+import os
+
+from ffmpeg_utils import FfmpegCommand, run
+
+LANGUAGES = ["eng", "ita", "fra", "deu", "spa", "jpn", "por", "rus"]
+
+
+def write_srt(path, duration, language):
+    """One cue per second for duration seconds"""
+    with open(path, "w", encoding="utf-8") as f:
+        for second in range(int(duration)):
+            f.write(f"{second + 1}\n")
+            f.write(f"00:{second // 60:02d}:{second % 60:02d},000 --> 00:{second // 60:02d}:{second % 60:02d},900\n")
+            f.write(f"[{language}] line {second + 1}\n\n")
+    return path
+
+
+def fixture_command(output_file, duration=10, audio_streams=2, subtitle_streams=2, size="640x360", rate=25,
+                    subtitle_files=()):
+    command = FfmpegCommand()
+    command.add_input(f"testsrc2=size={size}:rate={rate}:duration={duration}", ["-f", "lavfi"])
+    maps = ["0:v"]
+    for i in range(audio_streams):
+        maps.append(f"{command.add_input(f'sine=frequency={220 + 110 * i}:duration={duration}', ['-f', 'lavfi'])}:a")
+    for srt in subtitle_files:
+        maps.append(f"{command.add_input(srt)}:s")
+    metadata = []
+    for i in range(audio_streams):
+        metadata += [f"-metadata:s:a:{i}", f"language={LANGUAGES[i % len(LANGUAGES)]}"]
+    for i in range(subtitle_streams):
+        metadata += [f"-metadata:s:s:{i}", f"language={LANGUAGES[i % len(LANGUAGES)]}"]
+    # Keyframe every 2 s, like typical broadcast/streaming encodes
+    options = ["-preset", "ultrafast", "-g", str(2 * rate), "-pix_fmt", "yuv420p"]
+    command.add_output(output_file, maps, {"v": "libx264", "a": "aac", "s": "srt"}, metadata, options)
+    return command
+
+
+def make_fixture(directory, name="fixture", duration=10, audio_streams=2, subtitle_streams=2, size="640x360"):
+    """Path of a fixture with the given layout, generating it if needed"""
+    os.makedirs(directory, exist_ok=True)
+    output_file = os.path.join(directory, f"{name}_{duration}s_{audio_streams}a_{subtitle_streams}s_{size}.mkv")
+    if os.path.exists(output_file):
+        return output_file
+    subtitle_files = [write_srt(os.path.join(directory, f"{name}_{i}.srt"), duration, LANGUAGES[i % len(LANGUAGES)])
+                      for i in range(subtitle_streams)]
+    result = run(fixture_command(output_file + ".tmp.mkv", duration, audio_streams, subtitle_streams, size,
+                                 subtitle_files=subtitle_files))
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not generate {output_file}:\n{result.stderr}")
+    os.replace(output_file + ".tmp.mkv", output_file)
+    return output_file
+
+
+def make_external_subtitle(directory, video_file, language="ita", duration=10):
+    """An external <fixture>.<lang>.srt subtitle, as merges pick up"""
+    base = os.path.splitext(os.path.basename(video_file))[0]
+    return write_srt(os.path.join(directory, f"{base}.{language}.srt"), duration, language)
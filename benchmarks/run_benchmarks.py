@@ -0,0 +1,294 @@
+"""Benchmarks for the probe, extract, merge and import paths.
+
+Generates synthetic fixtures with ffmpeg's lavfi sources (see fixtures.py),
+runs every benchmark --repeat times and writes wall time, CPU time (this
+process plus its ffmpeg/ffprobe children), bytes read and peak RSS as JSON,
+so runs on different commits can be compared:
+
+    python benchmarks/run_benchmarks.py -o before.json
+    git checkout other-branch
+    python benchmarks/run_benchmarks.py -o after.json --baseline before.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, os.path.abspath(SRC_DIR))
+
+import ffmpeg_utils  # noqa: E402
+from extraction import plan_extraction  # noqa: E402
+from fixtures import make_external_subtitle, make_fixture  # noqa: E402
+from jobs import Job, JobQueue  # noqa: E402
+from media_catalog import MediaCatalog  # noqa: E402
+from media_probe import get_media_streams, probe_file, probe_files  # noqa: E402
+from merging import build_merge_command  # noqa: E402
+from probe_cache import ProbeCache  # noqa: E402
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark: a function (context) -> callable run once per sample"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class Context:
+    """Fixtures and scratch space shared by all benchmarks"""
+
+    def __init__(self, args):
+        self.args = args
+        self.fixture_dir = args.fixtures or os.path.join(tempfile.gettempdir(), "video-manipulator-bench")
+        self.work_dir = tempfile.mkdtemp(prefix="bench_")
+        self.fixture = make_fixture(self.fixture_dir, "main", args.duration, args.audio_streams,
+                                    args.subtitle_streams, args.size)
+        self.bulk_files = [make_fixture(self.fixture_dir, f"bulk{i:03d}", args.bulk_duration, 2, 1)
+                           for i in range(args.files)]
+        self.catalog = MediaCatalog.from_infos({f: probe_file(f) for f in [self.fixture] + self.bulk_files})
+
+    def output(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def _run_checked(argv):
+    result = ffmpeg_utils.run(argv)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} failed:\n{result.stderr}")
+
+
+@benchmark("probe.get_media_streams")
+def bench_probe(ctx):
+    return lambda: get_media_streams(ctx.fixture)
+
+
+@benchmark("extract.single_pass")
+def bench_extract_single_pass(ctx):
+    """Every audio and subtitle stream written by one demux pass (the GUI/CLI path)"""
+    record = ctx.catalog.get(ctx.fixture)
+    selections = [(ctx.fixture, s.data) for s in record.of_type("audio") + record.of_type("subtitle")]
+
+    def run():
+        for plan in plan_extraction(selections, ctx.catalog):
+            for target in plan.targets:
+                target.output_file = ctx.output(os.path.basename(target.output_file))
+            _run_checked(plan.command())
+    return run
+
+
+@benchmark("extract.per_stream")
+def bench_extract_per_stream(ctx):
+    """One ffmpeg run per stream through the ffmpeg_utils helpers"""
+    record = ctx.catalog.get(ctx.fixture)
+
+    def run():
+        for s in record.of_type("audio"):
+            ffmpeg_utils.extract_audio(ctx.fixture, ctx.output(f"audio_{s.rel_index}.mka"), s.rel_index)
+        for s in record.of_type("subtitle"):
+            ffmpeg_utils.extract_subtitles(ctx.fixture, ctx.output(f"subtitle_{s.rel_index}.srt"), s.rel_index)
+    return run
+
+
+@benchmark("extract.video")
+def bench_extract_video(ctx):
+    def run():
+        ffmpeg_utils.extract_video(ctx.fixture, ctx.output("video.mkv"))
+    return run
+
+
+@benchmark("merge.streams")
+def bench_merge_streams(ctx):
+    """Video plus every audio stream plus an external subtitle, stream-copied into one MKV"""
+    external = make_external_subtitle(ctx.work_dir, ctx.fixture, duration=ctx.args.duration)
+    catalog = MediaCatalog.from_infos({ctx.fixture: ctx.catalog.get(ctx.fixture).info,
+                                       external: probe_file(external)})
+    record = catalog.get(ctx.fixture)
+    stream_maps = [(ctx.fixture, s.codec_type, s.index) for s in record.of_type("video") + record.of_type("audio")]
+    argv = build_merge_command(ctx.fixture, stream_maps, [(external, "subtitle")], catalog, ctx.output("merged.mkv"))
+    return lambda: _run_checked(argv)
+
+
+@benchmark("merge.merge_files")
+def bench_merge_files(ctx):
+    """Concat-demuxer join of the bulk fixtures"""
+    def run():
+        result = ffmpeg_utils.merge_files(ctx.bulk_files, ctx.output("joined.mkv"))
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr)
+    return run
+
+
+@benchmark("import.bulk_cold")
+def bench_import_cold(ctx):
+    """Probe N files in parallel with no probe cache"""
+    return lambda: probe_files(ctx.bulk_files, max_workers=ctx.args.jobs)
+
+
+@benchmark("import.bulk_warm")
+def bench_import_warm(ctx):
+    """Import N files that are all in the probe cache"""
+    cache = ProbeCache(os.path.join(ctx.work_dir, "probe_cache.sqlite3"))
+    probe_files(ctx.bulk_files, max_workers=ctx.args.jobs, cache=cache)
+    return lambda: probe_files(ctx.bulk_files, max_workers=ctx.args.jobs, cache=cache)
+
+
+@benchmark("jobs.queue_overhead")
+def bench_queue_overhead(ctx):
+    """Dispatch cost of the job queue itself, with trivial commands"""
+    def run():
+        queue = JobQueue(max_workers=ctx.args.jobs)
+        for _ in range(ctx.args.files):
+            queue.submit(Job([sys.executable, "-c", "pass"]))
+        queue.wait()
+    return run
+
+
+class Sample:
+    """Resource usage of this process and its children over one benchmark run"""
+
+    def __init__(self):
+        self._self = resource.getrusage(resource.RUSAGE_SELF)
+        self._children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._io = _proc_read_bytes()
+        self._wall = time.perf_counter()
+
+    def finish(self):
+        wall = time.perf_counter() - self._wall
+        usage_self = resource.getrusage(resource.RUSAGE_SELF)
+        usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = sum(getattr(after, f) - getattr(before, f)
+                  for after, before in ((usage_self, self._self), (usage_children, self._children))
+                  for f in ("ru_utime", "ru_stime"))
+        # Block reads cover ffmpeg/ffprobe children; /proc/self/io adds what this process read itself
+        blocks = (usage_self.ru_inblock - self._self.ru_inblock) + (usage_children.ru_inblock - self._children.ru_inblock)
+        own_read = _proc_read_bytes() - self._io if self._io is not None else 0
+        return {
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "bytes_read": blocks * 512 + own_read,
+            # ru_maxrss is a high-water mark: children's is the largest child so far, not just this run
+            "peak_rss_kb": _rss_kb(usage_self.ru_maxrss),
+            "peak_child_rss_kb": _rss_kb(usage_children.ru_maxrss),
+        }
+
+
+def _proc_read_bytes():
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _rss_kb(maxrss):
+    # Linux reports kilobytes, macOS bytes
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def run_benchmark(name, ctx, repeat):
+    run = BENCHMARKS[name](ctx)
+    run()  # Warm-up: page cache, imports, first-run ffmpeg costs
+    samples = []
+    for _ in range(repeat):
+        sample = Sample()
+        run()
+        samples.append(sample.finish())
+    summary = {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+    return {"samples": samples, "median": summary}
+
+
+def environment(args):
+    try:
+        version = subprocess.run([ffmpeg_utils.FFMPEG, "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    except OSError:
+        version = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "ffmpeg": version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "only")},
+    }
+
+
+def compare(results, baseline_path, out=sys.stdout):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    print(f"{'benchmark':28} {'wall':>10} {'baseline':>10} {'ratio':>7}", file=out)
+    for name, result in results.items():
+        now = result["median"]["wall_s"]
+        before = baseline.get(name, {}).get("median", {}).get("wall_s")
+        if before:
+            print(f"{name:28} {now:10.4f} {before:10.4f} {now / before:6.2f}x", file=out)
+        else:
+            print(f"{name:28} {now:10.4f} {'-':>10} {'-':>7}", file=out)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-o", "--output", help="write results as JSON to this file (default: stdout)")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare wall times against")
+    parser.add_argument("--only", action="append", help="run only benchmarks whose name starts with this (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per benchmark (default: 5)")
+    parser.add_argument("--duration", type=int, default=30, help="length of the main fixture in seconds")
+    parser.add_argument("--audio-streams", type=int, default=4)
+    parser.add_argument("--subtitle-streams", type=int, default=4)
+    parser.add_argument("--size", default="1280x720", help="video frame size of the main fixture")
+    parser.add_argument("--files", type=int, default=20, help="number of files for the bulk benchmarks")
+    parser.add_argument("--bulk-duration", type=int, default=5, help="length of each bulk fixture in seconds")
+    parser.add_argument("-j", "--jobs", type=int, default=8, help="parallel probes for the bulk benchmarks")
+    parser.add_argument("--fixtures", help="directory to generate and reuse fixtures in (default: system temp)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    names = [n for n in BENCHMARKS if not args.only or any(n.startswith(prefix) for prefix in args.only)]
+    ctx = Context(args)
+    results = {}
+    try:
+        for name in names:
+            results[name] = run_benchmark(name, ctx, args.repeat)
+            median = results[name]["median"]
+            print(f"{name:28} wall {median['wall_s']:.4f}s  cpu {median['cpu_s']:.4f}s  "
+                  f"read {median['bytes_read'] / 1e6:.1f} MB", file=sys.stderr)
+    finally:
+        ctx.cleanup()
+
+    report = {"environment": environment(args), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.baseline:
+        compare(results, args.baseline, sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import os
+import sys
+
+APP_NAME = "video-manipulator"
+
+
+def user_cache_dir():
+    """Per-user cache directory for the application (created on first use)"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+        path = os.path.join(base, APP_NAME, "Cache")
+    elif sys.platform == "darwin":
+        path = os.path.join(os.path.expanduser("~/Library/Caches"), APP_NAME)
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        path = os.path.join(base, APP_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def user_log_dir():
+    """Per-user log directory for the application (created on first use)"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+        path = os.path.join(base, APP_NAME, "Logs")
+    elif sys.platform == "darwin":
+        path = os.path.join(os.path.expanduser("~/Library/Logs"), APP_NAME)
+    else:
+        base = os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state")
+        path = os.path.join(base, APP_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def user_data_dir():
+    """Per-user directory for persistent application state (created on first use)"""
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~\\AppData\\Roaming")
+        path = os.path.join(base, APP_NAME)
+    elif sys.platform == "darwin":
+        path = os.path.join(os.path.expanduser("~/Library/Application Support"), APP_NAME)
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+        path = os.path.join(base, APP_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,770 @@
+"""Headless command-line front-end sharing the GUI's extraction and merge engine.
+
+Nothing here imports PyQt5, so the CLI starts quickly on machines without a
+display (or without Qt at all).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+
+from concat import ConcatPlan
+from disk_scheduler import DiskScheduler, estimate_output_bytes, file_bytes
+from extraction import TYPE_SPECIFIERS, extract_jobs, plan_extraction, select_streams
+from jobs import Job, JobQueue, DONE, CANCELLED, FAILED
+from log_setup import setup_logging
+from loudness import TARGET_INTEGRATED, TARGET_RANGE, TARGET_TRUE_PEAK, LoudnessPlan
+from media_catalog import MediaCatalog, MediaRecord
+from media_probe import probe_files, media_duration
+from merge_rules import SeriesMergeRule, expand_globs, plan_series_merge, series_jobs
+from merging import merge_job
+from output_policy import OutputPolicy, partial_name, skip_existing
+from subtitles import ASS, SRT, convert_subtitles, subtitle_format
+from transcode import DEFAULT_CHUNK_THREADS, TranscodePlan, parallel_chunks, transcode_output_path
+from trim import TrimPlan, parse_timestamp, plan_split, split_points_every
+
+DEFAULT_JOBS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+def run_concat(input_files, infos, output_file, max_workers=DEFAULT_JOBS, policy=None):
+    """Join files, re-encoding only incompatible segments (in parallel) before a stream-copy join"""
+    plan = ConcatPlan(input_files, infos, output_file)
+    print(plan.summary(), file=sys.stderr)
+    if not plan.reference:
+        return 2
+    try:
+        normalize_jobs = [Job(argv, f"Re-encode {os.path.basename(segment.path)} for joining",
+                              input_file=segment.path, output_files=[segment.join_path],
+                              media_duration=media_duration(infos.get(segment.path, {})),
+                              estimated_bytes=file_bytes(segment.path))
+                          for segment, argv in plan.normalize_commands(progress=True)]
+        if run_jobs(normalize_jobs, max_workers):
+            return 1
+        concat_job = (policy or OutputPolicy()).stage(Job(
+            plan.concat_command(progress=True), f"Join into {os.path.basename(output_file)}",
+            input_file=input_files[0], output_files=[output_file],
+            estimated_bytes=file_bytes(*(s.join_path for s in plan.segments))))
+        return 1 if run_jobs([concat_job], 1) else 0
+    finally:
+        plan.cleanup()
+
+
+def run_trims(plans, max_workers=DEFAULT_JOBS, policy=None):
+    """Cut every piece of every plan in parallel, then join the multi-piece (exact) cuts"""
+    policy = policy or OutputPolicy()
+    for plan in plans:
+        print(f"{os.path.basename(plan.output_file)}: {plan.summary()}", file=sys.stderr)
+    final_outputs = {plan.output_file for plan in plans}
+    try:
+        piece_jobs = [Job(argv, f"{'Re-encode' if segment.reencode else 'Copy'} "
+                                f"{segment.start:.3f}-{segment.end:.3f}s of {os.path.basename(plan.input_file)}",
+                          input_file=plan.input_file, output_files=[segment.path], media_duration=segment.duration,
+                          estimated_bytes=estimate_output_bytes(plan.record, plan.streams, segment.duration))
+                      for plan in plans for segment, argv in plan.segment_commands(progress=True)]
+        for job in piece_jobs:
+            if job.output_files[0] in final_outputs:
+                policy.stage(job)  # A single-piece cut written straight to its output
+        if run_jobs(piece_jobs, max_workers):
+            return 1
+        join_jobs = [Job(argv, f"Join {os.path.basename(plan.output_file)}", input_file=plan.input_file,
+                         output_files=[plan.output_file], estimated_bytes=file_bytes(*(s.path for s in plan.segments)))
+                     for plan in plans for argv in [plan.concat_command(progress=True)] if argv]
+        for job in join_jobs:
+            policy.stage(job)
+        return 1 if run_jobs(join_jobs, max_workers) else 0
+    finally:
+        for plan in plans:
+            plan.cleanup()
+
+
+def run_transcode(plan, max_workers, retries=2, policy=None):
+    """Encode the chunks (and the audio) in parallel, retrying failed chunks on their own, then mux"""
+    print(plan.summary(), file=sys.stderr)
+    name = os.path.basename(plan.input_file)
+    try:
+        jobs = [Job(argv, f"Encode chunk {chunk.number + 1}/{len(plan.chunks)} "
+                          f"({chunk.start:.3f}-{chunk.end:.3f}s) of {name}",
+                    input_file=plan.input_file, output_files=[chunk.path], media_duration=chunk.duration,
+                    estimated_bytes=estimate_output_bytes(plan.record, {plan.video.index}, chunk.duration))
+                for chunk, argv in plan.chunk_commands(progress=True)]
+        audio_argv = plan.audio_command(progress=True)
+        if audio_argv:
+            jobs.append(Job(audio_argv, f"Encode audio of {name}", input_file=plan.input_file,
+                            output_files=[plan.audio_file], media_duration=plan.record.duration))
+        if run_jobs(jobs, max_workers, retries=retries):
+            return 1
+        estimate = file_bytes(*(c.path for c in plan.chunks))
+        if plan.audio_file:
+            estimate += file_bytes(plan.audio_file)
+        else:
+            estimate += estimate_output_bytes(plan.record, {s.index for s in plan.record.of_type("audio")}) or 0
+        mux_job = (policy or OutputPolicy()).stage(Job(
+            plan.mux_command(progress=True), f"Join chunks into {os.path.basename(plan.output_file)}",
+            input_file=plan.input_file, output_files=[plan.output_file], media_duration=plan.record.duration,
+            estimated_bytes=estimate))
+        return 1 if run_jobs([mux_job], 1) else 0
+    finally:
+        plan.cleanup()
+
+
+def run_loudness(plans, max_workers, cache=None, measure_only=False, overwrite=False, policy=None,
+                 result_cache=None):
+    """Measure every plan's pending streams (one ffmpeg run per file), then normalize all streams in parallel"""
+    analysis_jobs = {}
+    for plan in plans:
+        argv = plan.analysis_command(progress=True)
+        if argv:
+            job = Job(argv, f"Measure loudness of {len(plan.pending)} stream(s) of {os.path.basename(plan.input_file)}",
+                      input_file=plan.input_file, media_duration=plan.record.duration)
+            analysis_jobs[job.id] = (job, plan)
+    status = 1 if run_jobs([job for job, _ in analysis_jobs.values()], max_workers) else 0
+    for job, plan in analysis_jobs.values():
+        if job.state != DONE:
+            continue
+        try:
+            plan.read_analysis(job.stderr)
+        except ValueError as e:
+            print(f"video-manipulator: error: {e}", file=sys.stderr)
+            status = 1
+            continue
+        if cache:
+            cache.put(plan.input_file, plan.record.info)
+
+    measured = [plan for plan in plans if not plan.pending]
+    for plan in measured:
+        print(plan.summary(), file=sys.stderr)
+    if measure_only:
+        json.dump({plan.input_file: {str(s.index): plan.measurement(s) for s in plan.streams} for plan in measured},
+                  sys.stdout, indent=2)
+        print()
+        return status
+
+    jobs = []
+    for plan in measured:
+        for stream, output_file, argv in plan.normalize_commands(progress=True):
+            if not overwrite and _skip_existing(output_file):
+                continue
+            jobs.append((policy or OutputPolicy()).stage(Job(
+                argv, f"Normalize stream {stream.index} of {os.path.basename(plan.input_file)}",
+                input_file=plan.input_file, output_files=[output_file], media_duration=plan.record.duration,
+                estimated_bytes=estimate_output_bytes(plan.record, {stream.index}))))
+    if run_jobs(jobs, max_workers, result_cache=result_cache):
+        status = 1
+    return status
+
+
+def run_previews(input_files, infos, max_workers):
+    """Make (or find cached) thumbnails and contact sheets, then print their paths as JSON"""
+    from thumbnails import ThumbnailCache
+
+    thumbnails = ThumbnailCache()
+    records = []
+    for path in input_files:
+        if not infos.get(path, {}).get("streams"):
+            raise ValueError(f"Could not probe {path}")
+        records.append(MediaRecord(path, infos[path]))
+    jobs = [job for job in (thumbnails.preview_job(record) for record in records) if job]
+    failed = run_jobs(jobs, max_workers)
+    for job in jobs:
+        if job.state == DONE:
+            thumbnails.commit(job)
+    previews = {}
+    for record in records:
+        for stream in record.of_type("video"):
+            images = thumbnails.get(record.path, stream.index)
+            if images:
+                previews.setdefault(record.path, {})[str(stream.index)] = {"thumbnail": images[0],
+                                                                           "contact_sheet": images[1]}
+    json.dump(previews, sys.stdout, indent=2)
+    print()
+    return 1 if failed else 0
+
+
+def run_streamed(input_file, infos, sink_spec, container, serve=False, types=None, indexes=None):
+    """Stream the selected streams of one file to a sink (see streaming.StreamSink.parse); returns the exit status"""
+    from streaming import STDOUT, StreamSink, run_stream, stream_command
+
+    sink = StreamSink.parse(sink_spec, serve)
+    catalog = MediaCatalog.from_infos({input_file: infos.get(input_file, {})})
+    if not catalog.streams(input_file):
+        raise ValueError(f"Could not probe {input_file}")
+    plans = plan_extraction([(input_file, s) for s in select_streams(catalog.streams(input_file), types, indexes)],
+                            catalog)
+    if not plans:
+        raise ValueError(f"No stream of {input_file} matches the selection")
+    if sink.kind != STDOUT:
+        print(f"Streaming {os.path.basename(input_file)} to {sink.url}", file=sys.stderr)
+    returncode, stderr = run_stream(stream_command(plans[0], sink, container), sink)
+    if returncode != 0:
+        message = stderr.strip().splitlines()[-1:] or [f"exit code {returncode}"]
+        print(f"video-manipulator: streaming failed: {message[0]}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_subtitles(input_files, template, shift=0.0, fps=None, output_format=None, encoding=None,
+                  overwrite=False, in_place=False):
+    """Shift/retime/convert external subtitle files in-process (no ffmpeg); returns the exit status"""
+    status = 0
+    for path in input_files:
+        stem, ext = os.path.splitext(os.path.basename(path))
+        if output_format:
+            ext = f".{output_format}"
+        if in_place:
+            output_file = os.path.splitext(path)[0] + ext
+        else:
+            output_file = template.format(dir=os.path.dirname(path) or ".", stem=stem, ext=ext)
+            if not overwrite and _skip_existing(output_file):
+                continue
+        temp_file = os.path.join(os.path.dirname(output_file), partial_name(os.path.basename(output_file)))
+        try:
+            count = convert_subtitles(path, temp_file, shift, fps, output_format or subtitle_format(output_file),
+                                      encoding)
+            os.replace(temp_file, output_file)
+        except (OSError, ValueError) as e:
+            print(f"failed: {path}: {e}", file=sys.stderr)
+            _remove_quietly(temp_file)
+            status = 1
+            continue
+        print(f"{count} cue(s): {path} -> {output_file}", file=sys.stderr)
+    return status
+
+
+def parse_fps_pair(value):
+    """Parse a --fps value such as "23.976:25" into (from_fps, to_fps)"""
+    try:
+        from_fps, to_fps = (float(v) for v in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected FROM:TO frame rates, got {value!r}")
+    if from_fps <= 0 or to_fps <= 0:
+        raise argparse.ArgumentTypeError("frame rates must be positive")
+    return from_fps, to_fps
+
+
+def parse_offset(value):
+    """Parse a --shift value: a timestamp with an optional leading minus sign"""
+    value = value.strip()
+    if value.startswith("-"):
+        return -parse_timestamp(value[1:])
+    return parse_timestamp(value.lstrip("+"))
+
+
+def keyframe_record(path, infos, cache=None):
+    """MediaRecord of a probed file with its keyframe index loaded (and cached with the probe data)"""
+    if not infos.get(path, {}).get("streams"):
+        raise ValueError(f"Could not probe {path}")
+    record = MediaRecord(path, infos[path])
+    had_index = record.has_keyframe_index
+    record.keyframes()
+    if cache and not had_index:
+        cache.put(path, record.info)
+    return record
+
+
+def parse_stream_rule(value):
+    """Parse a --video/--audio/--subtitle value: "all", "none" or a comma list of indexes and languages"""
+    if value in ("all", "none"):
+        return value
+    return [int(item) if item.isdigit() else item for item in value.split(",") if item]
+
+
+def manifest_jobs(manifest, infos, overwrite=False, policy=None):
+    """Build jobs for every entry of a batch manifest"""
+    jobs = []
+    for entry in manifest:
+        action = entry.get("action")
+        overwrite_entry = entry.get("overwrite", overwrite)
+        if action == "extract":
+            inputs = _as_list(entry.get("input"))
+            jobs += extract_jobs(inputs, infos, entry.get("types"), entry.get("streams"), overwrite_entry, policy,
+                                 _report)
+        elif action == "merge":
+            job = merge_job(entry["video"], infos, entry.get("streams"), _as_list(entry.get("add")),
+                            entry.get("output"), overwrite_entry, policy, _report)
+            if job is not None:
+                jobs.append(job)
+        elif action == "merge-series":
+            specs = plan_series_merge(expand_globs(_as_list(entry.get("videos"))),
+                                      expand_globs(_as_list(entry.get("externals"))),
+                                      infos, SeriesMergeRule.from_dict(entry))
+            jobs += series_jobs(specs, infos, overwrite_entry, policy, _report)
+        else:
+            raise ValueError(f"Unknown manifest action: {action!r}")
+    return jobs
+
+
+def manifest_inputs(manifest):
+    files = []
+    for entry in manifest:
+        files += _as_list(entry.get("input")) + _as_list(entry.get("video")) + _as_list(entry.get("add"))
+        files += expand_globs(_as_list(entry.get("videos")) + _as_list(entry.get("externals")))
+    return files
+
+
+def load_manifest(path):
+    """Read a batch manifest: a JSON list of job entries, or an object with a "jobs" list"""
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest.get("jobs", [])
+    if not isinstance(manifest, list):
+        raise ValueError(f"{path}: expected a list of jobs")
+    return manifest
+
+
+def run_jobs(jobs, max_workers=DEFAULT_JOBS, out=sys.stderr, retries=0, result_cache=None, queue=None):
+    """Run jobs with bounded parallelism, reporting each as it finishes; returns the failed jobs.
+
+    A failed job is run again up to retries times, and only its last attempt counts.
+    queue runs them elsewhere (e.g. a job_server.JobServer) instead of on a local JobQueue.
+    """
+    if not jobs:
+        return []
+    if queue is None:
+        queue = JobQueue(max_workers=max_workers, scheduler=DiskScheduler(), result_cache=result_cache)
+    print_lock = threading.Lock()
+    finished = []
+    all_finished = threading.Event()
+    latest = list(jobs)  # Last attempt of each job
+    slots = {job.id: n for n, job in enumerate(jobs)}
+
+    def report(job):
+        if not job.finished:
+            return
+        retry = None
+        with print_lock:
+            if job.state == FAILED and job.attempt <= retries and not all_finished.is_set():
+                retry = job.retry()
+                slots[retry.id] = slots[job.id]
+                latest[slots[job.id]] = retry
+                print(f"[retry {job.attempt}/{retries}] {job.state}: {job.description}", file=out)
+            else:
+                finished.append(job)
+                state = f"{job.state} (cached)" if job.cached else job.state
+                print(f"[{len(finished)}/{len(jobs)}] {state}: {job.description}", file=out)
+                if job.state not in (DONE, CANCELLED):
+                    print((str(job.error) if job.error else job.stderr).strip(), file=out)
+                if len(finished) == len(jobs):
+                    all_finished.set()
+        if retry is not None:
+            try:
+                queue.submit(retry)
+            except RuntimeError:  # Shut down by an interrupt meanwhile
+                retry.state = CANCELLED
+                report(retry)
+
+    queue.add_listener(report)
+    for job in jobs:
+        queue.submit(job)
+    try:
+        all_finished.wait()
+    except KeyboardInterrupt:
+        queue.shutdown(cancel=True)
+    return [job for job in latest if job.state != DONE]
+
+
+def common_options(jobs_default=DEFAULT_JOBS, jobs_default_text=None):
+    """Options every subcommand takes (a fresh parser each time: argparse shares parent actions)"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-j", "--jobs", type=int, default=jobs_default,
+                        help=f"number of ffmpeg/ffprobe processes to run in parallel "
+                             f"(default: {jobs_default_text or jobs_default})")
+    common.add_argument("--no-cache", action="store_true", help="do not read or update the probe and result caches")
+    common.add_argument("--debug", action="store_true", default=None, help="log debug records and echo them to stderr")
+    common.add_argument("--log-dir", help="directory for the rotating log file (default: per-user log directory)")
+    common.add_argument("--output-root", help="write outputs under this directory instead of beside their inputs")
+    common.add_argument("--scratch-dir", help="write outputs on this (local) disk first and move them into place "
+                                              "when complete")
+    common.add_argument("--output-policy", help="JSON output policy with root, scratch and per-kind name templates "
+                                                "(default: output_policy.json in the per-user data directory)")
+    return common
+
+
+def dispatch_options():
+    """Options of the subcommands whose jobs can be run by remote workers"""
+    dispatch = argparse.ArgumentParser(add_help=False)
+    dispatch.add_argument("--listen", metavar="[HOST:]PORT",
+                          help="hand the jobs to workers polling a job server on this address instead of running "
+                               "them here (-j then caps how many run at once across all workers)")
+    dispatch.add_argument("--local-workers", type=int, default=0,
+                          help="with --listen, also start this many worker processes on this machine")
+    return dispatch
+
+
+def build_parser():
+    common = common_options()
+    dispatch = dispatch_options()
+
+    parser = argparse.ArgumentParser(prog="video-manipulator",
+                                     description="Extract and merge video, audio and subtitle streams with FFmpeg.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    probe = commands.add_parser("probe", parents=[common], help="print the streams of media files as JSON")
+    probe.add_argument("files", nargs="+")
+
+    extract = commands.add_parser("extract", parents=[common, dispatch], help="extract streams into separate files")
+    extract.add_argument("files", nargs="+")
+    extract.add_argument("-t", "--type", dest="types", action="append", choices=sorted(TYPE_SPECIFIERS),
+                         help="stream type to extract (repeatable; default: all)")
+    extract.add_argument("-s", "--stream", dest="streams", action="append", type=int,
+                         help="global stream index to extract (repeatable)")
+    extract.add_argument("-y", "--overwrite", action="store_true", help="overwrite existing output files")
+    extract.add_argument("--to", metavar="SINK",
+                         help="stream the selected streams of one file to SINK instead of writing files: "
+                              "- (stdout), tcp://HOST:PORT, unix:PATH or a named pipe path")
+    extract.add_argument("--format", default="matroska",
+                         help="container of a --to stream, as an ffmpeg muxer name (default: matroska)")
+    extract.add_argument("--serve", action="store_true",
+                         help="with a tcp:// or unix: --to sink, listen and wait for the consumer to connect")
+
+    merge = commands.add_parser("merge", parents=[common, dispatch], help="merge streams into a new video file")
+    merge.add_argument("video")
+    merge.add_argument("-s", "--stream", dest="streams", action="append", type=int,
+                       help="global stream index of the video file to keep (repeatable; default: all)")
+    merge.add_argument("-a", "--add", dest="add_files", action="append", default=[],
+                       help="external audio or subtitle file to add (repeatable)")
+    merge.add_argument("-o", "--output", help="output file (default: <video>_merged.mkv)")
+    merge.add_argument("-y", "--overwrite", action="store_true", help="overwrite the output file")
+
+    series = commands.add_parser("series", parents=[common, dispatch],
+                                 help="merge every video of a series with its matching external tracks")
+    series.add_argument("videos", nargs="+", help="video files (or glob patterns)")
+    series.add_argument("-a", "--add", dest="externals", action="append", default=[],
+                        help="external audio/subtitle files or glob patterns, paired by episode (repeatable)")
+    series.add_argument("--video", type=parse_stream_rule, default="all",
+                        help='video streams to keep: "all", "none" or a comma list of indexes/languages')
+    series.add_argument("--audio", type=parse_stream_rule, default="all",
+                        help='audio streams and external audio to keep, e.g. "eng,ita"')
+    series.add_argument("--subtitle", type=parse_stream_rule, default="all",
+                        help='subtitle streams and external subtitles to keep, e.g. "ita"')
+    series.add_argument("-o", "--output", help="output name template with {dir}, {stem} and {key} "
+                                               "(default: <video>_merged.mkv)")
+    series.add_argument("-y", "--overwrite", action="store_true", help="overwrite existing output files")
+
+    concat = commands.add_parser("concat", parents=[common],
+                                 help="join files end to end, losslessly when their streams are compatible")
+    concat.add_argument("files", nargs="+")
+    concat.add_argument("-o", "--output", required=True, help="output file")
+    concat.add_argument("-y", "--overwrite", action="store_true", help="overwrite the output file")
+
+    watch = commands.add_parser("watch", parents=[common],
+                                help="process media files as they arrive in hot folders (runs until stopped)")
+    watch.add_argument("directories", nargs="+")
+    watch.add_argument("--rule", required=True, help='JSON ingest rule, e.g. {"action": "extract", "types": ["audio"]}')
+    watch.add_argument("--journal", help="processed-files journal (default: in the per-user data directory)")
+    watch.add_argument("--interval", type=float, default=2.0, help="seconds between directory scans (default: 2)")
+    watch.add_argument("--settle", type=float, default=5.0,
+                       help="seconds a file's size must stay unchanged before it is processed (default: 5)")
+    watch.add_argument("--no-recursive", dest="recursive", action="store_false", help="do not watch subdirectories")
+    watch.add_argument("--once", action="store_true", help="process what is there now, then exit")
+
+    trim = commands.add_parser("trim", parents=[common],
+                               help="cut a time range out of a file by stream copy, snapped to keyframes")
+    trim.add_argument("file")
+    trim.add_argument("--start", type=parse_timestamp, default=0.0, help="start time (seconds or [HH:]MM:SS[.ms])")
+    trim.add_argument("--end", type=parse_timestamp, help="end time (default: end of file)")
+    trim.add_argument("--exact", action="store_true",
+                      help="cut exactly at the given times, re-encoding only the partial GOPs at the boundaries")
+    trim.add_argument("-s", "--stream", dest="streams", action="append", type=int,
+                      help="global stream index to keep (repeatable; default: all)")
+    trim.add_argument("-o", "--output", help="output file (default: <file>_trim_<start>-<end>.<ext>)")
+    trim.add_argument("-y", "--overwrite", action="store_true", help="overwrite the output file")
+
+    split = commands.add_parser("split", parents=[common], help="split a file into pieces at keyframes")
+    split.add_argument("file")
+    points = split.add_mutually_exclusive_group(required=True)
+    points.add_argument("--at", dest="points", action="append", type=parse_timestamp,
+                        help="split point (repeatable)")
+    points.add_argument("--every", type=parse_timestamp, help="split into pieces of this length")
+    split.add_argument("--exact", action="store_true", help="split exactly at the given times")
+    split.add_argument("-s", "--stream", dest="streams", action="append", type=int,
+                       help="global stream index to keep (repeatable; default: all)")
+    split.add_argument("-o", "--output", help="output name template with {dir}, {stem}, {ext} and {n} "
+                                              "(default: {dir}/{stem}_part{n:02d}{ext})")
+    split.add_argument("-y", "--overwrite", action="store_true", help="overwrite existing output files")
+
+    transcode = commands.add_parser("transcode", parents=[common_options(None, "one per --threads cores")],
+                                    help="re-encode the video of a file in parallel keyframe-aligned chunks")
+    transcode.add_argument("file")
+    transcode.add_argument("-o", "--output", help="output file (default: <file>_transcoded.mkv)")
+    transcode.add_argument("--vcodec", default="libx264", help="video encoder (default: libx264)")
+    transcode.add_argument("--crf", type=int, help="constant rate factor for the video encoder")
+    transcode.add_argument("--preset", help="encoder preset, e.g. slow")
+    transcode.add_argument("--acodec", default="copy", help="audio encoder (default: copy the source audio)")
+    transcode.add_argument("--abitrate", help="audio bitrate, e.g. 192k")
+    transcode.add_argument("--chunks", type=int, help="number of chunks (default: twice the parallel encodes)")
+    transcode.add_argument("--threads", type=int, default=DEFAULT_CHUNK_THREADS,
+                           help=f"encoder threads per chunk (default: {DEFAULT_CHUNK_THREADS})")
+    transcode.add_argument("--retries", type=int, default=2, help="times to retry a failed chunk (default: 2)")
+    transcode.add_argument("-y", "--overwrite", action="store_true", help="overwrite the output file")
+
+    subs = commands.add_parser("subs", parents=[common],
+                               help="shift, retime or convert SRT/ASS subtitle files (without ffmpeg)")
+    subs.add_argument("files", nargs="+")
+    subs.add_argument("--shift", type=parse_offset, default=0.0,
+                      help="move every cue by this much, e.g. 1.5 or --shift=-0:02.250")
+    subs.add_argument("--fps", type=parse_fps_pair, help="retime from one frame rate to another, e.g. 23.976:25")
+    subs.add_argument("--to", dest="output_format", choices=[SRT, ASS], help="convert to this format")
+    subs.add_argument("--encoding", help="input encoding (default: detected; output is always UTF-8)")
+    subs.add_argument("-o", "--output", default="{dir}/{stem}.retimed{ext}",
+                      help="output name template with {dir}, {stem} and {ext} (default: {dir}/{stem}.retimed{ext})")
+    subs.add_argument("--in-place", action="store_true", help="replace the input files")
+    subs.add_argument("-y", "--overwrite", action="store_true", help="overwrite existing output files")
+
+    loudness = commands.add_parser("loudness", parents=[common],
+                                   help="measure (EBU R128) and normalize the loudness of audio streams")
+    loudness.add_argument("files", nargs="+")
+    loudness.add_argument("-s", "--stream", dest="streams", action="append", type=int,
+                          help="global index of an audio stream (repeatable; default: all audio streams)")
+    loudness.add_argument("--measure", action="store_true", help="only print the measurements as JSON")
+    loudness.add_argument("--integrated", type=float, default=TARGET_INTEGRATED,
+                          help=f"target integrated loudness in LUFS (default: {TARGET_INTEGRATED:g})")
+    loudness.add_argument("--true-peak", type=float, default=TARGET_TRUE_PEAK,
+                          help=f"maximum true peak in dBTP (default: {TARGET_TRUE_PEAK:g})")
+    loudness.add_argument("--lra", type=float, default=TARGET_RANGE,
+                          help=f"target loudness range in LU when peaks need dynamic processing "
+                               f"(default: {TARGET_RANGE:g})")
+    loudness.add_argument("--acodec", help="audio encoder (default: the source codec, or FLAC)")
+    loudness.add_argument("--abitrate", help="audio bitrate, e.g. 192k (default: the source's)")
+    loudness.add_argument("-y", "--overwrite", action="store_true", help="overwrite existing output files")
+
+    preview = commands.add_parser("preview", parents=[common],
+                                  help="make thumbnails and contact sheets of video streams, decoding keyframes only")
+    preview.add_argument("files", nargs="+")
+
+    worker = commands.add_parser("worker", parents=[common_options(1)],
+                                 help="run jobs handed out by a job server (see --listen), -j at a time")
+    worker.add_argument("--server", required=True, help="job server URL, e.g. http://render1:8790")
+    worker.add_argument("--name", help="worker name reported to the server (default: <host>-<pid>)")
+
+    batch = commands.add_parser("batch", parents=[common, dispatch], help="run the extract/merge jobs of a JSON manifest")
+    batch.add_argument("--manifest", required=True, help="JSON file with a list of extract/merge entries")
+    batch.add_argument("-y", "--overwrite", action="store_true", help="overwrite existing output files")
+
+    return parser
+
+
+def command_names():
+    """Names of the subcommands, which main.py runs headless instead of starting the GUI"""
+    parser = build_parser()
+    return next(action.choices for action in parser._actions if isinstance(action, argparse._SubParsersAction))
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    setup_logging(args.log_dir, args.debug, console=True)
+    cache = None
+    if not args.no_cache:
+        from probe_cache import ProbeCache
+        try:
+            cache = ProbeCache()
+        except Exception:
+            cache = None
+
+    try:
+        policy = output_policy(args)
+        if args.command == "probe":
+            infos = probe_files(args.files, max_workers=args.jobs, cache=cache)
+            json.dump(infos, sys.stdout, indent=2)
+            print()
+            return 0 if all(info.get("streams") for info in infos.values()) else 1
+
+        if args.command == "extract" and args.to:
+            if len(args.files) != 1 or args.listen:
+                raise ValueError("--to streams a single input file and cannot be combined with --listen")
+            infos = probe_files(args.files, max_workers=1, cache=cache)
+            return run_streamed(args.files[0], infos, args.to, args.format, args.serve, args.types, args.streams)
+        if args.command == "extract":
+            infos = probe_files(args.files, max_workers=args.jobs, cache=cache)
+            jobs = extract_jobs(args.files, infos, args.types, args.streams, args.overwrite, policy, _report)
+        elif args.command == "merge":
+            infos = probe_files([args.video] + args.add_files, max_workers=args.jobs, cache=cache)
+            job = merge_job(args.video, infos, args.streams, args.add_files, args.output, args.overwrite, policy,
+                            _report)
+            jobs = [job] if job else []
+        elif args.command == "concat":
+            if not args.overwrite and _skip_existing(args.output):
+                return 0
+            infos = probe_files(args.files, max_workers=args.jobs, cache=cache)
+            return run_concat(args.files, infos, args.output, args.jobs, policy)
+        elif args.command in ("trim", "split"):
+            infos = probe_files([args.file], max_workers=1, cache=cache)
+            record = keyframe_record(args.file, infos, cache)
+            if args.command == "trim":
+                plans = [TrimPlan(record, args.start, args.end, args.output, args.exact, args.streams)]
+            else:
+                points = args.points or split_points_every(record.duration or 0.0, args.every)
+                plans = plan_split(record, points, args.exact, args.streams, args.output)
+            if not args.output:
+                for plan in plans:
+                    plan.output_file = policy.place(plan.output_file, args.file, args.command)
+            plans = [p for p in plans if args.overwrite or not _skip_existing(p.output_file)]
+            return run_trims(plans, args.jobs, policy) if plans else 0
+        elif args.command == "transcode":
+            output_file = args.output or policy.place(transcode_output_path(args.file), args.file, "transcode")
+            if not args.overwrite and _skip_existing(output_file):
+                return 0
+            infos = probe_files([args.file], max_workers=1, cache=cache)
+            video_options = (["-crf", str(args.crf)] if args.crf is not None else []) + \
+                            (["-preset", args.preset] if args.preset else [])
+            plan = TranscodePlan(keyframe_record(args.file, infos, cache), output_file, args.vcodec, video_options,
+                                 args.acodec, ["-b:a", args.abitrate] if args.abitrate else [], args.chunks,
+                                 args.threads)
+            return run_transcode(plan, args.jobs or parallel_chunks(args.threads), args.retries, policy)
+        elif args.command == "loudness":
+            infos = probe_files(args.files, max_workers=args.jobs, cache=cache)
+            plans = []
+            for path in args.files:
+                if not infos.get(path, {}).get("streams"):
+                    raise ValueError(f"Could not probe {path}")
+                plan = LoudnessPlan(MediaRecord(path, infos[path]), args.streams, args.integrated, args.true_peak,
+                                    args.lra, args.acodec, args.abitrate)
+                plan.outputs = {index: policy.place(output_file, path, "loudness")
+                                for index, output_file in plan.outputs.items()}
+                plans.append(plan)
+            result_cache = open_result_cache(args)
+            try:
+                return run_loudness(plans, args.jobs, cache, args.measure, args.overwrite, policy, result_cache)
+            finally:
+                if result_cache:
+                    result_cache.close()
+        elif args.command == "preview":
+            infos = probe_files(args.files, max_workers=args.jobs, cache=cache)
+            return run_previews(args.files, infos, args.jobs)
+        elif args.command == "subs":
+            return run_subtitles(args.files, args.output, args.shift, args.fps, args.output_format, args.encoding,
+                                 args.overwrite, args.in_place)
+        elif args.command == "watch":
+            return run_watch(args, cache, policy)
+        elif args.command == "worker":
+            return run_worker(args, policy)
+        elif args.command == "series":
+            videos, externals = expand_globs(args.videos), expand_globs(args.externals)
+            infos = probe_files(videos + externals, max_workers=args.jobs, cache=cache)
+            rule = SeriesMergeRule(args.video, args.audio, args.subtitle, args.output)
+            jobs = series_jobs(plan_series_merge(videos, externals, infos, rule), infos, args.overwrite, policy,
+                               _report)
+        else:
+            manifest = load_manifest(args.manifest)
+            infos = probe_files(manifest_inputs(manifest), max_workers=args.jobs, cache=cache)
+            jobs = manifest_jobs(manifest, infos, args.overwrite, policy)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"video-manipulator: error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if cache:
+            cache.close()
+
+    if not jobs:
+        print("Nothing to do.", file=sys.stderr)
+        return 0
+    if args.listen:
+        return 1 if run_remote(jobs, args) else 0
+    result_cache = open_result_cache(args)
+    try:
+        failed = run_jobs(jobs, args.jobs, result_cache=result_cache)
+    finally:
+        if result_cache:
+            result_cache.close()
+    return 1 if failed else 0
+
+
+def run_remote(jobs, args):
+    """Run jobs on the workers of a job server listening on --listen; returns the failed jobs"""
+    from job_server import TOKEN_ENV, JobServer, parse_address, spawn_local_workers, stop_local_workers
+
+    token = os.environ.get(TOKEN_ENV)
+    server = JobServer(*parse_address(args.listen), token=token, max_workers=args.jobs).start()
+    print(f"Job server at {server.url}: start workers with "
+          f"`video-manipulator worker --server {server.url}`", file=sys.stderr)
+    workers = spawn_local_workers(server.url, args.local_workers, token=token) if args.local_workers else []
+    try:
+        return run_jobs(jobs, out=sys.stderr, queue=server)
+    finally:
+        server.shutdown(wait=False)
+        stop_local_workers(workers)
+
+
+def open_result_cache(args):
+    """The result cache, unless --no-cache was given or it cannot be opened"""
+    if args.no_cache:
+        return None
+    from result_cache import ResultCache
+    try:
+        return ResultCache()
+    except Exception:
+        return None
+
+
+def output_policy(args):
+    """The output policy file (if any) with --output-root/--scratch-dir applied on top"""
+    policy = OutputPolicy.load(args.output_policy)
+    if args.output_root:
+        policy.root = os.path.abspath(args.output_root)
+    if args.scratch_dir:
+        policy.scratch_dir = os.path.abspath(args.scratch_dir)
+    return policy
+
+
+def run_watch(args, cache, policy=None):
+    """Run the watch-folder service until interrupted (or, with --once, until idle)"""
+    import signal
+    from watch_folder import IngestRule, ProcessedJournal, WatchService
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            raise ValueError(f"{directory} is not a directory")
+    service = WatchService(args.directories, IngestRule.load(args.rule), ProcessedJournal(args.journal),
+                           max_workers=args.jobs, interval=args.interval, settle=args.settle,
+                           recursive=args.recursive, cache=cache, policy=policy)
+    signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+    try:
+        service.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def run_worker(args, policy=None):
+    """Lease and run jobs from a job server until interrupted"""
+    import signal
+    from job_server import TOKEN_ENV, Worker
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    result_cache = open_result_cache(args)
+    worker = Worker(args.server, args.jobs, args.name, os.environ.get(TOKEN_ENV), policy, result_cache)
+    try:
+        worker.run(stop)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if result_cache:
+            result_cache.close()
+    return 0
+
+
+def _skip_existing(output_file):
+    return skip_existing(output_file, _report)
+
+
+def _report(message):
+    print(message, file=sys.stderr)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
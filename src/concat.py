@@ -0,0 +1,174 @@
+"""Lossless concatenation with a codec-compatibility precheck.
+
+Segments whose probed stream parameters match the first segment are joined
+as-is with the concat demuxer and -c copy. Only segments that differ are
+re-encoded to the first segment's parameters first, so the final join is
+still a stream copy.
+"""
+import os
+import shutil
+import tempfile
+
+from ffmpeg_utils import FfmpegCommand, concat_command, stream_map, write_concat_list
+
+COPY = "copy"
+REENCODE = "reencode"
+
+# Parameters that must match for a stream copy join, per stream type
+SIGNATURE_FIELDS = {
+    "video": ("codec_name", "profile", "width", "height", "pix_fmt", "r_frame_rate", "time_base"),
+    "audio": ("codec_name", "profile", "sample_rate", "channels", "channel_layout", "time_base"),
+}
+
+# Encoder used to reproduce a codec when a segment has to be re-encoded
+ENCODERS = {
+    "h264": "libx264", "hevc": "libx265", "vp9": "libvpx-vp9", "av1": "libaom-av1", "mpeg4": "mpeg4",
+    "aac": "aac", "mp3": "libmp3lame", "opus": "libopus", "vorbis": "libvorbis", "ac3": "ac3",
+    "eac3": "eac3", "flac": "flac",
+}
+
+
+def stream_layout(streams):
+    """(type, parameters) of every video and audio stream, in order"""
+    layout = []
+    for s in streams:
+        fields = SIGNATURE_FIELDS.get(s.get("codec_type"))
+        if fields:
+            layout.append((s.get("codec_type"), tuple((f, s.get(f)) for f in fields)))
+    return layout
+
+
+def layout_differences(reference, layout):
+    """Human-readable reasons why layout cannot be stream-copied after reference"""
+    ref_types = [t for t, _ in reference]
+    types = [t for t, _ in layout]
+    if types != ref_types:
+        return [f"stream layout {'+'.join(types) or 'none'} differs from {'+'.join(ref_types)}"]
+    reasons = []
+    counters = {}
+    for (stream_type, ref_params), (_, params) in zip(reference, layout):
+        rel_index = counters.get(stream_type, 0)
+        counters[stream_type] = rel_index + 1
+        for (name, ref_value), (_, value) in zip(ref_params, params):
+            if value != ref_value:
+                reasons.append(f"{stream_type} {rel_index} {name} {value} != {ref_value}")
+    return reasons
+
+
+class ConcatSegment:
+    def __init__(self, path, reasons):
+        self.path = path
+        self.reasons = reasons  # Empty when the segment can be stream-copied
+        self.join_path = path  # File actually joined; a normalized temp file for re-encoded segments
+
+    @property
+    def compatible(self):
+        return not self.reasons
+
+
+class ConcatPlan:
+    """How a list of files will be joined, and why"""
+
+    def __init__(self, input_files, infos, output_file):
+        self.output_file = output_file
+        self.reference = stream_layout(infos.get(input_files[0], {}).get("streams", []))
+        self.segments = []
+        for path in input_files:
+            layout = stream_layout(infos.get(path, {}).get("streams", []))
+            reasons = ["not probed"] if not layout else layout_differences(self.reference, layout)
+            self.segments.append(ConcatSegment(path, reasons))
+        self.work_dir = None
+
+    @property
+    def method(self):
+        return COPY if all(s.compatible for s in self.segments) else REENCODE
+
+    @property
+    def reencoded(self):
+        return [s for s in self.segments if not s.compatible]
+
+    def summary(self):
+        if not self.reference:
+            return "Cannot concatenate: the first file has no probed video or audio streams."
+        if self.method == COPY:
+            return f"Lossless join of {len(self.segments)} file(s) with the concat demuxer: all stream parameters match."
+        lines = [f"Re-encoding {len(self.reencoded)} of {len(self.segments)} file(s) to match "
+                 f"{os.path.basename(self.segments[0].path)}, then joining losslessly:"]
+        for segment in self.reencoded:
+            lines.append(f"  {os.path.basename(segment.path)}: {'; '.join(segment.reasons)}")
+        return "\n".join(lines)
+
+    def normalize_commands(self, progress=False):
+        """(segment, argv) re-encoding each incompatible segment to the reference parameters.
+
+        Normalized files are written to a temporary directory next to the
+        output; call cleanup() once the join has finished.
+        """
+        commands = []
+        for number, segment in enumerate(self.reencoded):
+            segment.join_path = os.path.join(self._work_dir(), f"segment_{number}{os.path.splitext(self.output_file)[1]}")
+            commands.append((segment, self._normalize_command(segment, progress).argv()))
+        return commands
+
+    def concat_command(self, progress=False):
+        list_path = write_concat_list([s.join_path for s in self.segments],
+                                      os.path.join(self._work_dir(), "concat.txt"))
+        return concat_command(list_path, self.output_file, progress).argv()
+
+    def cleanup(self):
+        if self.work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+    def _work_dir(self):
+        if self.work_dir is None:
+            self.work_dir = tempfile.mkdtemp(prefix=".concat_", dir=os.path.dirname(os.path.abspath(self.output_file)))
+        return self.work_dir
+
+    def _normalize_command(self, segment, progress):
+        command = FfmpegCommand(progress=progress)
+        command.add_input(segment.path)
+        maps, codecs, options = reencode_args(self.reference, segment.join_path)
+        command.add_output(segment.join_path, maps, codecs, options=options)
+        return command
+
+
+def reencode_args(reference, output_file, input_index=0, source_indexes=None):
+    """(maps, codecs, options) re-encoding the video/audio streams of an input to a reference layout.
+
+    The output can then be joined with files of that layout by a stream copy.
+    source_indexes gives the input's type-relative index of each reference
+    stream when the layout describes only some of its streams (default: the
+    first streams of each type, in order).
+    """
+    maps, codecs, options = [], {}, []
+    counters = {}
+    for position, (stream_type, params) in enumerate(reference):
+        params = dict(params)
+        rel_index = counters.get(stream_type, 0)
+        counters[stream_type] = rel_index + 1
+        source_index = rel_index if source_indexes is None else source_indexes[position]
+        maps.append(stream_map(input_index, stream_type, source_index))
+        spec = f"{'v' if stream_type == 'video' else 'a'}:{rel_index}"
+        codecs[spec] = ENCODERS.get(params["codec_name"], params["codec_name"])
+        if stream_type == "video":
+            options += [f"-filter:{spec}", f"scale={params['width']}:{params['height']}",
+                        f"-pix_fmt:{spec}", params["pix_fmt"]]
+            if params.get("r_frame_rate") and params["r_frame_rate"] != "0/0":
+                options += [f"-r:{spec}", params["r_frame_rate"]]
+            timescale = _time_base_denominator(params.get("time_base"))
+            if timescale and output_file.lower().endswith((".mp4", ".mov", ".m4v")):
+                options += ["-video_track_timescale", str(timescale)]
+        else:
+            if params.get("sample_rate"):
+                options += [f"-ar:{spec}", str(params["sample_rate"])]
+            if params.get("channels"):
+                options += [f"-ac:{spec}", str(params["channels"])]
+    return maps, codecs, options
+
+
+def _time_base_denominator(time_base):
+    try:
+        return int(str(time_base).split("/")[1])
+    except (IndexError, ValueError):
+        return None
@@ -0,0 +1,196 @@
+"""Disk-space and per-device admission for the job queue.
+
+Every extraction or merge writes its output next to its source, so a batch
+can run a disk full half-way through, and several remuxes reading and
+writing the same spinning disk at once mostly make its heads seek. Given a
+DiskScheduler, a JobQueue only starts a job when
+
+  - the free space on each device the job writes to, minus what the jobs
+    already running there are expected to write, holds the job's estimated
+    output (Job.estimated_bytes), and
+  - fewer jobs than the device's limit are already writing to it (one for
+    a rotational disk by default, no limit for SSDs and anything that
+    cannot be identified).
+
+Only written devices are limited: jobs that merely read the same source,
+such as the chunks of a parallel transcode, run side by side.
+
+A job that waits is skipped for now and later queued jobs may start ahead of
+it. A job that cannot fit even once everything else running on its device
+has finished fails with a DiskSpaceError instead of filling the disk.
+"""
+import logging
+import os
+import shutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Headroom on top of an estimate: bitrates are averages and containers add overhead
+SAFETY_MARGIN = 1.05
+# Space always left free on a device, so the system (and ffmpeg's own temp files) keep working
+MIN_FREE_BYTES = 256 * 1024 * 1024
+# Concurrent jobs per rotational disk unless told otherwise
+ROTATIONAL_LIMIT = 1
+
+
+class DiskSpaceError(OSError):
+    pass
+
+
+class DiskScheduler:
+    """Decides which queued jobs may start, by free space and device concurrency.
+
+    per_device overrides the concurrency limit of every device (None: one
+    job per rotational disk, unlimited otherwise).
+    """
+
+    def __init__(self, per_device=None, margin=SAFETY_MARGIN, min_free=MIN_FREE_BYTES):
+        self.per_device = per_device
+        self.margin = margin
+        self.min_free = min_free
+        self._running = {}  # device -> job ids writing to it
+        self._reserved = {}  # device -> bytes expected to be written by running jobs
+        self._jobs = {}  # job id -> {output device: reserved bytes}
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    def admit(self, job):
+        """True to start the job now (its space is then reserved), False to keep it queued.
+
+        Raises DiskSpaceError if its output cannot fit even once the other
+        jobs on the device are done.
+        """
+        writes = _job_writes(job)
+        with self._lock:
+            for device in writes:
+                limit = self._device_limit(device)
+                if limit is not None and len(self._running.get(device, ())) >= limit:
+                    return False
+            for device, (directory, freed) in writes.items():
+                need = (job.estimated_bytes or 0) * self.margin + self.min_free
+                free = _free_bytes(directory) + freed
+                reserved = self._reserved.get(device, 0)
+                if free - reserved >= need:
+                    continue
+                if not self._running.get(device):
+                    raise DiskSpaceError(f"Not enough space for {job.description}: needs about "
+                                         f"{_gigabytes(need - self.min_free)}, {_gigabytes(free - self.min_free)} "
+                                         f"free on {directory}")
+                return False
+            reservation = {device: job.estimated_bytes or 0 for device in writes}
+            for device, size in reservation.items():
+                self._running.setdefault(device, set()).add(job.id)
+                self._reserved[device] = self._reserved.get(device, 0) + size
+            self._jobs[job.id] = reservation
+            return True
+
+    def release(self, job):
+        """Forget a job that has finished (or never started)"""
+        with self._lock:
+            reservation = self._jobs.pop(job.id, {})
+            for device, size in reservation.items():
+                self._running.get(device, set()).discard(job.id)
+                self._reserved[device] = max(0, self._reserved.get(device, 0) - size)
+
+    def _device_limit(self, device):
+        if self.per_device is not None:
+            return self.per_device
+        if device not in self._limits:
+            self._limits[device] = ROTATIONAL_LIMIT if is_rotational(device) else None
+        return self._limits[device]
+
+
+def estimate_output_bytes(record, indexes=None, duration=None):
+    """Expected size of stream-copying some streams of a probed file (all by default).
+
+    Streams without a bit rate share what is left of the container bit rate
+    once the known ones are taken out. duration defaults to the whole file.
+    """
+    if record is None:
+        return None
+    total_duration = record.duration
+    duration = total_duration if duration is None else duration
+    if not duration:
+        return None
+    file_rate = record.bit_rate or (record.size * 8 / total_duration if record.size and total_duration else 0)
+    known = sum(s.bit_rate for s in record.streams if s.bit_rate)
+    unknown = [s for s in record.streams if not s.bit_rate]
+    leftover = max(0, file_rate - known) / len(unknown) if unknown else 0
+    selected = [s for s in record.streams if indexes is None or s.index in indexes]
+    return int(sum(s.bit_rate or leftover for s in selected) * duration / 8)
+
+
+def file_bytes(*paths):
+    """Total size of existing files (for outputs that copy whole external files)"""
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def device_of(path):
+    """st_dev of a path, or of its nearest existing parent for files not written yet"""
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+
+def is_rotational(device):
+    """True for a spinning disk; False for SSDs and when it cannot be told (non-Linux, network, overlay)"""
+    if device is None or os.major(device) == 0:
+        return False
+    base = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+    # Partitions have no queue/ of their own; it is on the parent disk
+    for path in (f"{base}/queue/rotational", f"{base}/../queue/rotational"):
+        try:
+            with open(path) as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return False
+
+
+def _job_writes(job):
+    """{output device: (existing directory, bytes freed by overwriting)} of a job"""
+    writes = {}
+    staged = set(job.staged.values())
+    # Staged outputs are written on the scratch disk (or beside the output) before they are moved
+    for path in list(job.output_files) + list(job.staged):
+        device = device_of(path)
+        if device is None:
+            continue
+        directory, freed = writes.get(device, (_existing_dir(path), 0))
+        # A staged output replaces the old file only when it is published, so that frees nothing meanwhile
+        if path not in staged and path not in job.staged:
+            freed += file_bytes(path)
+        writes[device] = (directory, freed)
+    return writes
+
+
+def _existing_dir(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    while not os.path.isdir(directory) and os.path.dirname(directory) != directory:
+        directory = os.path.dirname(directory)
+    return directory
+
+
+def _free_bytes(directory):
+    try:
+        return shutil.disk_usage(directory).free
+    except OSError as e:
+        logger.warning(f"Cannot read free space of {directory}: {e}")
+        return float("inf")
+
+
+def _gigabytes(count):
+    return f"{max(0, count) / 1e9:.2f} GB"
@@ -0,0 +1,150 @@
+import os
+
+from disk_scheduler import estimate_output_bytes
+from ffmpeg_utils import FfmpegCommand, TYPE_SPECIFIERS, stream_map
+from jobs import Job
+from media_catalog import MediaCatalog
+from output_policy import OutputPolicy, skip_existing
+
+VIDEO_EXTENSIONS = {"h264": ".mp4", "hevc": ".mkv", "vp9": ".webm", "mpeg4": ".mp4"}
+AUDIO_EXTENSIONS = {"aac": ".aac", "mp3": ".mp3", "ac3": ".ac3", "opus": ".opus", "flac": ".flac", "wav": ".wav"}
+
+
+def output_path_for(input_file, stream):
+    """Build the default output file name for an extracted stream, next to its source file"""
+    base, _ = os.path.splitext(input_file)
+    stream_type = stream.get("codec_type", "")
+    index = stream.get("index", 0)
+    lang = stream.get("tags", {}).get("language", "")
+
+    if stream_type == "video":
+        return f"{base}_video_{index}{VIDEO_EXTENSIONS.get(stream.get('codec_name'), '.mkv')}"
+    if stream_type == "audio":
+        ext = AUDIO_EXTENSIONS.get(stream.get("codec_name"), ".mka")
+        # Use language code in filename if available, otherwise use index
+        return f"{base}_audio_{lang or index}{ext}"
+    if stream_type == "subtitle":
+        return f"{base}_subtitle_{lang or index}.srt"
+    return None
+
+
+class ExtractionTarget:
+    """One stream to be written to one output file"""
+
+    def __init__(self, stream, rel_index, output_file):
+        self.stream = stream
+        self.rel_index = rel_index
+        self.output_file = output_file
+
+    @property
+    def stream_type(self):
+        return self.stream.get("codec_type", "")
+
+    @property
+    def index(self):
+        return self.stream.get("index", 0)
+
+
+class ExtractionPlan:
+    """All streams to extract from a single input file, written by one ffmpeg run"""
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.targets = []
+
+    @property
+    def output_files(self):
+        return [t.output_file for t in self.targets]
+
+    def ffmpeg_command(self, progress=False):
+        """The ffmpeg invocation that demuxes the input once and writes every target"""
+        command = FfmpegCommand(progress=progress)
+        command.add_input(self.input_file)
+        for target in self.targets:
+            # Subtitles are converted to SRT, everything else is stream-copied
+            codecs = {"s": "srt"} if target.stream_type == "subtitle" else None
+            command.add_output(target.output_file, [stream_map(0, target.stream_type, target.rel_index)], codecs)
+        return command
+
+    def command(self, progress=False):
+        return self.ffmpeg_command(progress).argv()
+
+
+def plan_extraction(selections, catalog):
+    """Group selected (input_file, stream) pairs by source file.
+
+    Type-relative indexes come from catalog (a MediaCatalog of the inputs).
+    Returns a list of ExtractionPlan, one per input file, in selection order.
+    Streams selected twice are only extracted once, and outputs that would
+    collide within the same run fall back to index-based names.
+    """
+    plans = {}
+    seen = set()
+    planned_outputs = set()
+
+    for input_file, stream in selections:
+        stream_type = stream.get("codec_type", "")
+        index = stream.get("index", 0)
+        if stream_type not in TYPE_SPECIFIERS or (input_file, index) in seen:
+            continue
+
+        rel_index = catalog.rel_index(input_file, index, stream_type)
+        if rel_index is None:
+            continue
+
+        output_file = output_path_for(input_file, stream)
+        if output_file in planned_outputs:
+            base, ext = os.path.splitext(input_file)[0], os.path.splitext(output_file)[1]
+            output_file = f"{base}_{stream_type}_{index}{ext}"
+
+        plan = plans.get(input_file)
+        if plan is None:
+            plan = plans[input_file] = ExtractionPlan(input_file)
+        plan.targets.append(ExtractionTarget(stream, rel_index, output_file))
+        seen.add((input_file, index))
+        planned_outputs.add(output_file)
+
+    return list(plans.values())
+
+
+def select_streams(streams, types=None, indexes=None):
+    """Streams matching the given codec types and/or global stream indexes (all extractable ones by default)"""
+    selected = []
+    for s in streams:
+        stream_type = s.get("codec_type")
+        if stream_type not in TYPE_SPECIFIERS:
+            continue
+        if indexes is not None and s.get("index") not in indexes:
+            continue
+        if types and stream_type not in types:
+            continue
+        selected.append(s)
+    return selected
+
+
+def extract_jobs(input_files, infos, types=None, indexes=None, overwrite=False, policy=None, report=None):
+    """One ffmpeg job per input file, extracting every selected stream in a single pass.
+
+    Existing outputs are skipped unless overwrite is set, and passed to
+    report (default: the log).
+    """
+    policy = policy or OutputPolicy()
+    catalog = MediaCatalog.from_infos({f: infos.get(f, {}) for f in input_files})
+    selections = [(f, s) for f in input_files for s in select_streams(catalog.streams(f), types, indexes)]
+    jobs = []
+    for plan in plan_extraction(selections, catalog):
+        for target in plan.targets:
+            target.output_file = policy.place(target.output_file, plan.input_file, "extract")
+        plan.targets = [t for t in plan.targets if overwrite or not skip_existing(t.output_file, report)]
+        if not plan.targets:
+            continue
+        indexes_text = ", ".join(str(t.index) for t in plan.targets)
+        jobs.append(policy.stage(Job(
+            plan.command(progress=True),
+            f"Extract stream(s) {indexes_text} from {os.path.basename(plan.input_file)}",
+            input_file=plan.input_file,
+            output_files=plan.output_files,
+            media_duration=catalog.duration(plan.input_file),
+            estimated_bytes=estimate_output_bytes(catalog.get(plan.input_file), {t.index for t in plan.targets}),
+        )))
+    return jobs
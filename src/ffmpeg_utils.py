@@ -1,24 +1,157 @@
-def extract_audio(input_file, output_file):
-    command = f"ffmpeg -i {input_file} -q:a 0 -map a {output_file}"
-    os.system(command)
+"""argv builders for ffmpeg.
 
-def extract_video(input_file, output_file):
-    command = f"ffmpeg -i {input_file} -c:v copy -an {output_file}"
-    os.system(command)
+Every command is built as a list of arguments (never a shell string), so
+paths with spaces or quotes are passed through untouched. Outputs are
+stream-copied unless a codec is asked for explicitly, joins use the concat
+demuxer, and one command can carry several outputs and a -progress pipe.
+"""
+import os
+import subprocess
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Union
+
+from progress import PROGRESS_ARGS
+
+FFMPEG = "ffmpeg"
+
+# ffmpeg stream specifier for each codec_type
+TYPE_SPECIFIERS = {"video": "v", "audio": "a", "subtitle": "s"}
+
+
+@dataclass
+class Input:
+    path: str
+    options: List[str] = field(default_factory=list)  # Input options, placed before -i
+
+
+@dataclass
+class Output:
+    path: str
+    maps: List[str] = field(default_factory=list)
+    # Codec per stream specifier ("" for all streams); stream copy unless told otherwise
+    codecs: Dict[str, str] = field(default_factory=lambda: {"": "copy"})
+    metadata: List[str] = field(default_factory=list)  # Already expanded -metadata[:spec] key=value pairs
+    options: List[str] = field(default_factory=list)  # Any other output options, placed before the path
+
+    def args(self) -> List[str]:
+        args = []
+        for map_spec in self.maps:
+            args += ["-map", map_spec]
+        for spec, codec in self.codecs.items():
+            args += [f"-c:{spec}" if spec else "-c", codec]
+        args += self.metadata
+        args += self.options
+        args.append(self.path)
+        return args
+
+
+class FfmpegCommand:
+    """Builds one ffmpeg invocation with any number of inputs and outputs"""
+
+    def __init__(self, overwrite: bool = True, progress: bool = False, global_options: Sequence[str] = ()):
+        self.overwrite = overwrite
+        self.progress = progress
+        self.global_options = list(global_options)
+        self.inputs: List[Input] = []
+        self.outputs: List[Output] = []
+
+    def add_input(self, path: str, options: Sequence[str] = ()) -> int:
+        """Add an input and return its ffmpeg input index; the same path is only added once"""
+        for index, existing in enumerate(self.inputs):
+            if existing.path == path and existing.options == list(options):
+                return index
+        self.inputs.append(Input(path, list(options)))
+        return len(self.inputs) - 1
+
+    def add_output(self, path: str, maps: Sequence[str] = (), codecs: Optional[Dict[str, str]] = None,
+                   metadata: Sequence[str] = (), options: Sequence[str] = ()) -> Output:
+        output = Output(path, list(maps), dict(codecs) if codecs is not None else {"": "copy"},
+                        list(metadata), list(options))
+        self.outputs.append(output)
+        return output
+
+    @property
+    def output_files(self) -> List[str]:
+        return [o.path for o in self.outputs]
+
+    def argv(self) -> List[str]:
+        cmd = [FFMPEG, "-hide_banner"]
+        cmd.append("-y" if self.overwrite else "-n")
+        if self.progress:
+            cmd += PROGRESS_ARGS
+        cmd += self.global_options
+        for inp in self.inputs:
+            cmd += inp.options + ["-i", inp.path]
+        for output in self.outputs:
+            cmd += output.args()
+        return cmd
+
+
+def stream_map(input_index: int, stream_type: Optional[str] = None, rel_index: Optional[int] = None) -> str:
+    """-map specifier such as "0:a:1"; without a type it selects every stream of the input"""
+    if stream_type is None:
+        return str(input_index)
+    spec = f"{input_index}:{TYPE_SPECIFIERS[stream_type]}"
+    return spec if rel_index is None else f"{spec}:{rel_index}"
+
+
+def concat_list_entry(path: str) -> str:
+    """A line of a concat demuxer list file, with the path quoted for the demuxer"""
+    return "file '" + os.path.abspath(path).replace("'", "'\\''") + "'"
+
+
+def write_concat_list(input_files: Sequence[str], list_path: Optional[str] = None) -> str:
+    """Write a concat demuxer list file and return its path (a temp file unless one is given)"""
+    if list_path is None:
+        fd, list_path = tempfile.mkstemp(prefix="concat_", suffix=".txt")
+        os.close(fd)
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in input_files:
+            f.write(concat_list_entry(path) + "\n")
+    return list_path
+
+
+def concat_command(list_path: str, output_file: str, progress: bool = False,
+                   codecs: Optional[Dict[str, str]] = None) -> FfmpegCommand:
+    """Join the files of a concat list with the concat demuxer (stream copy by default)"""
+    command = FfmpegCommand(progress=progress)
+    command.add_input(list_path, ["-f", "concat", "-safe", "0"])
+    command.add_output(output_file, ["0"], codecs)
+    return command
+
+
+def run(command: Union[FfmpegCommand, Sequence[str]], **kwargs) -> subprocess.CompletedProcess:
+    """Run a command without a shell and capture its output"""
+    argv = command.argv() if isinstance(command, FfmpegCommand) else list(command)
+    return subprocess.run(argv, capture_output=True, text=True, **kwargs)
+
+
+def extract_audio(input_file, output_file, rel_index=0):
+    command = FfmpegCommand()
+    command.add_input(input_file)
+    command.add_output(output_file, [stream_map(0, "audio", rel_index)])
+    return run(command)
+
+
+def extract_video(input_file, output_file, rel_index=0):
+    command = FfmpegCommand()
+    command.add_input(input_file)
+    command.add_output(output_file, [stream_map(0, "video", rel_index)])
+    return run(command)
+
+
+def extract_subtitles(input_file, output_file, rel_index=0):
+    command = FfmpegCommand()
+    command.add_input(input_file)
+    command.add_output(output_file, [stream_map(0, "subtitle", rel_index)], {"s": "srt"})
+    return run(command)
 
-def extract_subtitles(input_file, output_file):
-    command = f"ffmpeg -i {input_file} -map 0:s:0 {output_file}"
-    os.system(command)
 
 def merge_files(input_files, output_file):
-    input_str = ' '.join([f"-i {file}" for file in input_files])
-    filter_str = f"[0:v:0]"
-    for i in range(1, len(input_files)):
-        filter_str += f"[{i}:v:0]"
-    filter_str += f"concat=n={len(input_files)}:v=1:a=0[outv];[0:a:0]"
-    for i in range(1, len(input_files)):
-        filter_str += f"[{i}:a:0]"
-    filter_str += f"concat=n={len(input_files)}:v=0:a=1[outa]"
-    
-    command = f"ffmpeg {input_str} -filter_complex \"{filter_str}\" -map \"[outv]\" -map \"[outa]\" {output_file}"
-    os.system(command)
\ No newline at end of file
+    """Join files end to end losslessly with the concat demuxer"""
+    list_path = write_concat_list(input_files)
+    try:
+        return run(concat_command(list_path, output_file))
+    finally:
+        os.remove(list_path)
@@ -1,3 +1,5 @@
+import os
+
 def validate_file_type(file_path):
     valid_extensions = ['.mp4', '.mkv', '.avi', '.mov', '.mp3', '.wav', '.flac', '.srt', '.ass']
     return any(file_path.endswith(ext) for ext in valid_extensions)
@@ -18,6 +20,18 @@ def organize_files(file_paths):
     
     return video_files, audio_files, subtitle_files
 
+def expand_media_paths(paths):
+    """Expand directories into the media files they contain (recursively, sorted); files pass through"""
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                expanded += [os.path.join(root, f) for f in sorted(files) if validate_file_type(f.lower())]
+        elif os.path.isfile(path):
+            expanded.append(path)
+    return expanded
+
 def handle_drag_and_drop(event):
     file_paths = [url.toLocalFile() for url in event.mimeData().urls()]
     return organize_files(file_paths)
\ No newline at end of file
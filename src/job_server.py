@@ -0,0 +1,496 @@
+"""Dispatching jobs to worker processes, on this machine or others sharing its storage.
+
+A JobServer can stand in for a JobQueue (same submit/cancel/listener
+interface), but it does not run anything itself. Workers (`video-manipulator
+worker --server URL`, any number of them, each with a few slots) lease jobs
+from it over HTTP/JSON:
+
+  POST /lease      {"worker"}                          -> {"job": spec, "lease_timeout"}, or 204
+  POST /heartbeat  {"worker", "job", "progress"}       -> {"cancel": bool}
+  POST /result     {"worker", "job", "state", ...}     -> {"accepted": bool}
+  GET  /status                                         -> {"jobs": [...], "workers": [...]}
+
+A worker sends a heartbeat for each running job every few seconds. If a
+lease goes lease_timeout seconds without one, the worker is considered lost
+and the job is queued again (up to max_lost times), and the lost worker's
+late heartbeats and results are ignored. Workers run their jobs on a local
+JobQueue, so staging, disk scheduling and the result cache all apply on the
+machine that does the work. Inputs and outputs must therefore be visible
+under the same paths everywhere. With a token, every request must carry it
+as a bearer token.
+"""
+import hmac
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from disk_scheduler import DiskScheduler
+from ffmpeg_utils import FFMPEG
+from jobs import Job, JobQueue, QUEUED, RUNNING, CANCELLED, FAILED, FINISHED_STATES
+from output_policy import OutputPolicy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8790
+DEFAULT_MAX_LEASES = 64
+HEARTBEAT_INTERVAL = 2.0
+LEASE_TIMEOUT = 15.0
+MAX_LOST = 2  # Times a job is handed out again after its worker was lost
+POLL_INTERVAL = 1.0
+REQUEST_TIMEOUT = 10.0
+REPORT_ATTEMPTS = 5
+STDERR_LIMIT = 64 * 1024  # Tail of a job's stderr sent back with its result
+TOKEN_ENV = "VIDEO_MANIPULATOR_TOKEN"
+LISTEN_ENV = "VIDEO_MANIPULATOR_LISTEN"  # Makes the GUI dispatch its jobs through a job server
+# Workers only run these programs, whatever a server asks for
+ALLOWED_PROGRAMS = (FFMPEG, "ffprobe")
+
+_PROGRESS_FIELDS = ("out_time", "speed", "bitrate", "total_size", "ended")
+
+
+class RemoteJobError(Exception):
+    """Why a job failed on a worker (or why its worker is gone)"""
+
+
+def parse_address(value, default_host="127.0.0.1"):
+    """(host, port) from "host:port" or "port" """
+    host, sep, port = value.rpartition(":")
+    try:
+        return (host or default_host) if sep else default_host, int(port)
+    except ValueError:
+        raise ValueError(f"Invalid address {value!r}: expected [HOST:]PORT") from None
+
+
+def job_spec(job):
+    """What a worker needs to run a job, as JSON; staged outputs are staged again by the worker itself"""
+    final = dict(job.staged)
+    return {
+        "id": job.id,
+        "command": [final.get(arg, arg) for arg in job.command],
+        "description": job.description,
+        "input_file": job.input_file,
+        "output_files": job.output_files,
+        "media_duration": job.media_duration,
+        "estimated_bytes": job.estimated_bytes,
+        "stage": bool(job.staged),
+    }
+
+
+def job_from_spec(spec, policy=None):
+    """The local Job of a leased spec; raises ValueError for anything but an ffmpeg/ffprobe command"""
+    command = spec.get("command") or []
+    if not command or command[0] not in ALLOWED_PROGRAMS:
+        raise ValueError(f"Refusing to run {command[:1]}: only {', '.join(ALLOWED_PROGRAMS)} jobs are accepted")
+    job = Job(command, spec.get("description", ""), spec.get("input_file"), spec.get("output_files"),
+              spec.get("media_duration"), spec.get("estimated_bytes"))
+    if spec.get("stage"):
+        (policy or OutputPolicy()).stage(job)
+    return job
+
+
+class JobServer:
+    """Queue of jobs handed out to remote workers, with a JobQueue's interface.
+
+    max_workers caps how many jobs are leased out at once, across all
+    workers. Listeners are called from the HTTP server's threads.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, token=None, max_workers=DEFAULT_MAX_LEASES,
+                 lease_timeout=LEASE_TIMEOUT, max_lost=MAX_LOST):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.lease_timeout = lease_timeout
+        self.max_lost = max_lost
+        self._max_workers = max(1, int(max_workers))
+        self._pending = deque()
+        self._leases = {}  # job id -> [job, worker name, deadline]
+        self._lost = {}  # job id -> times its worker was lost
+        self._workers = {}  # worker name -> monotonic time last heard from
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._stopped = threading.Event()
+        self._httpd = None
+
+    @property
+    def url(self):
+        host = socket.gethostname() if self.host in ("", "0.0.0.0", "::") else self.host
+        return f"http://{host}:{self.port}"
+
+    def start(self):
+        """Start serving on a background thread; returns self"""
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _handler(self))
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]  # The one picked for port 0
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        threading.Thread(target=self._reap, daemon=True).start()
+        logger.info(f"Job server listening on {self.url}")
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    def set_max_workers(self, max_workers):
+        with self._lock:
+            self._max_workers = max(1, int(max_workers))
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def submit(self, job):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("JobServer has been shut down")
+            self._pending.append(job)
+        self._notify(job)
+        return job
+
+    def cancel(self, job):
+        """Cancel a queued job; a leased one is cancelled by its worker at its next heartbeat"""
+        with self._lock:
+            job._cancel_requested = True
+            if job in self._pending:
+                self._pending.remove(job)
+                job.state = CANCELLED
+                self._idle.notify_all()
+        if job.state == CANCELLED:
+            self._notify(job)
+
+    def cancel_all(self):
+        for job in self.jobs():
+            self.cancel(job)
+
+    def jobs(self):
+        with self._lock:
+            return [lease[0] for lease in self._leases.values()] + list(self._pending)
+
+    def wait(self, timeout=None):
+        """Block until no job is queued or leased out; returns False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and not self._leases, timeout)
+
+    def shutdown(self, cancel=False, wait=True):
+        with self._lock:
+            self._closed = True
+        if cancel:
+            self.cancel_all()
+        if wait:
+            self.wait()
+        self.stop()
+
+    def workers(self):
+        """Names of the workers heard from within the lease timeout"""
+        now = time.monotonic()
+        with self._lock:
+            return sorted(name for name, seen in self._workers.items() if now - seen < self.lease_timeout)
+
+    def handle(self, method, path, request):
+        """(HTTP status, JSON reply or None) for one request"""
+        if method == "GET" and path == "/status":
+            return 200, self._status()
+        if method != "POST" or not isinstance(request, dict) or not request.get("worker"):
+            return 400, {"error": "expected a JSON object with a worker name"}
+        worker = str(request["worker"])
+        with self._lock:
+            self._workers[worker] = time.monotonic()
+        if path == "/lease":
+            return self._lease(worker)
+        if path == "/heartbeat":
+            return 200, self._heartbeat(worker, request)
+        if path == "/result":
+            return 200, self._result(worker, request)
+        return 404, {"error": f"unknown endpoint {path}"}
+
+    def _lease(self, worker):
+        with self._lock:
+            if not self._pending or len(self._leases) >= self._max_workers:
+                return 204, None
+            job = self._pending.popleft()
+            job.state = RUNNING
+            job.started_at = job.started_at or time.monotonic()
+            self._leases[job.id] = [job, worker, time.monotonic() + self.lease_timeout]
+        logger.info(f"Leased job {job.id} ({job.description}) to {worker}")
+        self._notify(job)
+        return 200, {"job": job_spec(job), "lease_timeout": self.lease_timeout}
+
+    def _heartbeat(self, worker, request):
+        with self._lock:
+            lease = self._leases.get(request.get("job"))
+            if lease is None or lease[1] != worker:
+                return {"cancel": True}  # Handed to another worker meanwhile (or unknown): stop working on it
+            job = lease[0]
+            lease[2] = time.monotonic() + self.lease_timeout
+            progress = request.get("progress")
+            if job.progress is not None and isinstance(progress, dict):
+                for name in _PROGRESS_FIELDS:
+                    if name in progress:
+                        setattr(job.progress, name, progress[name])
+            cancel = job._cancel_requested
+        if progress:
+            self._notify(job)
+        return {"cancel": cancel}
+
+    def _result(self, worker, request):
+        state = request.get("state")
+        job_id = request.get("job")
+        with self._lock:
+            lease = self._leases.get(job_id)
+            if lease is None or lease[1] != worker or state not in FINISHED_STATES:
+                return {"accepted": False}
+            job = self._leases.pop(job_id)[0]
+            self._lost.pop(job_id, None)
+            job.state = state
+            job.returncode = request.get("returncode")
+            job.stderr = request.get("stderr") or ""
+            job.error = RemoteJobError(request["error"]) if request.get("error") else None
+            job.cached = bool(request.get("cached"))
+            job.finished_at = time.monotonic()
+            if job.progress is not None and state != FAILED:
+                job.progress.ended = True
+            self._idle.notify_all()
+        log = logger.error if state == FAILED else logger.info
+        log(f"Job {state} on {worker}: {job.description}")
+        self._notify(job)
+        return {"accepted": True}
+
+    def _reap(self):
+        """Queue the jobs of workers that stopped sending heartbeats again (or fail them)"""
+        while not self._stopped.wait(HEARTBEAT_INTERVAL):
+            now = time.monotonic()
+            changed = []
+            with self._lock:
+                for job_id, (job, worker, deadline) in list(self._leases.items()):
+                    if deadline > now:
+                        continue
+                    del self._leases[job_id]
+                    lost = self._lost[job_id] = self._lost.get(job_id, 0) + 1
+                    if job._cancel_requested:
+                        job.state = CANCELLED
+                    elif lost > self.max_lost:
+                        job.state = FAILED
+                        job.error = RemoteJobError(f"Worker {worker} was lost (no heartbeat for "
+                                                   f"{self.lease_timeout:g} s), {lost} times in a row")
+                        job.finished_at = now
+                    else:
+                        job.state = QUEUED
+                        self._pending.appendleft(job)
+                    logger.warning(f"Worker {worker} lost while running job {job_id} ({job.description}): {job.state}")
+                    changed.append(job)
+                if changed:
+                    self._idle.notify_all()
+            for job in changed:
+                self._notify(job)
+
+    def _status(self):
+        with self._lock:
+            jobs = [lease[0] for lease in self._leases.values()] + list(self._pending)
+            leased = {job_id: lease[1] for job_id, lease in self._leases.items()}
+        return {
+            "jobs": [{"id": job.id, "description": job.description, "state": job.state,
+                      "worker": leased.get(job.id)} for job in jobs],
+            "workers": self.workers(),
+        }
+
+    def _notify(self, job):
+        for callback in list(self._listeners):
+            callback(job)
+
+
+class Worker:
+    """Leases jobs from a JobServer and runs up to `slots` of them at once on a local JobQueue"""
+
+    def __init__(self, server_url, slots=1, name=None, token=None, policy=None, result_cache=None,
+                 poll_interval=POLL_INTERVAL):
+        self.server_url = server_url.rstrip("/")
+        self.slots = max(1, int(slots))
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.token = token
+        self.policy = policy or OutputPolicy()
+        self.poll_interval = poll_interval
+        self.queue = JobQueue(self.slots, scheduler=DiskScheduler(), result_cache=result_cache)
+        self.queue.add_listener(self._on_job_changed)
+        self._active = {}  # local job id -> [remote job id, local job, lease timeout, last acknowledged heartbeat]
+        self._lock = threading.Lock()
+
+    def run(self, stop=None):
+        """Work until stop (a threading.Event) is set; running jobs are then cancelled"""
+        stop = stop or threading.Event()
+        next_heartbeat = 0.0
+        logger.info(f"Worker {self.name} serving {self.server_url} with {self.slots} slot(s)")
+        try:
+            while not stop.is_set():
+                if time.monotonic() >= next_heartbeat:
+                    self._heartbeat()
+                    next_heartbeat = time.monotonic() + HEARTBEAT_INTERVAL
+                with self._lock:
+                    free = len(self._active) < self.slots
+                if free and self._lease():
+                    continue  # Fill the remaining slots straight away
+                stop.wait(self.poll_interval)
+        finally:
+            self.queue.shutdown(cancel=True)
+
+    def _lease(self):
+        try:
+            status, reply = self._post("/lease", {})
+        except OSError as e:
+            logger.warning(f"Cannot reach job server {self.server_url}: {e}")
+            return False
+        if status != 200 or not reply:
+            return False
+        spec = reply["job"]
+        try:
+            job = job_from_spec(spec, self.policy)
+        except (OSError, ValueError) as e:
+            logger.error(f"Rejecting job {spec.get('id')}: {e}")
+            self._report(spec.get("id"), {"state": FAILED, "error": str(e)})
+            return True
+        with self._lock:
+            self._active[job.id] = [spec["id"], job, reply.get("lease_timeout", LEASE_TIMEOUT), time.monotonic()]
+        self.queue.submit(job)
+        return True
+
+    def _heartbeat(self):
+        with self._lock:
+            active = list(self._active.values())
+        for entry in active:
+            remote_id, job, lease_timeout, acknowledged = entry
+            progress = None
+            if job.progress is not None:
+                progress = {name: getattr(job.progress, name) for name in _PROGRESS_FIELDS}
+            try:
+                status, reply = self._post("/heartbeat", {"job": remote_id, "progress": progress})
+            except OSError as e:
+                if time.monotonic() - acknowledged > lease_timeout:
+                    # The server has given the job to someone else by now
+                    logger.warning(f"Abandoning job {remote_id}: job server unreachable ({e})")
+                    self.queue.cancel(job)
+                continue
+            entry[3] = time.monotonic()
+            if status == 200 and reply and reply.get("cancel"):
+                self.queue.cancel(job)
+
+    def _on_job_changed(self, job):
+        if not job.finished:
+            return
+        with self._lock:
+            entry = self._active.pop(job.id, None)
+        if entry is None:
+            return
+        self._report(entry[0], {
+            "state": job.state,
+            "returncode": job.returncode,
+            "stderr": job.stderr[-STDERR_LIMIT:],
+            "error": str(job.error) if job.error else None,
+            "cached": job.cached,
+        })
+
+    def _report(self, remote_id, result):
+        for attempt in range(REPORT_ATTEMPTS):
+            try:
+                self._post("/result", dict(result, job=remote_id))
+                return
+            except OSError as e:
+                logger.warning(f"Cannot report job {remote_id} (attempt {attempt + 1}): {e}")
+                time.sleep(min(HEARTBEAT_INTERVAL * 2 ** attempt, LEASE_TIMEOUT))
+        logger.error(f"Giving up reporting job {remote_id}; the server will hand it out again")
+
+    def _post(self, path, payload):
+        """(HTTP status, JSON reply or None); raises OSError if the server cannot be reached"""
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        body = json.dumps(dict(payload, worker=self.name)).encode()
+        request = urllib.request.Request(self.server_url + path, body, headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                data = response.read()
+                return response.status, json.loads(data) if data else None
+        except urllib.error.HTTPError as e:
+            raise OSError(f"HTTP {e.code} from {self.server_url}{path}") from e
+
+
+def spawn_local_workers(server_url, count, slots=1, token=None, extra_args=()):
+    """Start count worker processes on this machine; returns their Popen objects"""
+    if getattr(sys, "frozen", False):
+        program = [sys.executable]  # The bundled executable dispatches subcommands itself
+    else:
+        program = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")]
+    env = dict(os.environ)
+    if token:
+        env[TOKEN_ENV] = token  # Not on the command line, where other users could read it
+    return [subprocess.Popen(program + ["worker", "--server", server_url, "--jobs", str(slots), *extra_args],
+                             env=env, stdin=subprocess.DEVNULL)
+            for _ in range(count)]
+
+
+def stop_local_workers(processes, timeout=10.0):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self._reply(*self._dispatch("GET", None))
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"null")
+            except ValueError:
+                self._reply(400, {"error": "invalid JSON"})
+                return
+            self._reply(*self._dispatch("POST", request))
+
+        def _dispatch(self, method, request):
+            authorization = self.headers.get("Authorization") or ""
+            if server.token and not hmac.compare_digest(authorization, f"Bearer {server.token}"):
+                return 401, {"error": "missing or wrong token"}
+            try:
+                return server.handle(method, self.path, request)
+            except Exception:
+                logger.exception(f"Job server error handling {method} {self.path}")
+                return 500, {"error": "internal error"}
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload).encode() if payload is not None else b""
+            self.send_response(status)
+            if data:
+                self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} {format % args}")
+
+    return Handler
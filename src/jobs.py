@@ -0,0 +1,345 @@
+import itertools
+import logging
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import deque
+
+from output_policy import discard_staged, publish_staged
+from progress import FfmpegProgress
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+_job_ids = itertools.count(1)
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """A single external command (ffmpeg/ffprobe) scheduled on a JobQueue"""
+
+    def __init__(self, command, description="", input_file=None, output_files=None, media_duration=None,
+                 estimated_bytes=None, attempt=1):
+        self.id = next(_job_ids)
+        self.command = list(command)
+        self.description = description or " ".join(self.command[:1])
+        self.input_file = input_file
+        self.output_files = list(output_files or [])
+        self.media_duration = media_duration
+        self.estimated_bytes = estimated_bytes  # Expected size of the outputs, for disk-space checks
+        self.staged = {}  # Staging file -> output file, published on success (see output_policy)
+        self.attempt = attempt  # 1 for the first run, 2 for the first retry, ...
+        self.state = QUEUED
+        self.cached = False  # Done without running: an identical earlier run's outputs are still there
+        self.returncode = None
+        self.stdout = ""
+        self.stderr = ""
+        self.error = None
+        # Live progress for ffmpeg commands run with -progress (see progress.PROGRESS_ARGS)
+        self.progress = FfmpegProgress(media_duration) if "-progress" in self.command else None
+        self.started_at = None
+        self.finished_at = None
+        self._process = None
+        self._cancel_requested = False
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def duration(self):
+        """Seconds the job has been running, or ran for if finished"""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def retry(self):
+        """A fresh job running the same command again (a Job only runs once)"""
+        job = Job(self.command, self.description, self.input_file, self.output_files, self.media_duration,
+                  self.estimated_bytes, self.attempt + 1)
+        job.staged = dict(self.staged)
+        return job
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.state} {self.description!r}>"
+
+
+class JobQueue:
+    """Runs jobs on background threads with a configurable concurrency limit.
+
+    Listeners are called with the job every time its state changes. They run
+    on the worker thread, so GUI code must marshal the call back to the main
+    thread (see ui.job_bridge).
+
+    With a scheduler (see disk_scheduler.DiskScheduler), a queued job only
+    starts once the scheduler admits it; jobs it holds back are passed over
+    for later ones, and jobs it refuses fail without running.
+
+    With a result cache (see result_cache.ResultCache), a job identical to
+    one that finished before is marked done without running ffmpeg as long
+    as that run's outputs are unchanged, and successful jobs are recorded.
+    """
+
+    def __init__(self, max_workers=2, scheduler=None, result_cache=None):
+        self._max_workers = max(1, int(max_workers))
+        self._scheduler = scheduler
+        self._result_cache = result_cache
+        self._pending = deque()
+        self._running = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._dispatching = threading.Lock()
+        self._closed = False
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    def set_max_workers(self, max_workers):
+        """Change the concurrency limit; queued jobs start immediately if there is room"""
+        with self._lock:
+            self._max_workers = max(1, int(max_workers))
+        self._dispatch()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def submit(self, job):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("JobQueue has been shut down")
+            self._pending.append(job)
+        self._notify(job)
+        self._dispatch()
+        return job
+
+    def cancel(self, job):
+        """Cancel a queued job, or terminate the process of a running one"""
+        with self._lock:
+            job._cancel_requested = True
+            if job in self._pending:
+                self._pending.remove(job)
+                job.state = CANCELLED
+            elif job._process is not None and job._process.poll() is None:
+                job._process.terminate()
+        if job.state == CANCELLED:
+            self._notify(job)
+            with self._lock:
+                self._idle.notify_all()
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = list(self._pending) + list(self._running.values())
+        for job in jobs:
+            self.cancel(job)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._running.values()) + list(self._pending)
+
+    def wait(self, timeout=None):
+        """Block until no job is queued or running; returns False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def shutdown(self, cancel=False, wait=True):
+        with self._lock:
+            self._closed = True
+        if cancel:
+            self.cancel_all()
+        if wait:
+            self.wait()
+
+    def _dispatch(self):
+        started = []
+        refused = []
+        # Admission stats and statvfs()s output directories, so it runs outside the queue lock; dispatchers
+        # take turns, so a job is never admitted twice and the room computed up front cannot shrink
+        with self._dispatching:
+            with self._lock:
+                room = self._max_workers - len(self._running)
+                candidates = list(self._pending) if room > 0 else []
+            for job in candidates:
+                if len(started) >= room:
+                    break
+                error = None
+                if self._scheduler is not None:
+                    try:
+                        if not self._scheduler.admit(job):
+                            continue
+                    except OSError as e:
+                        error = e
+                with self._lock:
+                    if job not in self._pending:
+                        # Cancelled while it was being admitted
+                        if error is None and self._scheduler is not None:
+                            self._scheduler.release(job)
+                        continue
+                    self._pending.remove(job)
+                    if error is not None:
+                        job.error = error
+                        job.state = FAILED
+                        refused.append(job)
+                        continue
+                    job.state = RUNNING
+                    job.started_at = time.monotonic()
+                    self._running[job.id] = job
+                    started.append(job)
+        for job in refused:
+            _log_finished(job)
+            self._notify(job)
+        if refused:
+            with self._lock:
+                self._idle.notify_all()
+        for job in started:
+            self._notify(job)
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job):
+        try:
+            with self._lock:
+                if job._cancel_requested:
+                    raise _Cancelled()
+            if self._reuse_result(job):
+                raise _Cached()
+            with self._lock:
+                # Checked again in the same critical section as the start: cancel() takes this lock, so it
+                # either sees the process and terminates it or has set the flag before it is started
+                if job._cancel_requested:
+                    raise _Cancelled()
+                job._process = subprocess.Popen(
+                    job.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    stdin=subprocess.DEVNULL, text=True
+                )
+            if job.progress is not None:
+                job.stdout, job.stderr = self._read_progress(job)
+            else:
+                job.stdout, job.stderr = job._process.communicate()
+            job.returncode = job._process.returncode
+            if job._cancel_requested:
+                job.state = CANCELLED
+            else:
+                job.state = DONE if job.returncode == 0 else FAILED
+        except _Cancelled:
+            job.state = CANCELLED
+        except _Cached:
+            job.cached = True
+            job.state = DONE
+        except Exception as e:
+            job.error = e
+            job.state = FAILED
+        finally:
+            job._process = None
+            if job.staged:
+                if job.cached:
+                    discard_staged(job)
+                else:
+                    _finish_staged(job)
+            if job.state == DONE and not job.cached:
+                self._record_result(job)
+            job.finished_at = time.monotonic()
+            if self._scheduler is not None:
+                self._scheduler.release(job)
+            with self._lock:
+                self._running.pop(job.id, None)
+            _log_finished(job)
+            self._notify(job)
+            with self._lock:
+                self._idle.notify_all()
+            self._dispatch()
+
+    def _reuse_result(self, job):
+        """True if the result cache has the job's outputs from an identical earlier run"""
+        if self._result_cache is None:
+            return False
+        try:
+            return self._result_cache.lookup(job)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Result cache lookup failed for {job.description}: {e}")
+            return False
+
+    def _record_result(self, job):
+        if self._result_cache is None:
+            return
+        try:
+            self._result_cache.store(job)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Cannot record the result of {job.description}: {e}")
+
+    def _read_progress(self, job):
+        """Stream -progress blocks from stdout, notifying listeners after each one"""
+        process = job._process
+        stderr_chunks = []
+        # Drain stderr on its own thread so a chatty ffmpeg cannot block on a full pipe
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        stderr_reader.start()
+        for line in process.stdout:
+            if job.progress.feed(line):
+                self._notify(job)
+        process.wait()
+        stderr_reader.join()
+        return "", "".join(stderr_chunks)
+
+    def _notify(self, job):
+        for callback in list(self._listeners):
+            callback(job)
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _Cached(Exception):
+    pass
+
+
+def _finish_staged(job):
+    """Publish a successful job's staged outputs, or remove them if it did not succeed"""
+    if job.state == DONE:
+        try:
+            publish_staged(job)
+        except OSError as e:
+            job.error = e
+            job.state = FAILED
+    if job.state != DONE:
+        discard_staged(job)
+
+
+def _log_finished(job):
+    """Structured record of a finished job (formatted as JSON by log_setup)"""
+    written = 0
+    for path in job.output_files:
+        try:
+            written += os.path.getsize(path)
+        except OSError:
+            pass
+    fields = {
+        "job": {
+            "id": job.id,
+            "description": job.description,
+            "state": job.state,
+            "command": job.command,
+            "duration": round(job.duration, 3) if job.duration is not None else None,
+            "exit_code": job.returncode,
+            "bytes": written,
+            "cached": job.cached,
+        }
+    }
+    if job.state == FAILED:
+        fields["job"]["stderr"] = (str(job.error) if job.error else job.stderr)[-4000:]
+        logger.error(f"Job failed: {job.description}", extra={"fields": fields})
+    else:
+        logger.info(f"Job {job.state}: {job.description}", extra={"fields": fields})
@@ -0,0 +1,79 @@
+import os
+
+# ISO 639-1 codes (and common ISO 639-2/B variants) mapped to the ISO 639-2 codes Matroska expects
+ISO_639_2 = {
+    "ar": "ara", "cs": "ces", "cze": "ces", "da": "dan", "de": "deu", "ger": "deu", "el": "ell", "gre": "ell",
+    "en": "eng", "es": "spa", "fi": "fin", "fr": "fra", "fre": "fra", "he": "heb", "hi": "hin", "hu": "hun",
+    "it": "ita", "ja": "jpn", "ko": "kor", "nl": "nld", "dut": "nld", "no": "nor", "pl": "pol", "pt": "por",
+    "ro": "ron", "rum": "ron", "ru": "rus", "sv": "swe", "th": "tha", "tr": "tur", "uk": "ukr", "vi": "vie",
+    "zh": "zho", "chi": "zho",
+}
+
+KNOWN_CODES = set(ISO_639_2) | set(ISO_639_2.values())
+# Codes that are also common title words ("Dr.No.mkv"), so only their ISO 639-2 form tags a file name
+FILENAME_CODES = KNOWN_CODES - {"no"}
+
+
+def normalize_language(code):
+    """Normalize a language code to ISO 639-2 (e.g. "it" -> "ita"); unknown codes are lower-cased"""
+    if not code:
+        return None
+    code = code.strip().lower()
+    return ISO_639_2.get(code, code)
+
+
+def language_from_filename(path):
+    """Language suffix of a file name like "Show.S01E01.it.srt" (normalized), or None"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    # Allow a trailing qualifier such as "Show.S01E01.it.forced.srt"
+    for part in reversed(stem.split(".")[1:][-2:]):
+        part = part.lower().replace("_", "-").split("-")[0]
+        if part in FILENAME_CODES:
+            return normalize_language(part)
+    return None
+
+
+# Very common short words per language; a few hundred words of text are enough to tell these apart
+STOPWORDS = {
+    "eng": "the and you that is to of it what this in have not for be are was me we he on with your",
+    "ita": "che non di il la è un per mi sono una ti lo ma ho con cosa se si questo come gli della",
+    "fra": "le la les de et est je vous pas que un une il ne ce qui en dans pour sur avec nous mais",
+    "deu": "der die das und ist ich nicht sie du es ein zu mit den wir auch was auf ja mir aber",
+    "spa": "el la que de y no es en lo un por los se con una qué me para las está pero eso",
+    "por": "o a que de não é um eu se para você com uma os do da mas isso está em",
+    "nld": "de het een en is ik niet je dat van wat zijn we met op voor hij maar",
+}
+STOPWORD_SETS = {language: frozenset(words.split()) for language, words in STOPWORDS.items()}
+
+# Scripts that identify a language on their own: (first code point, last code point, language)
+SCRIPT_RANGES = [
+    (0x3040, 0x30FF, "jpn"),  # Hiragana and katakana
+    (0xAC00, 0xD7AF, "kor"),  # Hangul syllables
+    (0x0400, 0x04FF, "rus"),  # Cyrillic
+    (0x0600, 0x06FF, "ara"),
+    (0x0590, 0x05FF, "heb"),
+    (0x0370, 0x03FF, "ell"),
+    (0x0E00, 0x0E7F, "tha"),
+    (0x4E00, 0x9FFF, "zho"),  # CJK ideographs, after kana so Japanese text is not taken for Chinese
+]
+
+
+def language_from_text(text, min_hits=5):
+    """Best guess at the language of a text sample (ISO 639-2), or None if it is not clear.
+
+    Non-Latin scripts are recognised by their characters, Latin-script
+    languages by counting common words.
+    """
+    letters = [c for c in text if c.isalpha()]
+    if not letters:
+        return None
+    for first, last, language in SCRIPT_RANGES:
+        if sum(1 for c in letters if first <= ord(c) <= last) > len(letters) * 0.1:
+            return language
+    words = [w.strip(".,!?;:\"'()-").lower() for w in text.split()]
+    scores = sorted(((sum(1 for w in words if w in stopwords), language)
+                     for language, stopwords in STOPWORD_SETS.items()), reverse=True)
+    (best, language), (second, _) = scores[0], scores[1]
+    if best < min_hits or best < 1.5 * second:
+        return None
+    return language
@@ -0,0 +1,93 @@
+"""Central, non-blocking logging.
+
+All records go through a QueueHandler, and a single QueueListener thread
+writes them to one rotating log file, so GUI and worker threads never wait
+on (possibly remote) disk writes. Records are JSON lines; job records (see
+jobs.JobQueue) carry the command, duration, exit code and bytes written.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+from app_dirs import user_log_dir
+
+LOG_FILE_NAME = "video-manipulator.log"
+LOG_DIR_ENV = "VIDEO_MANIPULATOR_LOG_DIR"
+DEBUG_ENV = "VIDEO_MANIPULATOR_DEBUG"
+
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 3
+
+_listener = None
+_log_path = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; a record's "fields" extra is merged into it"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(log_dir=None, debug=None, console=False):
+    """Install the queue-backed handlers on the root logger; returns the log file path.
+
+    log_dir defaults to $VIDEO_MANIPULATOR_LOG_DIR or the per-user log
+    directory; debug (default: $VIDEO_MANIPULATOR_DEBUG) lowers the level to
+    DEBUG and echoes every record to the console. With console=True warnings
+    and errors are echoed even without debug.
+    """
+    global _listener, _log_path
+    if _listener is not None:
+        return _log_path
+    if debug is None:
+        debug = os.environ.get(DEBUG_ENV, "") not in ("", "0")
+
+    log_dir = log_dir or os.environ.get(LOG_DIR_ENV) or user_log_dir()
+    os.makedirs(log_dir, exist_ok=True)
+    _log_path = os.path.join(log_dir, LOG_FILE_NAME)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        _log_path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8", delay=True
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if debug or console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.DEBUG if debug else logging.WARNING)
+        console_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+        handlers.append(console_handler)
+
+    record_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(record_queue))
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+
+    _listener = logging.handlers.QueueListener(record_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _log_path
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_path():
+    return _log_path
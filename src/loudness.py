@@ -0,0 +1,174 @@
+"""EBU R128 loudness measurement and normalization of audio streams.
+
+Normalizing takes two passes: a measurement of the integrated loudness,
+true peak and loudness range, then the correction. The measurement of every
+selected audio stream of a file is done by one ffmpeg run, with a loudnorm
+analysis filter per stream fed from a single demux of the input:
+
+    input -> [0:a:0] loudnorm ─┐
+          -> [0:a:1] loudnorm ─┼─> null
+          -> [0:a:3] loudnorm ─┘
+
+The results are kept in the probe info under "loudness" (stream index ->
+measurement), so putting MediaRecord.info back into the ProbeCache saves
+them for the next run. The second pass writes one normalized file per stream
+and is independent per stream, so those jobs run in parallel. It applies a
+plain linear gain when that keeps the true peak under the target; otherwise
+it falls back to loudnorm's dynamic mode with the measured values.
+"""
+import json
+import math
+import os
+import re
+
+from extraction import AUDIO_EXTENSIONS, output_path_for
+from ffmpeg_utils import FfmpegCommand, stream_map
+
+# EBU R128 defaults: -23 LUFS integrated, -1 dBTP true peak
+TARGET_INTEGRATED = -23.0
+TARGET_TRUE_PEAK = -1.0
+TARGET_RANGE = 7.0
+# Encoder for each source codec; other sources (PCM, DTS, ...) are written as FLAC
+ENCODERS = {"aac": "aac", "mp3": "libmp3lame", "ac3": "ac3", "eac3": "eac3", "opus": "libopus",
+            "vorbis": "libvorbis", "flac": "flac"}
+LOSSLESS_CODECS = ("flac",)
+
+# loudnorm prints its JSON after a "[Parsed_loudnorm_N @ 0x...]" line, N being the filter's place in the graph
+_LOUDNORM_BLOCK = re.compile(r"\[Parsed_loudnorm_(\d+) @ [^\]]*\]\s*(\{.*?\})", re.DOTALL)
+_MEASURED_KEYS = {"input_i": "integrated", "input_tp": "true_peak", "input_lra": "range",
+                  "input_thresh": "threshold"}
+
+
+def normalized_output_path(input_file, stream, codec=None):
+    """Default output of a normalized stream, e.g. movie_audio_eng.norm.ac3"""
+    base, ext = os.path.splitext(output_path_for(input_file, stream.data))
+    if codec is not None or stream.codec_name not in ENCODERS:
+        ext = AUDIO_EXTENSIONS.get(codec or "flac", ".mka")
+    return f"{base}.norm{ext}"
+
+
+class LoudnessPlan:
+    """Measurement and normalization of some audio streams of a probed file (all of them by default).
+
+    codec is the output codec name (e.g. "aac"; default: the source codec
+    where ffmpeg can encode it, FLAC otherwise) and bitrate the target
+    bitrate for lossy codecs (default: the source's).
+    """
+
+    def __init__(self, record, indexes=None, integrated=TARGET_INTEGRATED, true_peak=TARGET_TRUE_PEAK,
+                 lra=TARGET_RANGE, codec=None, bitrate=None):
+        self.record = record
+        self.input_file = record.path
+        audio = record.of_type("audio")
+        self.streams = audio if indexes is None else [s for s in audio if s.index in set(indexes)]
+        if not self.streams:
+            raise ValueError(f"{record.path} has no audio stream to normalize")
+        self.integrated = integrated
+        self.true_peak = true_peak
+        self.lra = lra
+        self.codec = codec
+        self.bitrate = bitrate
+        # Stream index -> output file; callers may move them (e.g. with an OutputPolicy) before building commands
+        self.outputs = {s.index: normalized_output_path(record.path, s, codec) for s in self.streams}
+
+    @property
+    def pending(self):
+        """Streams not measured yet"""
+        measured = self.record.info.get("loudness", {})
+        return [s for s in self.streams if str(s.index) not in measured]
+
+    def analysis_command(self, progress=False):
+        """The ffmpeg run measuring every pending stream in one pass, or None if all are measured"""
+        pending = self.pending
+        if not pending:
+            return None
+        graph = ";".join(f"[{stream_map(0, 'audio', s.rel_index)}]loudnorm=I={self.integrated}:TP={self.true_peak}"
+                         f":LRA={self.lra}:print_format=json[m{n}]" for n, s in enumerate(pending))
+        command = FfmpegCommand(progress=progress, global_options=["-filter_complex", graph])
+        command.add_input(self.input_file)
+        command.add_output("-", [f"[m{n}]" for n in range(len(pending))], codecs={}, options=["-f", "null"])
+        return command.argv()
+
+    def read_analysis(self, stderr):
+        """Store the measurements printed by analysis_command()'s ffmpeg run; raises ValueError if one is missing"""
+        pending = self.pending
+        blocks = {int(n): block for n, block in _LOUDNORM_BLOCK.findall(stderr)}
+        measured = {}
+        for n, stream in enumerate(pending):
+            try:
+                values = json.loads(blocks[n])
+                measured[str(stream.index)] = {name: float(values[key]) for key, name in _MEASURED_KEYS.items()}
+            except (KeyError, ValueError) as e:
+                raise ValueError(f"No loudness measurement for stream {stream.index} of {self.input_file}") from e
+        self.record.info.setdefault("loudness", {}).update(measured)
+
+    def measurement(self, stream):
+        """{"integrated", "true_peak", "range", "threshold"} of a measured stream, or None"""
+        return self.record.info.get("loudness", {}).get(str(stream.index))
+
+    def gain(self, stream):
+        """dB to add to a measured stream to reach the target, or None for silence"""
+        measured = self.measurement(stream)
+        if measured is None or not math.isfinite(measured["integrated"]):
+            return None
+        return self.integrated - measured["integrated"]
+
+    def is_linear(self, stream):
+        """True if a plain gain brings the stream to the target without pushing its true peak over the limit"""
+        gain = self.gain(stream)
+        return gain is not None and self.measurement(stream)["true_peak"] + gain <= self.true_peak
+
+    def normalize_commands(self, progress=False):
+        """[(stream, output file, argv)] of the second pass, one independent ffmpeg run per stream.
+
+        Silent streams (no measurable loudness) are left out.
+        """
+        commands = []
+        for stream in self.streams:
+            if self.gain(stream) is None:
+                continue
+            output_file = self.outputs[stream.index]
+            command = FfmpegCommand(progress=progress)
+            command.add_input(self.input_file)
+            command.add_output(output_file, [stream_map(0, "audio", stream.rel_index)],
+                               codecs={"a": self._encoder(stream)}, options=self._filter_options(stream))
+            commands.append((stream, output_file, command.argv()))
+        return commands
+
+    def summary(self):
+        lines = [f"Loudness of {os.path.basename(self.input_file)} (target {self.integrated:g} LUFS, "
+                 f"{self.true_peak:g} dBTP):"]
+        for stream in self.streams:
+            measured = self.measurement(stream)
+            if measured is None:
+                lines.append(f"  stream {stream.index}: not measured")
+                continue
+            gain = self.gain(stream)
+            if gain is None:
+                action = "silent, skipped"
+            else:
+                action = f"{gain:+.1f} dB" + ("" if self.is_linear(stream) else " (peak-limited, dynamic)")
+            lines.append(f"  stream {stream.index}: {measured['integrated']:.1f} LUFS, "
+                         f"{measured['true_peak']:.1f} dBTP, LRA {measured['range']:.1f} LU -> {action}")
+        return "\n".join(lines)
+
+    def _encoder(self, stream):
+        codec = self.codec or (stream.codec_name if stream.codec_name in ENCODERS else "flac")
+        return ENCODERS.get(codec, codec)
+
+    def _filter_options(self, stream):
+        if self.is_linear(stream):
+            options = ["-af", f"volume={self.gain(stream):.2f}dB"]
+        else:
+            measured = self.measurement(stream)
+            # loudnorm works at 192 kHz internally, so the source rate is set back explicitly
+            options = ["-af", f"loudnorm=I={self.integrated}:TP={self.true_peak}:LRA={self.lra}"
+                              f":measured_I={measured['integrated']}:measured_TP={measured['true_peak']}"
+                              f":measured_LRA={measured['range']}:measured_thresh={measured['threshold']}"]
+            if stream.sample_rate:
+                options += ["-ar", str(stream.sample_rate)]
+        if self.bitrate:
+            options += ["-b:a", self.bitrate]
+        elif stream.bit_rate and self._encoder(stream) not in LOSSLESS_CODECS:
+            options += ["-b:a", str(stream.bit_rate)]  # Keep the source's quality
+        return options
@@ -1,12 +1,21 @@
 import sys
-from PyQt5.QtWidgets import QApplication
-from ui.main_window import MainWindow
 
 def main():
+    # Subcommands run headless; PyQt5 is only imported for the GUI
+    from cli import command_names, main as cli_main
+    if len(sys.argv) > 1 and sys.argv[1] in (*command_names(), "-h", "--help"):
+        sys.exit(cli_main(sys.argv[1:]))
+
+    from log_setup import setup_logging
+    setup_logging()
+
+    from PyQt5.QtWidgets import QApplication
+    from ui.main_window import MainWindow
+
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
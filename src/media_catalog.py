@@ -0,0 +1,235 @@
+"""In-memory catalog of probed files and their streams.
+
+Files are keyed by full path and streams by their global ffprobe index, and
+each stream's type-relative index (the N in "-map 0:a:N") is computed once
+when the file is added. Resolving a selection is then a couple of dict
+lookups instead of a scan over every file and stream.
+
+Records are typed views of a single `-show_format -show_streams` probe:
+durations, bitrates, frame rates, resolutions, channel layouts and
+disposition flags are all there without running ffprobe again. Packet-level
+data (and the keyframes derived from it) needs a full read of the stream,
+so it is only fetched the first time it is asked for.
+"""
+import threading
+
+from media_probe import media_duration, probe_file, probe_packets
+
+
+class StreamRecord:
+    """One stream of a cataloged file"""
+
+    __slots__ = ("path", "index", "codec_type", "codec_name", "profile", "rel_index", "language", "title",
+                 "duration", "bit_rate", "width", "height", "pix_fmt", "frame_rate", "sample_rate", "channels",
+                 "channel_layout", "disposition", "data")
+
+    def __init__(self, path, data, rel_index):
+        self.path = path
+        self.index = data.get("index", 0)
+        self.codec_type = data.get("codec_type", "unknown")
+        self.codec_name = data.get("codec_name")
+        self.profile = data.get("profile")
+        self.rel_index = rel_index  # Position among the file's streams of the same type
+        tags = data.get("tags", {})
+        self.language = tags.get("language")
+        self.title = tags.get("title")
+        self.duration = _number(data.get("duration"), float)
+        self.bit_rate = _number(data.get("bit_rate") or tags.get("BPS"), int)
+        self.width = data.get("width")
+        self.height = data.get("height")
+        self.pix_fmt = data.get("pix_fmt")
+        self.frame_rate = _rate(data.get("avg_frame_rate")) or _rate(data.get("r_frame_rate"))
+        self.sample_rate = _number(data.get("sample_rate"), int)
+        self.channels = data.get("channels")
+        self.channel_layout = data.get("channel_layout")
+        # Names of the disposition flags that are set, e.g. {"default", "forced"}
+        self.disposition = frozenset(k for k, v in data.get("disposition", {}).items() if v)
+        self.data = data  # The ffprobe stream dict this record was built from
+
+    @property
+    def default(self):
+        return "default" in self.disposition
+
+    @property
+    def forced(self):
+        return "forced" in self.disposition
+
+    @property
+    def attached_pic(self):
+        """Cover art is reported as a video stream; it is not a real video track"""
+        return "attached_pic" in self.disposition
+
+    def summary(self):
+        """Short human-readable description, e.g. "h264 1920x1080 23.976 fps" """
+        parts = [self.codec_name or self.codec_type]
+        if self.width and self.height:
+            parts.append(f"{self.width}x{self.height}")
+        if self.frame_rate and self.codec_type == "video":
+            parts.append(f"{self.frame_rate:.3f}".rstrip("0").rstrip(".") + " fps")
+        if self.sample_rate:
+            parts.append(f"{self.sample_rate} Hz")
+        if self.channel_layout or self.channels:
+            parts.append(self.channel_layout or f"{self.channels} ch")
+        if self.bit_rate:
+            parts.append(f"{self.bit_rate // 1000} kb/s")
+        return " ".join(parts)
+
+
+class MediaRecord:
+    """A probed file: container data and its streams by global index and by type"""
+
+    __slots__ = ("path", "info", "duration", "format_name", "size", "bit_rate", "start_time",
+                 "streams", "by_index", "by_type", "_extras", "_lock")
+
+    def __init__(self, path, info):
+        self.path = path
+        self.info = info
+        fmt = info.get("format", {})
+        self.duration = media_duration(info)
+        self.format_name = fmt.get("format_name")
+        self.size = _number(fmt.get("size"), int)
+        self.bit_rate = _number(fmt.get("bit_rate"), int)
+        self.start_time = _number(fmt.get("start_time"), float) or 0.0
+        self.streams = []
+        self.by_index = {}
+        self.by_type = {}
+        for data in info.get("streams", []):
+            same_type = self.by_type.setdefault(data.get("codec_type", "unknown"), [])
+            record = StreamRecord(path, data, len(same_type))
+            same_type.append(record)
+            self.streams.append(record)
+            self.by_index[record.index] = record
+        self._extras = {}  # Lazily fetched costly data, e.g. ("packets", stream index) -> packet list
+        self._lock = threading.Lock()
+
+    @property
+    def raw_streams(self):
+        return self.info.get("streams", [])
+
+    @property
+    def file_type(self):
+        """Type of the first stream, which is how standalone audio/subtitle files are recognised"""
+        return self.streams[0].codec_type if self.streams else None
+
+    def stream(self, index):
+        return self.by_index.get(index)
+
+    def of_type(self, stream_type):
+        return self.by_type.get(stream_type, [])
+
+    def first(self, stream_type):
+        streams = self.by_type.get(stream_type)
+        return streams[0] if streams else None
+
+    def main_video(self):
+        """First real video stream (skipping cover art), or None"""
+        return next((s for s in self.of_type("video") if not s.attached_pic), None)
+
+    def packets(self, stream_index):
+        """(pts_time, size, keyframe) for every packet of a stream, fetched with ffprobe on first use"""
+        key = ("packets", stream_index)
+        with self._lock:
+            if key not in self._extras:
+                self._extras[key] = probe_packets(self.path, stream_index)
+            return self._extras[key]
+
+    def keyframes(self, stream_index=None):
+        """Sorted keyframe timestamps of a stream (default: the main video stream).
+
+        The index is stored in the probe info under "keyframes", so putting
+        self.info back into the ProbeCache keeps it for the next run.
+        """
+        if stream_index is None:
+            video = self.main_video()
+            if video is None:
+                return []
+            stream_index = video.index
+        index = self.info.setdefault("keyframes", {})
+        key = str(stream_index)  # JSON object keys, as the cache stores them
+        if key not in index:
+            index[key] = sorted({pts for pts, _, keyframe in self.packets(stream_index) if keyframe and pts is not None})
+        return index[key]
+
+    @property
+    def has_keyframe_index(self):
+        video = self.main_video()
+        return video is not None and str(video.index) in self.info.get("keyframes", {})
+
+
+class MediaCatalog:
+    """Probed files by full path"""
+
+    def __init__(self):
+        self._files = {}
+
+    @classmethod
+    def from_infos(cls, infos):
+        """Catalog of a {path: probe info} mapping, as returned by probe_files"""
+        catalog = cls()
+        for path, info in infos.items():
+            catalog.add(path, info)
+        return catalog
+
+    def add(self, path, info):
+        record = self._files[path] = MediaRecord(path, info)
+        return record
+
+    def get(self, path):
+        return self._files.get(path)
+
+    def remove(self, path):
+        self._files.pop(path, None)
+
+    def clear(self):
+        self._files.clear()
+
+    def __contains__(self, path):
+        return path in self._files
+
+    def __len__(self):
+        return len(self._files)
+
+    def __iter__(self):
+        return iter(self._files.values())
+
+    def streams(self, path):
+        """Raw ffprobe stream dicts of a file (empty if unknown)"""
+        record = self._files.get(path)
+        return record.raw_streams if record else []
+
+    def duration(self, path):
+        record = self._files.get(path)
+        return record.duration if record else None
+
+    def stream(self, path, index):
+        record = self._files.get(path)
+        return record.by_index.get(index) if record else None
+
+    def rel_index(self, path, index, stream_type=None):
+        """Type-relative index of a stream, or None if unknown or not of stream_type"""
+        stream = self.stream(path, index)
+        if stream is None or (stream_type is not None and stream.codec_type != stream_type):
+            return None
+        return stream.rel_index
+
+
+def probe_media(path):
+    """Probe one file with a single ffprobe run and return its MediaRecord; raises on failure"""
+    return MediaRecord(path, probe_file(path))
+
+
+def _number(value, kind):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rate(value):
+    """Frames per second from an ffprobe rational such as "30000/1001" (None for "0/0")"""
+    try:
+        num, _, den = str(value).partition("/")
+        rate = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return rate or None
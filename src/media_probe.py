@@ -0,0 +1,154 @@
+import json
+import logging
+import subprocess
+
+from jobs import Job, JobQueue, DONE
+from subtitles import subtitle_format, subtitle_info
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the probed entries change, so cached probes from older versions are discarded
+PROBE_VERSION = 3
+
+
+def probe_command(file_path):
+    """One ffprobe run returning everything about the container and its streams"""
+    return [
+        "ffprobe",
+        "-v", "error",
+        "-show_format",
+        "-show_streams",
+        "-of", "json",
+        file_path
+    ]
+
+
+def packets_command(file_path, stream_index):
+    """ffprobe listing the packets of one stream (by global index): pts_time, size and flags per line.
+
+    This reads the whole stream, so it is only run on demand (see
+    media_catalog.MediaRecord.packets), never as part of a normal probe.
+    """
+    return [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", str(stream_index),
+        "-show_entries", "packet=pts_time,size,flags",
+        "-of", "csv=p=0",
+        file_path
+    ]
+
+
+def parse_probe_output(stdout):
+    """Parse ffprobe JSON into a dict with "streams" and "format" entries"""
+    return json.loads(stdout or "{}")
+
+
+def probe_file(file_path):
+    """Parsed info of one file: .srt/.ass files are read natively, anything else by ffprobe; raises on failure"""
+    info = native_subtitle_info(file_path)
+    if info is not None:
+        return info
+    result = subprocess.run(probe_command(file_path), capture_output=True, text=True, check=True)
+    return parse_probe_output(result.stdout)
+
+
+def native_subtitle_info(file_path):
+    """Probe info of an .srt/.ass file parsed in-process, or None to fall back to ffprobe.
+
+    The GUI import, the watch service and probe_files() all try this before
+    running ffprobe.
+    """
+    if not subtitle_format(file_path):
+        return None
+    try:
+        return subtitle_info(file_path)
+    except (OSError, ValueError) as e:
+        logger.debug(f"Reading {file_path} natively failed, probing it with ffprobe: {e}")
+        return None
+
+
+def parse_packets(stdout):
+    """(pts_time, size, keyframe) per packet from packets_command output, in decode order"""
+    packets = []
+    for line in stdout.splitlines():
+        fields = line.strip().split(",")
+        if len(fields) < 3:
+            continue
+        try:
+            pts_time = float(fields[0])
+        except ValueError:
+            pts_time = None  # Packets without a timestamp, e.g. some B-frames in raw streams
+        try:
+            size = int(fields[1])
+        except ValueError:
+            size = 0
+        packets.append((pts_time, size, "K" in fields[2]))
+    return packets
+
+
+def probe_packets(file_path, stream_index):
+    """Run ffprobe over every packet of one stream; raises OSError or ValueError on failure"""
+    try:
+        result = subprocess.run(packets_command(file_path, stream_index), capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Could not read the packets of stream {stream_index} of {file_path}: "
+                         f"{(e.stderr or '').strip() or e}") from e
+    return parse_packets(result.stdout)
+
+
+def get_media_streams(file_path):
+    try:
+        return probe_file(file_path).get("streams", [])
+    except Exception as e:
+        logger.error(f"Error probing file {file_path}: {str(e)}")
+        return []
+
+
+def media_duration(info):
+    """Container duration in seconds from probe info (or its longest stream), or None"""
+    duration = _float(info.get("format", {}).get("duration"))
+    if duration is not None:
+        return duration
+    stream_durations = [d for d in (_float(s.get("duration")) for s in info.get("streams", [])) if d is not None]
+    return max(stream_durations) if stream_durations else None
+
+
+def probe_files(file_paths, max_workers=8, cache=None):
+    """Probe many files concurrently; returns {path: info} (empty info for failures)"""
+    results = {}
+    pending = []
+    for file_path in dict.fromkeys(file_paths):
+        # External subtitles are read directly; that is cheaper than even a cache lookup's stat
+        info = native_subtitle_info(file_path)
+        if info is None and cache:
+            info = cache.get(file_path)
+        if info is not None:
+            results[file_path] = info
+        else:
+            pending.append(file_path)
+
+    if pending:
+        queue = JobQueue(max_workers=max_workers)
+        jobs = [queue.submit(Job(probe_command(f), f"Probe {f}", input_file=f)) for f in pending]
+        queue.wait()
+        for job in jobs:
+            info = {}
+            if job.state == DONE:
+                try:
+                    info = parse_probe_output(job.stdout)
+                except ValueError as e:
+                    logger.error(f"Error probing file {job.input_file}: {str(e)}")
+            else:
+                logger.error(f"Error probing file {job.input_file}: {str(job.error or job.stderr)}")
+            if info.get("streams") and cache:
+                cache.put(job.input_file, info)
+            results[job.input_file] = info
+    return results
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
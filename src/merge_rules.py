@@ -0,0 +1,161 @@
+"""Rule-based merges across a whole series.
+
+A SeriesMergeRule picks streams out of each video by type, type-relative
+index or language, and external audio/subtitle files are paired with videos
+by episode key (S01E02, 1x02, or the file stem without its language suffix).
+The result is one merge spec per video, turned into jobs by series_jobs()
+(for the CLI and the watch service).
+"""
+import glob
+import logging
+import os
+import re
+
+from extraction import TYPE_SPECIFIERS
+from languages import language_from_filename, normalize_language
+from merging import merge_job, merged_output_path
+
+logger = logging.getLogger(__name__)
+
+EPISODE_PATTERNS = [
+    re.compile(r"s(\d{1,3})[ ._-]?e(\d{1,4})", re.IGNORECASE),
+    re.compile(r"(?<![0-9])(\d{1,2})x(\d{1,3})(?![0-9])", re.IGNORECASE),
+]
+
+
+def episode_key(path):
+    """Key used to pair a video with its external tracks, e.g. "s01e02" """
+    name = os.path.basename(path)
+    for pattern in EPISODE_PATTERNS:
+        match = pattern.search(name)
+        if match:
+            return f"s{int(match.group(1)):02d}e{int(match.group(2)):02d}"
+    stem = os.path.splitext(name)[0]
+    if language_from_filename(path):
+        stem = stem.rsplit(".", 1)[0]
+    return stem.lower()
+
+
+def expand_globs(patterns):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        files += matches if matches else [pattern]
+    return list(dict.fromkeys(files))
+
+
+class StreamRule:
+    """Which streams of one type to keep: "all", "none", type-relative indexes or language codes"""
+
+    def __init__(self, spec="all"):
+        if spec in (None, "all", "*"):
+            spec = "all"
+        elif spec is False or spec == "none" or spec == []:
+            spec = []
+        elif isinstance(spec, (int, str)):
+            spec = [spec]
+        self.all = spec == "all"
+        items = [] if self.all else list(spec)
+        self.indexes = {i for i in items if isinstance(i, int)}
+        self.languages = {normalize_language(i) for i in items if isinstance(i, str)}
+
+    def matches(self, rel_index, language):
+        if self.all:
+            return True
+        return rel_index in self.indexes or normalize_language(language) in self.languages
+
+    def accepts_external(self, language):
+        """External files are added when the rule keeps everything or names their language"""
+        if self.all:
+            return True
+        return bool(language) and normalize_language(language) in self.languages
+
+
+class SeriesMergeRule:
+    """Stream selection and output naming applied to every video of a series"""
+
+    def __init__(self, video="all", audio="all", subtitle="all", output=None):
+        self.rules = {"video": StreamRule(video), "audio": StreamRule(audio), "subtitle": StreamRule(subtitle)}
+        self.output = output  # Template with {dir}, {stem}, {key}; default <video>_merged.mkv
+
+    @classmethod
+    def from_dict(cls, spec):
+        select = spec.get("select", {})
+        return cls(select.get("video", "all"), select.get("audio", "all"), select.get("subtitle", "all"),
+                   spec.get("output"))
+
+    def select_streams(self, streams):
+        """Global indexes of the streams of a video file kept by this rule"""
+        selected = []
+        counters = dict.fromkeys(TYPE_SPECIFIERS, 0)
+        for s in streams:
+            stream_type = s.get("codec_type")
+            if stream_type not in TYPE_SPECIFIERS:
+                continue
+            rel_index = counters[stream_type]
+            counters[stream_type] += 1
+            if self.rules[stream_type].matches(rel_index, s.get("tags", {}).get("language")):
+                selected.append(s.get("index"))
+        return selected
+
+    def accepts_external(self, file_type, language):
+        rule = self.rules.get(file_type)
+        return rule is not None and rule.accepts_external(language)
+
+    def output_path(self, video_file):
+        if not self.output:
+            return merged_output_path(video_file)
+        directory, name = os.path.split(video_file)
+        return self.output.format(dir=directory or ".", stem=os.path.splitext(name)[0], key=episode_key(video_file))
+
+
+class MergeSpec:
+    """One merge to run: streams of a video plus paired external files"""
+
+    def __init__(self, video_file, stream_indexes, add_files, output_file):
+        self.video_file = video_file
+        self.stream_indexes = stream_indexes
+        self.add_files = add_files
+        self.output_file = output_file
+
+
+def pair_externals(video_files, external_files):
+    """Map each video to the external files sharing its episode key"""
+    by_key = {}
+    for external in external_files:
+        by_key.setdefault(episode_key(external), []).append(external)
+    return {video: by_key.get(episode_key(video), []) for video in video_files}
+
+
+def plan_series_merge(video_files, external_files, infos, rule):
+    """Build a MergeSpec per video; externals are filtered by type and language through the rule"""
+    specs = []
+    for video, externals in pair_externals(video_files, external_files).items():
+        add_files = []
+        for external in externals:
+            streams = infos.get(external, {}).get("streams", [])
+            file_type = streams[0].get("codec_type") if streams else None
+            language = language_from_filename(external) or (streams[0].get("tags", {}).get("language") if streams else None)
+            if rule.accepts_external(file_type, language):
+                add_files.append(external)
+        indexes = rule.select_streams(infos.get(video, {}).get("streams", []))
+        specs.append(MergeSpec(video, indexes, add_files, rule.output_path(video)))
+    return specs
+
+
+def series_jobs(specs, infos, overwrite=False, policy=None, report=None):
+    """Merge jobs for every MergeSpec of a series; episodes that cannot be merged are reported and skipped"""
+    report = report or logger.info
+    jobs = []
+    for spec in specs:
+        # Default names follow the output policy; explicit templates are kept as they are
+        output_file = None if spec.output_file == merged_output_path(spec.video_file) else spec.output_file
+        try:
+            job = merge_job(spec.video_file, infos, spec.stream_indexes, spec.add_files, output_file, overwrite,
+                            policy, report)
+        except ValueError as e:
+            report(f"Skipping {spec.video_file}: {e}")
+            continue
+        if job is not None:
+            jobs.append(job)
+    return jobs
@@ -0,0 +1,109 @@
+import logging
+import os
+
+from disk_scheduler import estimate_output_bytes, file_bytes
+from extraction import TYPE_SPECIFIERS, select_streams
+from ffmpeg_utils import FfmpegCommand, stream_map
+from jobs import Job
+from languages import language_from_filename
+from media_catalog import MediaCatalog
+from output_policy import OutputPolicy, skip_existing
+
+logger = logging.getLogger(__name__)
+
+
+def merged_output_path(video_file):
+    """Default merge output: named after the video file with a "merged" suffix"""
+    base, _ = os.path.splitext(video_file)
+    return f"{base}_merged.mkv"
+
+
+def stream_language(stream):
+    """Language tag of a catalog StreamRecord, or "und" """
+    return (stream.language if stream is not None else None) or "und"
+
+
+def build_merge_command(video_file, stream_maps, external_files, catalog, output_file, progress=False):
+    """Build the ffmpeg argv that stream-copies the selected streams into output_file.
+
+    stream_maps is a list of (input_file, stream_type, stream_index) for streams
+    picked out of probed containers, external_files a list of (file, file_type)
+    for standalone audio/subtitle files whose first stream of that type is used.
+    Streams are resolved through catalog, a MediaCatalog of every input.
+    Subtitle streams get a language tag from their probe data, or from the
+    file name for external files ("und" if neither has one).
+    """
+    command = FfmpegCommand(progress=progress)
+    map_args = []
+    metadata_args = []
+
+    # The video file is always input 0, followed by every other file in selection order
+    input_indices = {}
+    for input_file in [video_file] + [f for f, _, _ in stream_maps] + [f for f, _ in external_files]:
+        input_indices[input_file] = command.add_input(input_file)
+
+    # Map selected streams, using type-relative indexes
+    subtitle_languages = []
+    for input_file, stream_type, stream_index in stream_maps:
+        type_key = stream_type.lower()
+        if type_key not in TYPE_SPECIFIERS:
+            continue
+        stream = catalog.stream(input_file, stream_index)
+        if stream is None or stream.codec_type != type_key:
+            logger.warning(f"Could not find type-relative index for {stream_type} stream {stream_index} in {input_file}")
+            continue
+        map_args.append(stream_map(input_indices[input_file], type_key, stream.rel_index))
+        if type_key == "subtitle":
+            subtitle_languages.append(stream_language(stream))
+
+    # Map the first stream of external files
+    for ext_file, ext_type in external_files:
+        if ext_type not in ("audio", "subtitle"):
+            continue
+        map_args.append(stream_map(input_indices[ext_file], ext_type, 0))
+        if ext_type == "subtitle":
+            record = catalog.get(ext_file)
+            lang = stream_language(record.streams[0] if record and record.streams else None)
+            if lang == "und":
+                # External subtitles rarely carry a tag; fall back to a "name.it.srt" style suffix
+                lang = language_from_filename(ext_file) or lang
+            subtitle_languages.append(lang)
+
+    # Add language metadata for subtitle streams, in output order
+    for sub_idx, lang in enumerate(subtitle_languages):
+        metadata_args += [f"-metadata:s:s:{sub_idx}", f"language={lang}"]
+
+    command.add_output(output_file, map_args, metadata=metadata_args)
+    return command.argv()
+
+
+def merge_job(video_file, infos, indexes=None, add_files=(), output_file=None, overwrite=False, policy=None,
+              report=None):
+    """A single ffmpeg job merging streams of video_file with external audio/subtitle files.
+
+    Returns None if the output exists and overwrite is not set (after
+    passing it to report, by default the log).
+    """
+    policy = policy or OutputPolicy()
+    catalog = MediaCatalog.from_infos({f: infos.get(f, {}) for f in [video_file, *add_files]})
+    streams = select_streams(catalog.streams(video_file), indexes=indexes)
+    if not any(s.get("codec_type") == "video" for s in streams):
+        raise ValueError(f"No video stream selected in {video_file}")
+
+    stream_maps = [(video_file, s.get("codec_type"), s.get("index")) for s in streams]
+    external_files = []
+    for add_file in add_files:
+        file_type = catalog.get(add_file).file_type
+        if file_type not in ("audio", "subtitle"):
+            raise ValueError(f"{add_file} is not an audio or subtitle file")
+        external_files.append((add_file, file_type))
+
+    output_file = output_file or policy.place(merged_output_path(video_file), video_file, "merge")
+    if not overwrite and skip_existing(output_file, report):
+        return None
+    cmd = build_merge_command(video_file, stream_maps, external_files, catalog, output_file, progress=True)
+    estimate = (estimate_output_bytes(catalog.get(video_file), {s.get("index") for s in streams}) or 0) + \
+        file_bytes(*add_files)
+    return policy.stage(Job(cmd, f"Merge into {os.path.basename(output_file)}", input_file=video_file,
+                            output_files=[output_file], media_duration=catalog.duration(video_file),
+                            estimated_bytes=estimate))
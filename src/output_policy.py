@@ -0,0 +1,225 @@
+"""Where outputs are written, and how they get there.
+
+An OutputPolicy decides the final path of every output (an output root and
+per-kind naming templates) and stages what ffmpeg writes:
+
+  - without a scratch directory, ffmpeg writes a hidden partial file next to
+    the destination, renamed over it once the job succeeds;
+  - with one, it writes on the (fast, local) scratch disk and the result is
+    copied to a partial file at the destination and renamed from there.
+
+Either way the destination only ever holds a complete file, and a job that
+fails or is cancelled leaves nothing behind. Partial files are named after
+the process that wrote them, so ones left by a crash are swept away the next
+time a policy stages into the same directory.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+
+from app_dirs import user_data_dir
+
+logger = logging.getLogger(__name__)
+
+POLICY_FILE_NAME = "output_policy.json"
+# Output kinds a template can be given for
+KINDS = ("extract", "merge", "concat", "trim", "split", "transcode", "loudness")
+DEFAULT_TEMPLATE = "{dir}/{name}"
+
+_PARTIAL = re.compile(r"^\..*\.partial-(\d+)(\.[^.]*)?$")
+_SCRATCH_DIR = re.compile(r"^stage-(\d+)-")
+
+
+class OutputPolicy:
+    """Output root, naming templates and staging for job outputs.
+
+    Templates take {dir} (the output root, or the input's directory),
+    {stem} (the input name without extension), {name} (the default output
+    file name), {base} ({name} without extension) and {ext}; for example
+    "{dir}/{stem}/{name}" gives every input its own folder.
+    """
+
+    def __init__(self, root=None, templates=None, scratch_dir=None):
+        self.root = os.path.abspath(root) if root else None
+        self.templates = dict(templates or {})
+        unknown = set(self.templates) - set(KINDS)
+        if unknown:
+            raise ValueError(f"Unknown output kind(s) in templates: {', '.join(sorted(unknown))}")
+        for kind, template in self.templates.items():
+            _check_template(kind, template)
+        self.scratch_dir = os.path.abspath(scratch_dir) if scratch_dir else None
+        self._swept = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=None):
+        """Policy from a JSON file ({"root", "scratch", "templates": {kind: template}}).
+
+        Without a path, the per-user output_policy.json is read if there is
+        one; otherwise outputs go beside their inputs, staged in place.
+        """
+        if path is None:
+            path = os.path.join(user_data_dir(), POLICY_FILE_NAME)
+            if not os.path.exists(path):
+                return cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get("templates") or {}, dict):
+            raise ValueError(f"{path}: expected a JSON object with a templates object")
+        try:
+            return cls(data.get("root"), data.get("templates"), data.get("scratch"))
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from None
+
+    def place(self, default_path, input_file, kind):
+        """Final path of an output whose default (beside the input) path is default_path"""
+        template = self.templates.get(kind)
+        if template is None and self.root is None:
+            return default_path
+        name = os.path.basename(default_path)
+        base, ext = os.path.splitext(name)
+        path = (template or DEFAULT_TEMPLATE).format(
+            dir=self.root or os.path.dirname(os.path.abspath(input_file)),
+            stem=os.path.splitext(os.path.basename(input_file))[0], name=name, base=base, ext=ext)
+        return os.path.normpath(path)
+
+    def stage(self, job):
+        """Point the job's ffmpeg outputs at staging files; returns the job.
+
+        The JobQueue publishes them to the real outputs when the job succeeds
+        and removes them otherwise (see publish_staged).
+        """
+        scratch = None
+        if self.scratch_dir is not None:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+            self._sweep(self.scratch_dir)
+            scratch = tempfile.mkdtemp(prefix=f"stage-{os.getpid()}-", dir=self.scratch_dir)
+        staged = {}
+        for final in job.output_files:
+            directory, name = os.path.split(os.path.abspath(final))
+            os.makedirs(directory, exist_ok=True)
+            if scratch is None:
+                self._sweep(directory)
+                staged[os.path.join(directory, partial_name(name))] = final
+            else:
+                staged[os.path.join(scratch, name)] = final
+        job.command = [_swap(arg, staged) for arg in job.command]
+        job.staged = staged
+        return job
+
+    def _sweep(self, directory):
+        """Remove partial files and scratch directories left behind by processes that no longer run"""
+        with self._lock:
+            if directory in self._swept:
+                return
+            self._swept.add(directory)
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            match = _PARTIAL.match(entry.name) or _SCRATCH_DIR.match(entry.name)
+            if match and not _process_alive(int(match.group(1))):
+                logger.info(f"Removing leftover partial output {entry.path}")
+                discard(entry.path)
+
+
+def skip_existing(output_file, report=None):
+    """True if output_file exists and is kept; report (default: the log) is told about it"""
+    if not os.path.exists(output_file):
+        return False
+    (report or logger.info)(f"Skipping existing {output_file} (use --overwrite to replace it)")
+    return True
+
+
+def partial_name(name):
+    """Hidden name of an output while it is written, e.g. ".movie.partial-1234.mkv" """
+    # The extension is kept so that ffmpeg still picks the right muxer
+    base, ext = os.path.splitext(name)
+    return f".{base}.partial-{os.getpid()}{ext}"
+
+
+def publish_staged(job):
+    """Move a finished job's staged files over its outputs; raises OSError if one cannot be moved"""
+    for temp, final in job.staged.items():
+        publish(temp, final)
+
+
+def discard_staged(job):
+    for temp in job.staged:
+        discard(temp)
+
+
+def publish(temp, final):
+    """Atomically replace final with temp, copying first if they are on different filesystems"""
+    try:
+        os.replace(temp, final)
+    except OSError:
+        directory, name = os.path.split(os.path.abspath(final))
+        partial = os.path.join(directory, partial_name(name))
+        try:
+            shutil.copyfile(temp, partial)
+            os.replace(partial, final)
+        except OSError:
+            discard(partial)
+            raise
+        discard(temp)
+    _remove_scratch_dir(temp)
+
+
+def discard(path):
+    """Remove a staged file (or scratch directory) if it exists"""
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Cannot remove {path}: {e}")
+    _remove_scratch_dir(path)
+
+
+def _remove_scratch_dir(path):
+    parent = os.path.dirname(path)
+    if _SCRATCH_DIR.match(os.path.basename(parent)):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            pass
+
+
+def _check_template(kind, template):
+    """Raise ValueError unless template formats with the fields place() passes"""
+    if not isinstance(template, str):
+        raise ValueError(f"The {kind} template must be a string")
+    try:
+        template.format(dir="dir", stem="stem", name="name.ext", base="name", ext=".ext")
+    except (KeyError, IndexError, ValueError, AttributeError) as e:
+        raise ValueError(f"Invalid {kind} template {template!r}: {e!r} (fields are {{dir}}, {{stem}}, {{name}}, "
+                         f"{{base}} and {{ext}})") from None
+
+
+def _swap(arg, staged):
+    for temp, final in staged.items():
+        if arg == final:
+            return temp
+    return arg
+
+
+def _process_alive(pid):
+    if pid == os.getpid() or sys.platform == "win32":
+        return True  # os.kill() would terminate the process on Windows, so never sweep there
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists but belongs to someone else
+    return True
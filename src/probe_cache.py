@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from app_dirs import user_cache_dir
+from media_probe import PROBE_VERSION
+
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Cache hits are remembered in memory and their last_access written in one transaction per this many
+ACCESS_FLUSH_COUNT = 500
+
+
+def file_identity(file_path):
+    """(size, mtime_ns, inode) of a file, or None if it cannot be stat'ed"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class ProbeCache:
+    """Persistent ffprobe results keyed by path, size, mtime and inode.
+
+    Entries are evicted least-recently-used first once the cache holds more
+    than max_entries rows or max_bytes of stream data. A changed file simply
+    misses (and its stale entry is dropped), so there is nothing to invalidate
+    by hand in the normal case; invalidate() and clear() exist for the rest.
+    A cache written for a different probe version is discarded on open.
+
+    Lookups do not write: the access times of hits are kept in memory and
+    written in batches (see flush()), and the database runs in WAL mode, so
+    importing a large folder costs no fsync per file.
+    """
+
+    def __init__(self, db_path=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 version=PROBE_VERSION):
+        self.db_path = db_path or os.path.join(user_cache_dir(), "probe_cache.sqlite3")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._accessed = {}  # path -> last access time not written yet
+        self._stale = set()  # Paths whose file changed since they were cached, deleted on the next flush
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute("PRAGMA synchronous = NORMAL")
+        except sqlite3.DatabaseError:
+            pass  # e.g. a network filesystem without shared memory: keep the default rollback journal
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != version:
+            self._db.execute("DROP TABLE IF EXISTS probes")
+            self._db.execute(f"PRAGMA user_version = {int(version)}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS probes ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER,"
+            " data TEXT, last_access REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS probes_last_access ON probes (last_access)")
+        self._db.commit()
+        # Running totals, kept up to date by every insert and delete so eviction never scans the table
+        self._count, self._bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM probes"
+        ).fetchone()
+
+    def get(self, file_path):
+        """Cached streams for file_path, or None if missing or the file changed since"""
+        identity = file_identity(file_path)
+        if identity is None:
+            return None
+        key = os.path.abspath(file_path)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, inode, data FROM probes WHERE path = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if tuple(row[:3]) != identity:
+                self._stale.add(key)
+                self._accessed.pop(key, None)
+                return None
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= ACCESS_FLUSH_COUNT:
+                self._flush()
+        return json.loads(row[3])
+
+    def flush(self):
+        """Write pending access times and drop stale entries, in one transaction"""
+        with self._lock:
+            self._flush()
+
+    def put(self, file_path, streams):
+        identity = file_identity(file_path)
+        if identity is None:
+            return
+        key = os.path.abspath(file_path)
+        with self._lock:
+            self._stale.discard(key)
+            self._accessed.pop(key, None)
+            self._flush(commit=False)  # Eviction must see the current access times
+            data = json.dumps(streams, separators=(",", ":"))
+            self._delete([key])
+            self._db.execute(
+                "INSERT INTO probes (path, size, mtime_ns, inode, data, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, *identity, data, time.time()),
+            )
+            self._count += 1
+            self._bytes += len(data)
+            self._evict()
+            self._db.commit()
+
+    def invalidate(self, file_path):
+        with self._lock:
+            self._accessed.pop(os.path.abspath(file_path), None)
+            self._delete([os.path.abspath(file_path)])
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._accessed.clear()
+            self._stale.clear()
+            self._db.execute("DELETE FROM probes")
+            self._db.commit()
+            self._count = self._bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+    def _flush(self, commit=True):
+        if not self._accessed and not self._stale:
+            return
+        self._db.executemany("UPDATE probes SET last_access = ? WHERE path = ?",
+                             [(t, path) for path, t in self._accessed.items()])
+        self._delete(self._stale)
+        self._accessed.clear()
+        self._stale.clear()
+        if commit:
+            self._db.commit()
+
+    def _evict(self):
+        if self._count > self.max_entries:
+            self._delete(self._least_recent(self._count - self.max_entries))
+        while self._bytes > self.max_bytes and self._count:
+            # Drop the least recently used tenth until under the byte cap
+            self._delete(self._least_recent(max(1, self._count // 10)))
+
+    def _least_recent(self, limit):
+        return [row[0] for row in self._db.execute("SELECT path FROM probes ORDER BY last_access LIMIT ?", (limit,))]
+
+    def _delete(self, paths):
+        """Delete the rows of paths, keeping the running totals in step"""
+        for path in paths:
+            row = self._db.execute("SELECT LENGTH(data) FROM probes WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                continue
+            self._db.execute("DELETE FROM probes WHERE path = ?", (path,))
+            self._count -= 1
+            self._bytes -= row[0]
@@ -0,0 +1,108 @@
+import time
+
+# Ask ffmpeg for machine-readable key=value progress on stdout instead of the stderr stats line
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+
+def parse_time(value):
+    """Parse an ffmpeg HH:MM:SS.micro timestamp into seconds, or None"""
+    try:
+        hours, minutes, seconds = value.strip().split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (ValueError, AttributeError):
+        return None
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+def format_bytes(count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+
+class FfmpegProgress:
+    """Accumulates the key=value blocks ffmpeg writes with -progress.
+
+    feed() takes one line at a time and returns True whenever a complete
+    block (terminated by progress=continue/end) has been read, which is when
+    listeners should be told.
+    """
+
+    def __init__(self, duration=None):
+        self.duration = duration  # Expected output duration in seconds, from the probe
+        self.out_time = None
+        self.speed = None  # Multiple of realtime
+        self.bitrate = None  # kbit/s
+        self.total_size = 0
+        self.ended = False
+        self.started_at = time.monotonic()
+
+    def feed(self, line):
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return False
+        value = value.strip()
+        if key == "out_time":
+            self.out_time = parse_time(value)
+        elif key == "out_time_us" and self.out_time is None:
+            self.out_time = int(value) / 1000000 if value.lstrip("-").isdigit() else None
+        elif key == "speed":
+            self.speed = _parse_float(value.rstrip("x"))
+        elif key == "bitrate":
+            self.bitrate = _parse_float(value.replace("kbits/s", ""))
+        elif key == "total_size":
+            self.total_size = int(value) if value.isdigit() else self.total_size
+        elif key == "progress":
+            self.ended = value == "end"
+            return True
+        return False
+
+    @property
+    def fraction(self):
+        """Completed fraction in [0, 1], or None when the duration is unknown"""
+        if self.ended:
+            return 1.0
+        if not self.duration or self.out_time is None:
+            return None
+        return max(0.0, min(1.0, self.out_time / self.duration))
+
+    @property
+    def eta(self):
+        """Estimated seconds remaining, from the reported speed or the elapsed wall time"""
+        if self.ended:
+            return 0.0
+        if not self.duration or not self.out_time:
+            return None
+        remaining = max(0.0, self.duration - self.out_time)
+        if self.speed:
+            return remaining / self.speed
+        elapsed = time.monotonic() - self.started_at
+        return remaining * elapsed / self.out_time
+
+    def summary(self):
+        parts = [f"{format_duration(self.out_time)} / {format_duration(self.duration)}"]
+        if self.speed is not None:
+            parts.append(f"{self.speed:.2f}x")
+        if self.bitrate is not None:
+            parts.append(f"{self.bitrate:.0f} kbit/s")
+        parts.append(format_bytes(self.total_size))
+        if not self.ended:
+            parts.append(f"ETA {format_duration(self.eta)}")
+        return ", ".join(parts)
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -0,0 +1,281 @@
+"""Results of finished ffmpeg jobs, so an identical job does not run twice.
+
+A job is identified by its ffmpeg argv with every input replaced by a
+fingerprint of the file's content (for a concat demuxer list, of the list
+and every file it names), the staging names replaced by the real
+output paths, and the progress options dropped, plus the ffmpeg version.
+When a job with the same key finished before and its outputs are still the
+files it wrote (same size and modification time, or the same content
+checksum if only the timestamp moved), the JobQueue marks it done without
+running ffmpeg.
+
+Fingerprints and checksums hash a few evenly spaced samples of a file plus
+its size rather than every byte: that is enough to tell media files apart,
+and cheap even for files of many gigabytes.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+
+from app_dirs import user_cache_dir
+from ffmpeg_utils import FFMPEG
+from progress import PROGRESS_ARGS
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the key or the stored outputs change meaning
+RESULT_CACHE_VERSION = 2
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_MAX_AGE = 30 * 24 * 3600  # Seconds since an entry was last used
+SAMPLE_BYTES = 1024 * 1024
+SAMPLES = 4
+
+# Options that do not change what a job writes
+_IGNORED_ARGS = {"-hide_banner", "-y", "-n", *PROGRESS_ARGS}
+
+
+def sampled_hash(path, samples=SAMPLES, sample_bytes=SAMPLE_BYTES):
+    """Hex digest of a file's size and samples spread over its content (all of it for small files)"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(str(size).encode())
+        if size <= samples * sample_bytes:
+            for block in iter(lambda: f.read(sample_bytes), b""):
+                digest.update(block)
+        else:
+            step = (size - sample_bytes) // (samples - 1)
+            for n in range(samples):
+                f.seek(n * step)
+                digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
+
+def ffmpeg_version():
+    """First line of `ffmpeg -version`, or None if ffmpeg cannot be run"""
+    try:
+        result = subprocess.run([FFMPEG, "-version"], capture_output=True, text=True)
+    except OSError:
+        return None
+    lines = result.stdout.splitlines()
+    return lines[0].strip() if result.returncode == 0 and lines else None
+
+
+def concat_list_files(list_path):
+    """Paths named by the file directives of a concat demuxer list, or None if it cannot be read"""
+    base = os.path.dirname(os.path.abspath(list_path))
+    paths = []
+    try:
+        with open(list_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return None
+    for line in lines:
+        directive, _, rest = line.strip().partition(" ")
+        if directive != "file":
+            continue
+        path = _unquote(rest.strip())
+        if not path:
+            return None
+        paths.append(path if os.path.isabs(path) else os.path.join(base, path))
+    return paths
+
+
+class ResultCache:
+    """Persistent record of finished jobs and the outputs they produced.
+
+    Entries unused for max_age seconds are evicted, and the least recently
+    used ones once there are more than max_entries. An entry whose outputs
+    have been changed or deleted is dropped when it is next looked up.
+    """
+
+    def __init__(self, db_path=None, max_entries=DEFAULT_MAX_ENTRIES, max_age=DEFAULT_MAX_AGE,
+                 version=RESULT_CACHE_VERSION):
+        self.db_path = db_path or os.path.join(user_cache_dir(), "result_cache.sqlite3")
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._fingerprints = {}  # abspath -> ((size, mtime_ns, inode), sampled hash)
+        self._ffmpeg_version = None
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != version:
+            self._db.execute("DROP TABLE IF EXISTS results")
+            self._db.execute(f"PRAGMA user_version = {int(version)}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, outputs TEXT, created REAL, last_access REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self._db.commit()
+
+    def lookup(self, job):
+        """True if the job's outputs are already there from an identical earlier run"""
+        key = self.job_key(job)
+        if key is None:
+            return False
+        with self._lock:
+            row = self._db.execute("SELECT outputs FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        outputs = json.loads(row[0])
+        if not all(self._output_matches(output) for output in outputs):
+            self._delete(key)
+            return False
+        with self._lock:
+            self._db.execute("UPDATE results SET last_access = ?, outputs = ? WHERE key = ?",
+                             (time.time(), json.dumps(outputs), key))
+            self._db.commit()
+        return True
+
+    def store(self, job):
+        """Record the outputs of a job that finished successfully"""
+        key = self.job_key(job)
+        if key is None:
+            return
+        outputs = []
+        for path in job.output_files:
+            try:
+                st = os.stat(path)
+                outputs.append([os.path.abspath(path), st.st_size, st.st_mtime_ns, sampled_hash(path)])
+            except OSError:
+                return  # Not every output was written (e.g. an empty optional stream): nothing to reuse
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO results (key, outputs, created, last_access) VALUES (?, ?, ?, ?)",
+                             (key, json.dumps(outputs), now, now))
+            self._evict(now)
+            self._db.commit()
+
+    def job_key(self, job):
+        """Hex key of what a job does, or None if it cannot be cached (an input is not a plain file)"""
+        if not job.output_files:
+            return None
+        if self._ffmpeg_version is None:
+            self._ffmpeg_version = ffmpeg_version() or ""
+        if not self._ffmpeg_version:
+            return None
+        outputs = {os.path.abspath(p) for p in job.output_files}
+        parts = [self._ffmpeg_version]
+        previous = None
+        input_format = None
+        for arg in job.command[1:]:
+            arg = job.staged.get(arg, arg)
+            if arg in _IGNORED_ARGS:
+                pass
+            elif previous == "-i":
+                fingerprint = self.input_fingerprint(arg, input_format)
+                if fingerprint is None:
+                    return None
+                parts.append(f"input:{fingerprint}")
+                input_format = None
+            elif previous == "-f":
+                input_format = arg
+                parts.append(arg)
+            elif os.path.abspath(arg) in outputs:
+                parts.append(f"output:{os.path.abspath(arg)}")
+            else:
+                parts.append(arg)
+            previous = arg
+        return hashlib.blake2b("\0".join(parts).encode(), digest_size=20).hexdigest()
+
+    def input_fingerprint(self, path, input_format=None):
+        """Fingerprint of an input and, for a concat demuxer list, of every file it names; None if unknown"""
+        fingerprint = self.fingerprint(path)
+        if fingerprint is None or input_format != "concat":
+            return fingerprint
+        segments = concat_list_files(path)
+        if segments is None:
+            return None
+        fingerprints = [fingerprint]
+        for segment in segments:
+            fingerprints.append(self.fingerprint(segment))
+            if fingerprints[-1] is None:
+                return None
+        return hashlib.blake2b(":".join(fingerprints).encode(), digest_size=20).hexdigest()
+
+    def fingerprint(self, path):
+        """Sampled hash of a file, remembered for as long as its size, mtime and inode stay the same"""
+        key = os.path.abspath(path)
+        try:
+            st = os.stat(key)
+        except OSError:
+            return None
+        identity = (st.st_size, st.st_mtime_ns, st.st_ino)
+        cached = self._fingerprints.get(key)
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+        try:
+            digest = sampled_hash(key)
+        except OSError:
+            return None
+        self._fingerprints[key] = (identity, digest)
+        return digest
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _output_matches(self, output):
+        path, size, mtime_ns, checksum = output
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if st.st_size != size:
+            return False
+        if st.st_mtime_ns != mtime_ns:
+            # Touched or copied back: trust it only if the content is the same
+            try:
+                if sampled_hash(path) != checksum:
+                    return False
+            except OSError:
+                return False
+            output[2] = st.st_mtime_ns
+        return True
+
+    def _delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM results WHERE last_access < ?", (now - self.max_age,))
+        count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+def _unquote(token):
+    """A concat list token with ffmpeg's quoting ('...' sections and backslash escapes) removed"""
+    chars = []
+    quoted = False
+    escaped = False
+    for c in token:
+        if escaped:
+            chars.append(c)
+            escaped = False
+        elif quoted:
+            if c == "'":
+                quoted = False
+            else:
+                chars.append(c)
+        elif c == "\\":
+            escaped = True
+        elif c == "'":
+            quoted = True
+        else:
+            chars.append(c)
+    return "".join(chars)
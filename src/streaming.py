@@ -0,0 +1,221 @@
+"""Extraction straight to a consumer instead of to files.
+
+The selected streams of one input are muxed into a streamable container
+(Matroska by default) and written to one sink:
+
+  - stdout ("-"): ffmpeg writes to pipe:1, e.g. `... extract --to - | asr`;
+  - a named pipe (any other path; created if missing);
+  - a TCP or Unix socket ("tcp://HOST:PORT", "unix:PATH"). ffmpeg connects
+    to a listening consumer, or with serve=True listens itself and waits for
+    one consumer to connect.
+
+Nothing touches the disk, and the consumer can work on the first packets
+while the input is still being demuxed. Backpressure comes from the pipe or
+socket itself: when the consumer falls behind, ffmpeg blocks on its next
+write and stops reading the input until there is room again.
+"""
+import logging
+import os
+import stat
+import subprocess
+import threading
+
+from ffmpeg_utils import FfmpegCommand, stream_map
+
+logger = logging.getLogger(__name__)
+
+STDOUT = "stdout"
+FIFO = "fifo"
+TCP = "tcp"
+UNIX = "unix"
+
+DEFAULT_FORMAT = "matroska"
+# Text subtitle formats need their subtitles converted; every other container gets a stream copy
+SUBTITLE_CODECS = {"srt": "srt", "webvtt": "webvtt", "ass": "ass"}
+# MP4/MOV need to seek back to write the index unless they are fragmented
+FRAGMENTED_FORMATS = ("mp4", "mov", "ipod", "ismv")
+CHUNK_SIZE = 64 * 1024
+
+
+class StreamSink:
+    """Where a streamed extraction is written"""
+
+    def __init__(self, kind, address=None, serve=False):
+        if serve and kind not in (TCP, UNIX):
+            raise ValueError("Only a TCP or Unix socket sink can wait for a consumer to connect")
+        self.kind = kind
+        self.address = address  # FIFO or socket path, or "host:port"
+        self.serve = serve
+
+    @classmethod
+    def parse(cls, spec, serve=False):
+        """A sink from a command-line spec: "-", "tcp://HOST:PORT", "unix:PATH" or a named pipe path"""
+        if spec == "-":
+            return cls(STDOUT, serve=serve)
+        if spec.startswith("tcp://"):
+            host, sep, port = spec[len("tcp://"):].rstrip("/").rpartition(":")
+            if not sep or not host or not port.isdigit():
+                raise ValueError(f"Invalid TCP sink {spec!r}, expected tcp://HOST:PORT")
+            return cls(TCP, f"{host}:{port}", serve)
+        if spec.startswith("unix:"):
+            path = spec[len("unix:"):]
+            if not path:
+                raise ValueError(f"Invalid Unix socket sink {spec!r}, expected unix:PATH")
+            return cls(UNIX, path, serve)
+        return cls(FIFO, spec, serve)
+
+    @property
+    def url(self):
+        """The output URL given to ffmpeg"""
+        if self.kind == STDOUT:
+            return "pipe:1"
+        if self.kind == TCP:
+            return f"tcp://{self.address}"
+        if self.kind == UNIX:
+            return f"unix:{self.address}"
+        return self.address
+
+    def options(self):
+        """Protocol options placed before the output URL"""
+        return ["-listen", "1"] if self.serve else []
+
+    def prepare(self):
+        """Create a missing named pipe; returns True if it was created (and should be removed afterwards).
+
+        Raises ValueError for an existing path that is not a named pipe, so a
+        regular file is never overwritten by a stream.
+        """
+        if self.kind != FIFO:
+            return False
+        try:
+            mode = os.stat(self.address).st_mode
+        except FileNotFoundError:
+            os.mkfifo(self.address)
+            return True
+        if not stat.S_ISFIFO(mode):
+            raise ValueError(f"{self.address} exists and is not a named pipe")
+        return False
+
+    def __repr__(self):
+        return f"<StreamSink {self.url}{' (serve)' if self.serve else ''}>"
+
+
+def stream_command(plan, sink, container=DEFAULT_FORMAT):
+    """The ffmpeg command writing every target of an ExtractionPlan into one container on a sink.
+
+    The targets' output file names are not used: all of them end up as
+    tracks of the one streamed container.
+    """
+    codecs = {"": "copy"}
+    if container in SUBTITLE_CODECS:
+        codecs = {"s": SUBTITLE_CODECS[container]}
+    options = ["-f", container]
+    if container in FRAGMENTED_FORMATS:
+        options += ["-movflags", "frag_keyframe+empty_moov"]
+    command = FfmpegCommand()
+    command.add_input(plan.input_file)
+    command.add_output(sink.url, [stream_map(0, t.stream_type, t.rel_index) for t in plan.targets], codecs,
+                       options=options + sink.options())
+    return command
+
+
+def run_stream(command, sink):
+    """Run a streaming command to completion; returns (exit code, ffmpeg's error output).
+
+    With a stdout sink ffmpeg writes straight to this process's stdout, so
+    the stream reaches the consumer of our own output without passing
+    through Python.
+    """
+    created = sink.prepare()
+    try:
+        process = subprocess.Popen(command.argv(), stdin=subprocess.DEVNULL,
+                                   stdout=None if sink.kind == STDOUT else subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, text=True)
+        _, stderr = process.communicate()
+    finally:
+        if created:
+            _remove_fifo(sink.address)
+    _log_stream(command, sink, process.returncode, stderr)
+    return process.returncode, stderr
+
+
+def open_stream(plan, container=DEFAULT_FORMAT):
+    """Start streaming the targets of an ExtractionPlan and return a StreamReader on the container"""
+    return StreamReader(stream_command(plan, StreamSink(STDOUT), container))
+
+
+class StreamReader:
+    """File-like access to the output of a streaming command writing to stdout.
+
+    Data is read as ffmpeg produces it, and ffmpeg waits whenever the reader
+    does not keep up. Use it as a context manager: leaving the block early
+    stops ffmpeg, and close() raises RuntimeError if ffmpeg failed.
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.returncode = None
+        self.stderr = ""
+        self._stderr_chunks = []
+        self._eof = False
+        self._process = subprocess.Popen(command.argv(), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE)
+        # Drain stderr on its own thread so a chatty ffmpeg cannot block on a full pipe
+        self._stderr_reader = threading.Thread(
+            target=lambda: self._stderr_chunks.append(self._process.stderr.read()), daemon=True)
+        self._stderr_reader.start()
+
+    def read(self, size=-1):
+        data = self._process.stdout.read(size)
+        if not data or size is None or size < 0:
+            self._eof = True
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self._process.stdout.read1(CHUNK_SIZE)
+            if not chunk:
+                self._eof = True
+                return
+            yield chunk
+
+    def close(self):
+        """Wait for ffmpeg, stopping it first if its output was not read to the end"""
+        if self.returncode is not None:
+            return
+        stopped = not self._eof and self._process.poll() is None
+        if stopped:
+            self._process.terminate()
+        self._process.stdout.close()
+        self._process.wait()
+        self._stderr_reader.join()
+        self.returncode = self._process.returncode
+        self.stderr = b"".join(self._stderr_chunks).decode(errors="replace")
+        if not stopped:
+            _log_stream(self.command, StreamSink(STDOUT), self.returncode, self.stderr)
+            if self.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed with exit code {self.returncode}: {self.stderr[-2000:]}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._eof = False  # Stop ffmpeg rather than wait for it, and let the exception through
+        self.close()
+
+
+def _log_stream(command, sink, returncode, stderr):
+    fields = {"stream": {"command": command.argv(), "sink": sink.url, "exit_code": returncode}}
+    if returncode != 0:
+        fields["stream"]["stderr"] = stderr[-4000:]
+        logger.error(f"Streaming to {sink.url} failed", extra={"fields": fields})
+    else:
+        logger.info(f"Streamed to {sink.url}", extra={"fields": fields})
+
+
+def _remove_fifo(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Cannot remove named pipe {path}: {e}")
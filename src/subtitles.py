@@ -0,0 +1,393 @@
+"""Native SRT/ASS reading, writing and retiming.
+
+External subtitle files are small text files; parsing them in-process takes
+milliseconds, where an ffmpeg or ffprobe run costs a process start and a
+full demux. Files are read as a stream of cues, so shifting, retiming and
+converting a file never holds more than one cue in memory:
+
+    with open_subtitles("movie.it.srt") as reader, open_writer("movie.it.ass", "ass") as writer:
+        for cue in shift_cues(reader, 1.5):
+            writer.write(cue)
+
+Input encodings are detected (BOMs, UTF-8, else a legacy 8-bit code page)
+and output is always UTF-8.
+"""
+import codecs
+import os
+import re
+
+from languages import language_from_filename, language_from_text
+
+SRT = "srt"
+ASS = "ass"
+# ffprobe codec names, so natively probed files look like ffprobe's
+CODEC_NAMES = {SRT: "subrip", ASS: "ass"}
+FORMATS_BY_EXTENSION = {".srt": SRT, ".ass": ASS, ".ssa": ASS}
+
+# Code page tried when a file is not valid UTF-8 (the most common one for Western subtitles)
+FALLBACK_ENCODING = "cp1252"
+# Bytes read to detect the encoding
+ENCODING_SAMPLE = 64 * 1024
+# Characters of cue text sampled for language detection
+LANGUAGE_SAMPLE = 4000
+
+_SRT_TIMING = re.compile(
+    r"(\d+):(\d{1,2}):(\d{1,2})(?:[,.](\d{1,3}))?\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})(?:[,.](\d{1,3}))?")
+_ASS_TIME = re.compile(r"(\d+):(\d{1,2}):(\d{1,2})(?:\.(\d{1,3}))?$")
+_ASS_OVERRIDE = re.compile(r"\{[^}]*\}")
+_SRT_TAG = re.compile(r"</?(i|b|u)>", re.IGNORECASE)
+
+ASS_EVENT_FIELDS = ["Layer", "Start", "End", "Style", "Name", "MarginL", "MarginR", "MarginV", "Effect", "Text"]
+
+# Header written when SRT is converted to ASS (as ffmpeg writes it)
+DEFAULT_ASS_HEADER = [
+    "[Script Info]",
+    "ScriptType: v4.00+",
+    "PlayResX: 384",
+    "PlayResY: 288",
+    "",
+    "[V4+ Styles]",
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+    "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, "
+    "MarginR, MarginV, Encoding",
+    "Style: Default,Arial,16,&Hffffff,&Hffffff,&H0,&H0,0,0,0,0,100,100,0,0,1,1,0,2,10,10,10,0",
+    "",
+]
+
+
+class Cue:
+    """One subtitle event: times in seconds and the text in its source format's markup"""
+
+    __slots__ = ("start", "end", "text", "format", "fields")
+
+    def __init__(self, start, end, text, format=SRT, fields=None):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.format = format
+        self.fields = fields  # The other ASS event fields (Layer, Style, ...), None for SRT
+
+    def plain_text(self):
+        """The text without markup, lines separated by newlines"""
+        if self.format == ASS:
+            return ass_to_srt_text(self.text, keep_tags=False)
+        return _SRT_TAG.sub("", self.text)
+
+    def __repr__(self):
+        return f"<Cue {self.start:.3f}-{self.end:.3f} {self.text[:30]!r}>"
+
+
+def subtitle_format(path):
+    """SRT or ASS from the file extension, or None"""
+    return FORMATS_BY_EXTENSION.get(os.path.splitext(path)[1].lower())
+
+
+def detect_encoding(sample, fallback=FALLBACK_ENCODING, complete=False):
+    """Text encoding of a file from its first bytes: a BOM, else UTF-8 if it decodes, else fallback.
+
+    complete says the sample is the whole file, so it cannot end in the
+    middle of a character.
+    """
+    for bom, encoding in ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"),
+                          (codecs.BOM_UTF16_BE, "utf-16")):
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # The sample may end in the middle of a character, so decode it incrementally
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=complete)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return fallback
+
+
+class SubtitleReader:
+    """Iterates over the cues of an SRT or ASS file, parsing as it reads.
+
+    For ASS files, header holds every line before the first event (script
+    info, styles and the [Events] Format line), and event_fields the event
+    field names in file order.
+    """
+
+    def __init__(self, path, encoding=None, format=None):
+        self.path = path
+        self.format = format or subtitle_format(path) or SRT
+        if encoding is None:
+            with open(path, "rb") as f:
+                sample = f.read(ENCODING_SAMPLE)
+            encoding = detect_encoding(sample, complete=len(sample) < ENCODING_SAMPLE)
+        self.encoding = encoding
+        self.header = []
+        self.event_fields = list(ASS_EVENT_FIELDS)
+        self._file = open(path, encoding=encoding, errors="replace", newline=None)
+        self._pending = None
+        if self.format == ASS:
+            try:
+                self._read_ass_header()
+            except Exception:
+                self._file.close()
+                raise
+
+    def __iter__(self):
+        if self.format == ASS:
+            return self._iter_ass()
+        return _iter_srt(self._file)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_ass_header(self):
+        in_events = False
+        for line in self._file:
+            line = line.rstrip("\r\n")
+            stripped = line.strip()
+            if stripped.startswith("["):
+                in_events = stripped.lower() == "[events]"
+            elif in_events and stripped.lower().startswith("format:"):
+                self.event_fields = [f.strip() for f in stripped.split(":", 1)[1].split(",")]
+            elif in_events and _ass_event_kind(stripped):
+                self._pending = line
+                return
+            self.header.append(line)
+
+    def _iter_ass(self):
+        if self._pending is not None:
+            cue = self._parse_ass_line(self._pending)
+            self._pending = None
+            if cue:
+                yield cue
+        for line in self._file:
+            cue = self._parse_ass_line(line.rstrip("\r\n"))
+            if cue:
+                yield cue
+
+    def _parse_ass_line(self, line):
+        if _ass_event_kind(line.strip()) != "Dialogue":
+            return None  # Comments and other sections after the events are not cues
+        values = line.split(":", 1)[1].lstrip().split(",", len(self.event_fields) - 1)
+        if len(values) < len(self.event_fields):
+            return None
+        fields = dict(zip(self.event_fields, values))
+        start, end = parse_ass_time(fields.pop("Start")), parse_ass_time(fields.pop("End"))
+        if start is None or end is None:
+            return None
+        return Cue(start, end, fields.pop("Text", ""), ASS, fields)
+
+
+def open_subtitles(path, encoding=None):
+    return SubtitleReader(path, encoding)
+
+
+class SubtitleWriter:
+    """Writes cues as SRT or ASS (UTF-8), converting markup from the other format as needed"""
+
+    def __init__(self, path, format=None, header=None, event_fields=None):
+        self.path = path
+        self.format = format or subtitle_format(path) or SRT
+        self.count = 0
+        self.event_fields = event_fields or list(ASS_EVENT_FIELDS)
+        self._file = open(path, "w", encoding="utf-8", newline="\n")
+        if self.format == ASS:
+            for line in header or DEFAULT_ASS_HEADER:
+                self._file.write(line + "\n")
+            if not any(line.strip().lower() == "[events]" for line in header or []):
+                self._file.write("[Events]\nFormat: " + ", ".join(self.event_fields) + "\n")
+
+    def write(self, cue):
+        self.count += 1
+        if self.format == ASS:
+            self._file.write(self._ass_line(cue) + "\n")
+        else:
+            text = ass_to_srt_text(cue.text) if cue.format == ASS else cue.text
+            self._file.write(f"{self.count}\n{format_srt_time(cue.start)} --> {format_srt_time(cue.end)}\n{text}\n\n")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _ass_line(self, cue):
+        text = cue.text if cue.format == ASS else srt_to_ass_text(cue.text)
+        fields = dict(cue.fields or {})
+        fields.update(Start=format_ass_time(cue.start), End=format_ass_time(cue.end), Text=text)
+        defaults = {"Layer": "0", "Style": "Default", "MarginL": "0", "MarginR": "0", "MarginV": "0"}
+        return "Dialogue: " + ",".join(fields.get(name, defaults.get(name, "")) for name in self.event_fields)
+
+
+def open_writer(path, format=None, reader=None):
+    """A writer for path; given the reader of an ASS source, its header and styles are kept"""
+    if reader is not None and reader.format == ASS:
+        return SubtitleWriter(path, format, reader.header, reader.event_fields)
+    return SubtitleWriter(path, format)
+
+
+def shift_cues(cues, seconds):
+    """Move every cue by seconds; cues shifted entirely before zero are dropped"""
+    for cue in cues:
+        cue.start, cue.end = cue.start + seconds, cue.end + seconds
+        if cue.end <= 0:
+            continue
+        cue.start = max(0.0, cue.start)
+        yield cue
+
+
+def retime_cues(cues, from_fps, to_fps):
+    """Rescale cue times for a video played at to_fps instead of from_fps (e.g. 23.976 -> 25 PAL speed-up)"""
+    factor = from_fps / to_fps
+    for cue in cues:
+        cue.start, cue.end = cue.start * factor, cue.end * factor
+        yield cue
+
+
+def convert_subtitles(input_file, output_file, shift=0.0, fps=None, output_format=None, encoding=None):
+    """Shift, retime and/or convert one subtitle file to UTF-8 SRT/ASS; returns the number of cues written"""
+    with open_subtitles(input_file, encoding) as reader:
+        cues = iter(reader)
+        if fps:
+            cues = retime_cues(cues, *fps)
+        if shift:
+            cues = shift_cues(cues, shift)
+        with open_writer(output_file, output_format, reader) as writer:
+            for cue in cues:
+                writer.write(cue)
+            return writer.count
+
+
+def detect_language(path, reader=None):
+    """Language of a subtitle file: its file name suffix, else a guess from a sample of its text"""
+    language = language_from_filename(path)
+    if language:
+        return language
+    text = []
+    size = 0
+    with (reader or open_subtitles(path)) as cues:
+        for cue in cues:
+            text.append(cue.plain_text())
+            size += len(text[-1])
+            if size >= LANGUAGE_SAMPLE:
+                break
+    return language_from_text(" ".join(text))
+
+
+def subtitle_info(path):
+    """ffprobe-style info ({"streams", "format"}) of an external subtitle file, read natively.
+
+    Lets probe_files skip ffprobe for .srt/.ass files; the language tag comes
+    from the file name or, failing that, the text. Raises ValueError if the
+    file has no cues in the format its extension promises.
+    """
+    format = subtitle_format(path)
+    end = 0.0
+    count = 0
+    text = []
+    size = 0
+    with open_subtitles(path) as reader:
+        for cue in reader:
+            count += 1
+            end = max(end, cue.end)
+            if size < LANGUAGE_SAMPLE:
+                text.append(cue.plain_text())
+                size += len(text[-1])
+        encoding = reader.encoding
+    if not count:
+        raise ValueError(f"No {format.upper()} cues in {path}")
+    language = language_from_filename(path) or language_from_text(" ".join(text))
+    stream = {"index": 0, "codec_type": "subtitle", "codec_name": CODEC_NAMES[format], "duration": f"{end:.6f}",
+              "disposition": {"default": 0, "forced": int(".forced." in os.path.basename(path).lower())},
+              "tags": {"NUMBER_OF_FRAMES": str(count)}}
+    if language:
+        stream["tags"]["language"] = language
+    return {
+        "streams": [stream],
+        "format": {"filename": path, "format_name": format, "duration": f"{end:.6f}",
+                   "size": str(os.path.getsize(path)), "nb_streams": 1, "encoding": encoding},
+    }
+
+
+def parse_srt_time(hours, minutes, seconds, millis):
+    millis = (millis or "0").ljust(3, "0")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+
+def parse_ass_time(value):
+    """Seconds from an ASS timestamp such as "0:01:02.50", or None"""
+    match = _ASS_TIME.match(value.strip())
+    if not match:
+        return None
+    hours, minutes, seconds, fraction = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int((fraction or "0").ljust(3, "0")) / 1000
+
+
+def format_srt_time(seconds):
+    millis = max(0, round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def format_ass_time(seconds):
+    centis = max(0, round(seconds * 100))
+    hours, centis = divmod(centis, 360_000)
+    minutes, centis = divmod(centis, 6000)
+    secs, centis = divmod(centis, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centis:02d}"
+
+
+def ass_to_srt_text(text, keep_tags=True):
+    """ASS event text as SRT text: line breaks converted, italic/bold/underline kept as tags"""
+    if keep_tags:
+        for flag, tag in (("i", "i"), ("b", "b"), ("u", "u")):
+            text = text.replace(f"{{\\{flag}1}}", f"<{tag}>").replace(f"{{\\{flag}0}}", f"</{tag}>")
+    text = _ASS_OVERRIDE.sub("", text)
+    return text.replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ")
+
+
+def srt_to_ass_text(text):
+    for tag in ("i", "b", "u"):
+        text = re.sub(f"<{tag}>", f"{{\\\\{tag}1}}", text, flags=re.IGNORECASE)
+        text = re.sub(f"</{tag}>", f"{{\\\\{tag}0}}", text, flags=re.IGNORECASE)
+    return text.replace("\n", "\\N")
+
+
+def _iter_srt(lines):
+    """Cues of an SRT stream; tolerates missing counters, "." decimal separators and stray blank lines"""
+    timing = None
+    text = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = _SRT_TIMING.search(line)
+        if match:
+            if timing is not None:
+                # A new timing line without a blank line first: the previous cue ended, drop its counter line
+                if text and text[-1].strip().isdigit():
+                    text.pop()
+                yield Cue(timing[0], timing[1], "\n".join(text).strip("\n"))
+            groups = match.groups()
+            timing = (parse_srt_time(*groups[:4]), parse_srt_time(*groups[4:]))
+            text = []
+        elif timing is not None:
+            if line.strip():
+                text.append(line)
+            elif text:
+                yield Cue(timing[0], timing[1], "\n".join(text))
+                timing, text = None, []
+    if timing is not None:
+        yield Cue(timing[0], timing[1], "\n".join(text))
+
+
+def _ass_event_kind(line):
+    """ "Dialogue" or "Comment" for ASS event lines, else None"""
+    for kind in ("Dialogue", "Comment"):
+        if line.startswith(kind + ":"):
+            return kind
+    return None
@@ -0,0 +1,186 @@
+"""Thumbnails and contact sheets of video streams, kept in a size-bounded disk cache.
+
+All previews of a file come from one ffmpeg run, and every video stream
+gets two outputs:
+
+  - a thumbnail: the keyframe at or before 10% of the duration;
+  - a contact sheet: a grid of keyframes at even intervals.
+
+Every tile (and the thumbnail) is read through its own input, seeked to its
+time and decoding keyframes only (-skip_frame nokey). A preview therefore
+reads a keyframe or so per tile, not the whole file, which matters for
+large files on network shares.
+
+Images are named after the file's path and identity (size, mtime, inode),
+the stream and the layout. A changed file therefore never shows stale
+previews, and the previews of an unchanged file are only ever decoded once.
+Once the directory holds more than max_bytes, the least recently used images
+are removed first.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from app_dirs import user_cache_dir
+from ffmpeg_utils import FfmpegCommand, stream_map
+from jobs import Job
+from output_policy import OutputPolicy
+from probe_cache import file_identity
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTH = 160
+THUMBNAIL_POSITION = 0.1  # Fraction of the duration: skips black frames and studio logos at the start
+SHEET_COLUMNS = 4
+SHEET_ROWS = 4
+SHEET_TILE_WIDTH = 240
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+IMAGE_EXTENSION = ".jpg"
+# -update 1: one image file written in place, not a numbered sequence
+IMAGE_OPTIONS = ["-frames:v", "1", "-q:v", "3", "-update", "1"]
+
+
+class ThumbnailCache:
+    """Directory of preview images keyed by file fingerprint, stream and layout"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, columns=SHEET_COLUMNS, rows=SHEET_ROWS,
+                 thumbnail_width=THUMBNAIL_WIDTH, tile_width=SHEET_TILE_WIDTH):
+        self.directory = directory or os.path.join(user_cache_dir(), "thumbnails")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.columns = columns
+        self.rows = rows
+        self.thumbnail_width = thumbnail_width
+        self.tile_width = tile_width
+        self._policy = OutputPolicy()  # Images are written under a partial name and renamed when complete
+        self._total = None  # Bytes in the directory, counted on first use
+        self._lock = threading.Lock()
+
+    def paths(self, path, stream_index):
+        """(thumbnail, contact sheet) image paths for a stream, or None if the file cannot be stat'ed"""
+        identity = file_identity(path)
+        if identity is None:
+            return None
+        key = hashlib.blake2b(repr((os.path.abspath(path), identity, stream_index, self.columns, self.rows,
+                                    self.thumbnail_width, self.tile_width)).encode(), digest_size=16).hexdigest()
+        return (os.path.join(self.directory, f"{key}.thumb{IMAGE_EXTENSION}"),
+                os.path.join(self.directory, f"{key}.sheet{IMAGE_EXTENSION}"))
+
+    def get(self, path, stream_index):
+        """(thumbnail, contact sheet) of a stream if both are cached, else None"""
+        paths = self.paths(path, stream_index)
+        if paths is None or not all(os.path.exists(p) for p in paths):
+            return None
+        now = time.time()
+        for image in paths:
+            try:
+                os.utime(image, (now, now))  # The modification time is the LRU clock
+            except OSError:
+                return None
+        return paths
+
+    def preview_job(self, record):
+        """One Job writing the missing previews of every video stream of a probed file, or None"""
+        if not record.duration:
+            return None
+        streams = [s for s in record.of_type("video") if not s.attached_pic]
+        outputs = {s.index: self.paths(record.path, s.index) for s in streams}
+        missing = [s for s in streams if outputs[s.index] and not self.get(record.path, s.index)]
+        if not missing:
+            return None
+        command = FfmpegCommand()
+        tiles = self.columns * self.rows
+        interval = record.duration / tiles
+        # Input seeks count from the start of the file, whatever its start time
+        tile_inputs = [_seeked_input(command, record.path, (n + 0.5) * interval) for n in range(tiles)]
+        thumbnail_input = _seeked_input(command, record.path, record.duration * THUMBNAIL_POSITION)
+        graphs = []
+        for stream in missing:
+            thumbnail, sheet = outputs[stream.index]
+            label = f"s{stream.index}"
+            for n, input_index in enumerate(tile_inputs):
+                graphs.append(f"[{stream_map(input_index, 'video', stream.rel_index)}]"
+                              f"{_first_frame(self.tile_width)}[{label}t{n}]")
+            graphs.append("".join(f"[{label}t{n}]" for n in range(tiles)) +
+                          f"concat=n={tiles}:v=1:a=0,tile={self.columns}x{self.rows}[{label}sheet]")
+            graphs.append(f"[{stream_map(thumbnail_input, 'video', stream.rel_index)}]"
+                          f"{_first_frame(self.thumbnail_width)}[{label}thumb]")
+            command.add_output(thumbnail, [f"[{label}thumb]"], codecs={}, options=IMAGE_OPTIONS)
+            command.add_output(sheet, [f"[{label}sheet]"], codecs={}, options=IMAGE_OPTIONS)
+        command.global_options += ["-filter_complex", ";".join(graphs)]
+        job = Job(command.argv(), f"Preview {os.path.basename(record.path)}", input_file=record.path,
+                  output_files=command.output_files, media_duration=record.duration)
+        return self._policy.stage(job)
+
+    def commit(self, job):
+        """Count the images written by a finished preview job, evicting old ones past max_bytes"""
+        written = 0
+        for image in job.output_files:
+            try:
+                written += os.path.getsize(image)
+            except OSError:
+                pass
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._images())
+            else:
+                self._total += written
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for image, _, _ in self._images():
+                _remove(image)
+            self._total = 0
+
+    def _evict(self):
+        # Down to 90% of the limit, so the next few previews do not each trigger a scan
+        target = self.max_bytes * 0.9
+        images = sorted(self._images(), key=lambda entry: entry[2])
+        self._total = sum(size for _, size, _ in images)
+        for image, size, _ in images:
+            if self._total <= target:
+                break
+            if _remove(image):
+                self._total -= size
+
+    def _images(self):
+        """(path, size, mtime) of every cached image"""
+        images = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return images
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.name.endswith(IMAGE_EXTENSION):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            images.append((entry.path, st.st_size, st.st_mtime))
+        return images
+
+
+def _seeked_input(command, path, seconds):
+    """Input index of path seeked to the keyframe at or before seconds, decoding keyframes only"""
+    return command.add_input(path, ["-skip_frame", "nokey", "-noaccurate_seek", "-ss", f"{seconds:.3f}"])
+
+
+def _first_frame(width):
+    """Filter chain keeping the first decoded frame of an input, scaled to width"""
+    return f"trim=end_frame=1,scale={width}:-2,setsar=1"
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return True
+    except OSError as e:
+        logger.warning(f"Cannot remove cached preview {path}: {e}")
+        return False
@@ -0,0 +1,163 @@
+"""Chunked parallel transcoding.
+
+A single encoder process stops scaling long before it uses every core of a
+large machine. Instead, the main video stream is cut at keyframes into
+chunks, every chunk is encoded by its own ffmpeg process with a few threads,
+and the encoded chunks are joined with the concat demuxer by stream copy:
+
+    K0 ======== K7 ======== K12 ======== K20 ... end
+    [ chunk 0 ] [ chunk 1 ] [  chunk 2  ] [ ... ]   (encoded in parallel)
+
+Cutting on keyframes means every chunk decodes on its own, so no frame is
+lost or duplicated at the joins. Audio is encoded once, in its own job, since
+audio encoders are cheap and their priming samples would leave gaps at every
+chunk boundary. Subtitles, chapters and metadata are copied from the source
+when the chunks are muxed into the output.
+"""
+import os
+import shutil
+import tempfile
+
+from ffmpeg_utils import FfmpegCommand, stream_map, write_concat_list
+from trim import KEYFRAME_TOLERANCE, SEEK_NUDGE, keyframe_at_or_before, relative_keyframes
+
+# Encoder threads per chunk; the number of chunks encoded at once is cores / this
+DEFAULT_CHUNK_THREADS = 4
+# Chunks shorter than this cost more in process start-up and encoder lookahead than they save
+MIN_CHUNK_SECONDS = 10.0
+# Containers that can take the source's subtitle streams as they are
+SUBTITLE_CONTAINERS = (".mkv", ".mka", ".mks")
+
+
+def parallel_chunks(threads=DEFAULT_CHUNK_THREADS):
+    """How many chunks to encode at once on this machine"""
+    return max(1, (os.cpu_count() or 1) // max(1, threads))
+
+
+def chunk_bounds(keyframes, duration, count, min_length=MIN_CHUNK_SECONDS):
+    """[(start, end)] of up to count chunks of about equal length, each starting on a keyframe"""
+    points = []
+    for n in range(1, count):
+        point = keyframe_at_or_before(keyframes, duration * n / count)
+        if point is None or point - (points[-1] if points else 0.0) < min_length:
+            continue
+        if duration - point < min_length:
+            break
+        points.append(point)
+    starts = [0.0] + points
+    return list(zip(starts, points + [duration]))
+
+
+class TranscodeChunk:
+    def __init__(self, number, start, end):
+        self.number = number
+        self.start = start
+        self.end = end
+        self.path = None  # Set when the plan assigns where the chunk is written
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class TranscodePlan:
+    """How to re-encode a file in keyframe-aligned chunks and put it back together.
+
+    video_options and audio_options are extra encoder options, e.g.
+    ["-crf", "20", "-preset", "slow"]; audio_codec "copy" keeps the source audio.
+    """
+
+    def __init__(self, record, output_file, video_codec="libx264", video_options=(), audio_codec="copy",
+                 audio_options=(), chunks=None, threads=DEFAULT_CHUNK_THREADS):
+        self.record = record
+        self.input_file = record.path
+        self.output_file = output_file
+        self.video = record.main_video()
+        if self.video is None:
+            raise ValueError(f"{record.path} has no video stream to transcode")
+        if not record.duration:
+            raise ValueError(f"Unknown duration of {record.path}")
+        self.video_codec = video_codec
+        self.video_options = list(video_options)
+        self.audio_codec = audio_codec
+        self.audio_options = list(audio_options)
+        self.threads = threads
+        count = chunks or 2 * parallel_chunks(threads)  # Twice the workers, so a slow chunk does not hold up the end
+        keyframes = relative_keyframes(record) or [0.0]
+        self.chunks = [TranscodeChunk(n, start, end)
+                       for n, (start, end) in enumerate(chunk_bounds(keyframes, record.duration, count))]
+        self.audio_file = None
+        self.work_dir = None
+
+    @property
+    def has_audio(self):
+        return bool(self.record.of_type("audio"))
+
+    def summary(self):
+        audio = "copied" if self.audio_codec == "copy" else f"encoded once with {self.audio_codec}"
+        return (f"Encoding {self.record.duration:.1f}s of video with {self.video_codec} in {len(self.chunks)} "
+                f"keyframe-aligned chunk(s) of about {self.record.duration / len(self.chunks):.1f}s; audio {audio}")
+
+    def chunk_commands(self, progress=False):
+        """(chunk, argv) encoding every chunk of the main video stream"""
+        for chunk in self.chunks:
+            chunk.path = os.path.join(self._work_dir(), f"chunk_{chunk.number:04d}.mkv")
+        return [(chunk, self._chunk_command(chunk, progress).argv()) for chunk in self.chunks]
+
+    def audio_command(self, progress=False):
+        """argv encoding every audio stream in one pass, or None when audio is copied (or absent)"""
+        if self.audio_codec == "copy" or not self.has_audio:
+            return None
+        self.audio_file = os.path.join(self._work_dir(), "audio.mka")
+        command = FfmpegCommand(progress=progress)
+        command.add_input(self.input_file)
+        command.add_output(self.audio_file, [stream_map(0, "audio")], {"a": self.audio_codec},
+                           options=self.audio_options)
+        return command.argv()
+
+    def mux_command(self, progress=False):
+        """argv joining the encoded chunks by stream copy, with the audio, subtitles and metadata"""
+        list_path = write_concat_list([c.path for c in self.chunks], os.path.join(self._work_dir(), "chunks.txt"))
+        command = FfmpegCommand(progress=progress)
+        chunks = command.add_input(list_path, ["-f", "concat", "-safe", "0"])
+        source = command.add_input(self.input_file)
+        maps = [stream_map(chunks, "video")]
+        if self.audio_file:
+            maps.append(stream_map(command.add_input(self.audio_file), "audio"))
+        elif self.has_audio:
+            maps.append(stream_map(source, "audio"))
+        if self.output_file.lower().endswith(SUBTITLE_CONTAINERS):
+            maps.append(stream_map(source, "subtitle") + "?")
+        options = ["-map_metadata", str(source), "-map_chapters", str(source)]
+        command.add_output(self.output_file, maps, options=options)
+        return command.argv()
+
+    def cleanup(self):
+        if self.work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+    def _work_dir(self):
+        if self.work_dir is None:
+            self.work_dir = tempfile.mkdtemp(prefix=".transcode_",
+                                             dir=os.path.dirname(os.path.abspath(self.output_file)))
+        return self.work_dir
+
+    def _chunk_command(self, chunk, progress):
+        command = FfmpegCommand(progress=progress)
+        # Input seeking while decoding is frame-accurate and drops the frames before -ss. Keyframe times are
+        # rounded to microseconds, so both ends of a chunk are moved back by SEEK_NUDGE: the keyframe at a
+        # boundary then always opens the next chunk instead of being dropped from it or repeated
+        start = chunk.start - SEEK_NUDGE if chunk.start > 0 else 0.0
+        options = ["-ss", f"{start:.6f}"] if start > 0 else []
+        if self.record.duration - chunk.end > KEYFRAME_TOLERANCE:
+            options += ["-t", f"{chunk.end - SEEK_NUDGE - start:.6f}"]
+        command.add_input(self.input_file, options)
+        command.add_output(chunk.path, [stream_map(0, "video", self.video.rel_index)], {"v": self.video_codec},
+                           options=self.video_options + ["-threads", str(self.threads)])
+        return command
+
+
+def transcode_output_path(input_file, ext=".mkv"):
+    base = os.path.splitext(input_file)[0]
+    return f"{base}_transcoded{ext}"
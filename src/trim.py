@@ -0,0 +1,255 @@
+"""Fast trimming and splitting on keyframes.
+
+A stream copy can only start on a keyframe, so a plain cut snaps its start
+back to the keyframe at or before the requested time and costs no more than
+a remux. An exact cut re-encodes only the partial GOPs at its boundaries:
+
+    start ... K1 ==================== K2 ... end
+    [re-encode] [   stream copy     ] [re-encode]
+
+and joins the pieces with the concat demuxer. Re-encoded pieces match the
+source parameters, so the join is itself a stream copy. Keyframe times come
+from MediaRecord.keyframes(), which is computed once and cached with the
+file's probe data. Those are packet timestamps, while cut points, -ss and -t
+count from the start of the file, so they are shifted by the file's start
+time (non-zero in MPEG-TS recordings, for example).
+"""
+import bisect
+import os
+import shutil
+import tempfile
+
+from concat import SIGNATURE_FIELDS, reencode_args, stream_layout
+from ffmpeg_utils import FfmpegCommand, concat_command, stream_map, write_concat_list
+
+# Cut points closer than this to a keyframe (in seconds) are treated as on it
+KEYFRAME_TOLERANCE = 0.002
+# ffprobe rounds pts_time to microseconds; seeking slightly past a keyframe makes sure
+# ffmpeg lands on it rather than on the one before
+SEEK_NUDGE = 0.0005
+
+
+def parse_timestamp(value):
+    """Seconds from "90", "90.5", "1:30" or "0:01:30.5"; raises ValueError"""
+    parts = str(value).strip().split(":")
+    if not 1 <= len(parts) <= 3:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    if seconds < 0:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    return seconds
+
+
+def relative_keyframes(record):
+    """Keyframe times of the main video stream counted from the start of the file"""
+    return [t - record.start_time for t in record.keyframes()]
+
+
+def keyframe_at_or_before(keyframes, t):
+    i = bisect.bisect_right(keyframes, t + KEYFRAME_TOLERANCE)
+    return keyframes[i - 1] if i else None
+
+
+def keyframe_at_or_after(keyframes, t):
+    i = bisect.bisect_left(keyframes, t - KEYFRAME_TOLERANCE)
+    return keyframes[i] if i < len(keyframes) else None
+
+
+class TrimSegment:
+    """One piece of a cut: a stream copy between keyframes, or a re-encoded boundary"""
+
+    def __init__(self, start, end, reencode):
+        self.start = start
+        self.end = end
+        self.reencode = reencode
+        self.path = None  # Set when the plan assigns where this piece is written
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class TrimPlan:
+    """How to cut [start, end) out of a file, as stream copy where possible.
+
+    streams are global stream indexes to keep (default: every stream for a
+    copy cut, the video and audio streams for an exact cut, since only those
+    can be re-encoded to match and joined).
+    """
+
+    def __init__(self, record, start, end=None, output_file=None, exact=False, streams=None):
+        self.record = record
+        self.input_file = record.path
+        self.end = record.duration if end is None else min(end, record.duration or end)
+        if self.end is None or start >= self.end:
+            raise ValueError(f"Empty cut {start}-{end} of {record.path}")
+        self.requested_start = start
+        self.exact = exact
+        self.streams = streams
+        self.output_file = output_file or trim_output_path(record.path, start, self.end)
+        self.keyframes = relative_keyframes(record)
+        self.segments = self._plan_segments(start)
+        self.work_dir = None
+
+    @property
+    def start(self):
+        """Where the output actually starts (earlier than requested for a snapped copy cut)"""
+        return self.segments[0].start
+
+    @property
+    def reencoded_seconds(self):
+        return sum(s.duration for s in self.segments if s.reencode)
+
+    def _plan_segments(self, start):
+        end = self.end
+        if not self.keyframes:
+            # Audio-only and intra-only files can be cut anywhere
+            return [TrimSegment(start, end, False)]
+        if not self.exact:
+            return [TrimSegment(keyframe_at_or_before(self.keyframes, start) or 0.0, end, False)]
+
+        first = keyframe_at_or_after(self.keyframes, start)
+        last = keyframe_at_or_before(self.keyframes, end)
+        if first is None or last is None or first >= end - KEYFRAME_TOLERANCE:
+            return [TrimSegment(start, end, True)]  # No keyframe inside the cut: re-encode all of it
+        segments = []
+        if first - start > KEYFRAME_TOLERANCE:
+            segments.append(TrimSegment(start, first, True))
+        if last > first:
+            segments.append(TrimSegment(first, last, False))
+        if end - last > KEYFRAME_TOLERANCE:
+            # Only re-encode the tail if the copy cannot simply run on to the end of the file
+            if self.record.duration is not None and self.record.duration - end <= KEYFRAME_TOLERANCE:
+                segments.append(TrimSegment(last, end, False))
+            else:
+                segments.append(TrimSegment(last, end, True))
+        return _merge_adjacent(segments)
+
+    def summary(self):
+        if len(self.segments) == 1 and not self.segments[0].reencode:
+            snapped = self.start < self.requested_start - KEYFRAME_TOLERANCE
+            note = f" (snapped back from {self.requested_start:.3f}s to the keyframe)" if snapped else ""
+            return f"Stream copy {self.start:.3f}s-{self.end:.3f}s{note}"
+        if all(s.reencode for s in self.segments):
+            return f"Exact cut {self.start:.3f}s-{self.end:.3f}s: no keyframe inside the range, re-encoding all of it"
+        return (f"Exact cut {self.start:.3f}s-{self.end:.3f}s: re-encoding {self.reencoded_seconds:.3f}s "
+                f"of {self.end - self.start:.3f}s at the boundaries, copying the rest")
+
+    def segment_commands(self, progress=False):
+        """(segment, argv) for every piece; a single piece is written straight to the output file"""
+        if len(self.segments) == 1:
+            self.segments[0].path = self.output_file
+        else:
+            ext = os.path.splitext(self.output_file)[1]
+            for number, segment in enumerate(self.segments):
+                segment.path = os.path.join(self._work_dir(), f"piece_{number}{ext}")
+        return [(segment, self._segment_command(segment, progress).argv()) for segment in self.segments]
+
+    def concat_command(self, progress=False):
+        """argv joining the pieces, or None if the cut is a single piece"""
+        if len(self.segments) == 1:
+            return None
+        list_path = write_concat_list([s.path for s in self.segments], os.path.join(self._work_dir(), "pieces.txt"))
+        return concat_command(list_path, self.output_file, progress).argv()
+
+    def cleanup(self):
+        if self.work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+    def _work_dir(self):
+        if self.work_dir is None:
+            self.work_dir = tempfile.mkdtemp(prefix=".trim_", dir=os.path.dirname(os.path.abspath(self.output_file)))
+        return self.work_dir
+
+    def _reencode_args(self, output_file):
+        """reencode_args() for the kept video/audio streams, mapped by their own type-relative indexes"""
+        streams = [s for s in self.record.streams if s.codec_type in SIGNATURE_FIELDS
+                   and (self.streams is None or s.index in self.streams)]
+        return reencode_args(stream_layout([s.data for s in streams]), output_file,
+                             source_indexes=[s.rel_index for s in streams])
+
+    def _copy_maps(self):
+        if self.streams is None and not self.exact:
+            return ["0"]
+        if self.exact:
+            # Pieces must carry the same streams as the re-encoded ones
+            return self._reencode_args(self.output_file)[0]
+        maps = []
+        for index in self.streams:
+            stream = self.record.stream(index)
+            if stream is not None:
+                maps.append(stream_map(0, stream.codec_type, stream.rel_index))
+        return maps
+
+    def _segment_command(self, segment, progress):
+        command = FfmpegCommand(progress=progress)
+        if segment.reencode:
+            # Input seeking while decoding is frame-accurate
+            command.add_input(self.input_file, ["-ss", f"{segment.start:.6f}", "-t", f"{segment.duration:.6f}"])
+            maps, codecs, options = self._reencode_args(segment.path)
+            command.add_output(segment.path, maps, codecs, options=options)
+        else:
+            seek = segment.start + SEEK_NUDGE if segment.start > 0 else 0.0
+            command.add_input(self.input_file, ["-ss", f"{seek:.6f}", "-t", f"{segment.end - seek:.6f}"])
+            command.add_output(segment.path, self._copy_maps(), options=["-avoid_negative_ts", "make_zero"])
+        return command
+
+
+def trim_output_path(input_file, start, end):
+    base, ext = os.path.splitext(input_file)
+    return f"{base}_trim_{_time_label(start)}-{_time_label(end)}{ext}"
+
+
+def split_output_path(input_file, number, template=None):
+    directory, name = os.path.split(input_file)
+    stem, ext = os.path.splitext(name)
+    template = template or "{dir}/{stem}_part{n:02d}{ext}"
+    return template.format(dir=directory or ".", stem=stem, ext=ext, n=number)
+
+
+def split_points_every(duration, every):
+    if every <= 0:
+        raise ValueError("Split interval must be positive")
+    points = []
+    t = every
+    while t < duration - KEYFRAME_TOLERANCE:
+        points.append(t)
+        t += every
+    return points
+
+
+def plan_split(record, points, exact=False, streams=None, template=None):
+    """TrimPlans covering the whole file, cut at points.
+
+    Copy splits move every point back to its keyframe so the pieces line up
+    without gaps or overlap; exact splits cut exactly at the points.
+    """
+    if not exact and record.main_video() is not None:
+        keyframes = relative_keyframes(record)
+        points = [keyframe_at_or_before(keyframes, p) for p in points]
+    bounds = sorted({p for p in points if p and 0 < p < (record.duration or float("inf"))})
+    starts = [0.0] + bounds
+    ends = bounds + [record.duration]
+    return [TrimPlan(record, start, end, split_output_path(record.path, n, template), exact, streams)
+            for n, (start, end) in enumerate(zip(starts, ends), 1)]
+
+
+def _merge_adjacent(segments):
+    """Join adjacent pieces handled the same way (copy or re-encode) into one"""
+    merged = []
+    for segment in segments:
+        if merged and segment.reencode == merged[-1].reencode:
+            merged[-1].end = segment.end
+        else:
+            merged.append(segment)
+    return merged
+
+
+def _time_label(seconds):
+    """Filename-safe timestamp, e.g. 90.5 -> "00.01.30.500" """
+    minutes, secs = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02d}.{minutes:02d}.{secs:06.3f}"
@@ -0,0 +1,43 @@
+import logging
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+class JobBridge(QObject):
+    """Re-emits JobQueue state changes as a Qt signal delivered on the GUI thread"""
+
+    job_changed = pyqtSignal(object)
+
+    def __init__(self, job_queue, parent=None):
+        super().__init__(parent)
+        self.job_queue = job_queue
+        # Emitting from a worker thread queues the call to the receiver's thread
+        self._listener = self.job_changed.emit
+        job_queue.add_listener(self._listener)
+
+    def detach(self):
+        self.job_queue.remove_listener(self._listener)
+
+
+class BackgroundCall(QObject):
+    """Runs a function on a worker thread and emits its result as a signal delivered on the GUI thread"""
+
+    finished = pyqtSignal(object)
+
+    def __init__(self, function, parent=None):
+        super().__init__(parent)
+        self._function = function
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        try:
+            result = self._function()
+        except Exception:
+            logger.exception("Background call failed")
+            return
+        self.finished.emit(result)
@@ -1,14 +1,40 @@
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QPushButton, QFileDialog, QLabel, QHBoxLayout,
     QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView, QStyle, QStyleOptionButton, QMessageBox,
-    QApplication, QToolBar, QAction, QFrame, QSplitter
+    QToolBar, QAction, QFrame, QSplitter, QSpinBox, QProgressBar, QTreeView, QDialog, QScrollArea
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QIcon, QPixmap
 import os
 import logging
-import json
-import subprocess
+import sqlite3
+import time
+
+from concat import ConcatPlan, REENCODE
+from disk_scheduler import DiskScheduler, estimate_output_bytes, file_bytes
+from extraction import plan_extraction
+from file_handlers import expand_media_paths
+from job_server import LISTEN_ENV, TOKEN_ENV, JobServer, parse_address
+from jobs import Job, JobQueue, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+from log_setup import log_path
+from loudness import LoudnessPlan
+from media_catalog import MediaCatalog
+from media_probe import native_subtitle_info, probe_command, parse_probe_output
+from merging import build_merge_command, merged_output_path
+from output_policy import OutputPolicy
+from probe_cache import ProbeCache
+from result_cache import ResultCache
+from thumbnails import ThumbnailCache
+from ui.job_bridge import BackgroundCall, JobBridge
+from ui.stream_model import FileNode, StreamNode, StreamTreeModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_JOBS = max(1, min(4, (os.cpu_count() or 2) // 2))
+PROBE_WORKERS = min(16, 2 * (os.cpu_count() or 4))
+PREVIEW_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+# Raised while placing or staging outputs: an unreachable output root or scratch dir, a broken name template
+OUTPUT_ERRORS = (OSError, KeyError, ValueError)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -16,6 +42,60 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Video Manipulator")
         self.setGeometry(100, 100, 1000, 700)
 
+        # Results of finished jobs, so redoing an identical extraction or merge completes at once
+        try:
+            self.result_cache = ResultCache()
+        except (OSError, sqlite3.Error):
+            self.result_cache = None
+
+        # Background job engine: ffmpeg/ffprobe never run on the GUI thread
+        # Jobs only start when their output fits on disk, and one at a time per spinning disk
+        self.job_queue = None
+        if os.environ.get(LISTEN_ENV):
+            # Hand extractions and merges to `video-manipulator worker` processes instead (see job_server)
+            try:
+                self.job_queue = JobServer(*parse_address(os.environ[LISTEN_ENV]), token=os.environ.get(TOKEN_ENV),
+                                           max_workers=DEFAULT_MAX_JOBS).start()
+            except (OSError, ValueError) as e:
+                logger.error(f"Cannot start the job server, running jobs locally: {e}")
+        if self.job_queue is None:
+            self.job_queue = JobQueue(max_workers=DEFAULT_MAX_JOBS, scheduler=DiskScheduler(),
+                                      result_cache=self.result_cache)
+        self.job_bridge = JobBridge(self.job_queue, self)
+        self.job_bridge.job_changed.connect(self._on_job_changed)
+        self._job_rows = {}  # job id -> row in job_table
+        self._job_handlers = {}  # job id -> callback run on the GUI thread when the job finishes
+
+        # Probes get their own wider pool so imports never wait behind long remuxes
+        self.probe_queue = JobQueue(max_workers=PROBE_WORKERS)
+        self.probe_bridge = JobBridge(self.probe_queue, self)
+        self.probe_bridge.job_changed.connect(self._on_probe_changed)
+
+        # Thumbnails and contact sheets are made in the background as video rows come into view,
+        # and kept on disk so no file is ever decoded for them twice
+        try:
+            self.thumbnail_cache = ThumbnailCache()
+        except OSError:
+            self.thumbnail_cache = None
+        self.preview_queue = JobQueue(max_workers=PREVIEW_WORKERS)
+        self.preview_bridge = JobBridge(self.preview_queue, self)
+        self.preview_bridge.job_changed.connect(self._on_preview_changed)
+
+        # Output root, name templates and scratch staging from the per-user output_policy.json
+        try:
+            self.output_policy = OutputPolicy.load()
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring invalid output policy: {e}")
+            self.output_policy = OutputPolicy()
+
+        # Persistent ffprobe results so re-importing a known library skips ffprobe
+        try:
+            self.probe_cache = ProbeCache()
+        except (OSError, sqlite3.Error):
+            self.probe_cache = None
+        else:
+            self.probe_queue.add_listener(self._cache_probe)
+
         # Create central widget and main layout
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
@@ -29,8 +109,10 @@ class MainWindow(QMainWindow):
         self.create_main_content()
 
         # Initialize data structures
-        self.expanded_rows = set()  # Track which rows are expanded
-        self.file_streams = {}  # Store ffprobe info for each file
+        self.catalog = MediaCatalog()  # Probed files and streams by full path, with precomputed stream indexes
+        self.probing_files = set()  # Files whose ffprobe job is in flight (shown as placeholder rows)
+        self._probe_stats = ProbeStats()
+        self._probe_via = ""
 
         # Enable drag and drop
         self.setAcceptDrops(True)
@@ -74,6 +156,12 @@ class MainWindow(QMainWindow):
         self.extract_subtitle_action.setStatusTip("Extract selected subtitle streams")
         self.extract_subtitle_action.triggered.connect(self.extract_subtitle)
         self.toolbar.addAction(self.extract_subtitle_action)
+
+        # Normalize Audio action
+        self.normalize_audio_action = QAction("Normalize Audio", self)
+        self.normalize_audio_action.setStatusTip("Measure (EBU R128) and normalize the loudness of selected audio streams")
+        self.normalize_audio_action.triggered.connect(self.normalize_audio)
+        self.toolbar.addAction(self.normalize_audio_action)
         
         self.toolbar.addSeparator()
         
@@ -83,6 +171,28 @@ class MainWindow(QMainWindow):
         self.merge_action.triggered.connect(self.merge_files)
         self.toolbar.addAction(self.merge_action)
 
+        # Concatenate Files action
+        self.concat_action = QAction("Concatenate", self)
+        self.concat_action.setStatusTip("Join the selected files end to end, losslessly where possible")
+        self.concat_action.triggered.connect(self.concat_files)
+        self.toolbar.addAction(self.concat_action)
+
+        self.toolbar.addSeparator()
+
+        # Job Control Group
+        self.cancel_jobs_action = QAction("Cancel Jobs", self)
+        self.cancel_jobs_action.setStatusTip("Cancel the selected jobs, or all unfinished jobs if none is selected")
+        self.cancel_jobs_action.triggered.connect(self.cancel_jobs)
+        self.toolbar.addAction(self.cancel_jobs_action)
+
+        self.toolbar.addWidget(QLabel(" Parallel jobs: "))
+        self.max_jobs_spin = QSpinBox()
+        self.max_jobs_spin.setRange(1, max(16, os.cpu_count() or 1))
+        self.max_jobs_spin.setValue(self.job_queue.max_workers)
+        self.max_jobs_spin.setStatusTip("Maximum number of ffmpeg/ffprobe processes running at once")
+        self.max_jobs_spin.valueChanged.connect(self.job_queue.set_max_workers)
+        self.toolbar.addWidget(self.max_jobs_spin)
+
     def create_main_content(self):
         """Create the main content area with file table and status"""
         # Create a splitter for potential future expansion
@@ -99,17 +209,21 @@ class MainWindow(QMainWindow):
         table_header.setStyleSheet("font-weight: bold; font-size: 14px; padding: 5px;")
         self.table_layout.addWidget(table_header)
         
-        # Main file table
-        self.file_table = QTableWidget()
-        self.file_table.setColumnCount(4)
-        self.file_table.setHorizontalHeaderLabels(["File Name", "Type", "Format", "Language"])
-        self.file_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.file_table.setSelectionMode(QAbstractItemView.ExtendedSelection)
-        self.file_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.file_table.verticalHeader().setVisible(False)
-        self.file_table.cellClicked.connect(self.toggle_expand_row)
-        self.file_table.setAlternatingRowColors(True)
-        self.table_layout.addWidget(self.file_table)
+        # Files -> streams tree; stream rows are created by the model when a file is expanded
+        self.file_model = StreamTreeModel(self)
+        self.file_tree = QTreeView()
+        self.file_tree.setModel(self.file_model)
+        self.file_tree.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.file_tree.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.file_tree.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.file_tree.header().setSectionResizeMode(QHeaderView.Stretch)
+        self.file_tree.setUniformRowHeights(True)
+        self.file_tree.setAlternatingRowColors(True)
+        self.file_tree.setIconSize(QSize(64, 36))
+        self.file_tree.doubleClicked.connect(self._show_contact_sheet)
+        # Queued: the model asks from inside data(), which must not change the model under the view
+        self.file_model.preview_needed.connect(self._request_preview, Qt.QueuedConnection)
+        self.table_layout.addWidget(self.file_tree)
         
         # Instructions label
         instructions = QLabel(
@@ -131,11 +245,23 @@ class MainWindow(QMainWindow):
         self.status_label.setStyleSheet("padding: 5px; background-color: #f0f0f0; border: 1px solid #ccc;")
         self.status_label.setWordWrap(True)
         self.status_layout.addWidget(self.status_label)
-        
+
+        # Job table
+        self.job_table = QTableWidget()
+        self.job_table.setColumnCount(3)
+        self.job_table.setHorizontalHeaderLabels(["Job", "Status", "Progress"])
+        self.job_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.job_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.job_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.job_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)
+        self.job_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.job_table.verticalHeader().setVisible(False)
+        self.status_layout.addWidget(self.job_table)
+
         self.content_splitter.addWidget(self.status_widget)
         
         # Set splitter proportions (table takes most space)
-        self.content_splitter.setSizes([600, 100])
+        self.content_splitter.setSizes([500, 200])
 
     def add_file(self):
         options = QFileDialog.Options()
@@ -147,464 +273,323 @@ class MainWindow(QMainWindow):
             options=options
         )
         if files:
-            added_count = 0
-            for file in files:
-                if file not in self.file_streams:
-                    self.file_streams[file] = get_media_streams(file)
-                    streams = self.file_streams[file]
-                    if not streams:
-                        continue
-                    stream = streams[0]
-                    file_type = stream.get("codec_type", "unknown").capitalize()
-                    file_format = stream.get("codec_name", "unknown").upper()
-                    row = self.file_table.rowCount()
-                    self.file_table.insertRow(row)
-
-                    name = os.path.basename(file)
-                    main_item = QTableWidgetItem(name)
-                    main_item.setData(Qt.UserRole, "main_file")
-                    # Make main file rows bold
-                    font = main_item.font()
-                    font.setBold(True)
-                    main_item.setFont(font)
-
-                    # Add caret icon for video files with multiple streams
-                    if file_type.lower() == "video" and len(streams) > 1:
-                        main_item.setText("▶ " + name)
-                        main_item.setData(Qt.UserRole + 2, "expandable")  # Mark as expandable
-
-                    self.file_table.setItem(row, 0, main_item)  # Name column (index 0)
-                    self.file_table.setItem(row, 1, QTableWidgetItem(file_type))
-                    self.file_table.setItem(row, 2, QTableWidgetItem(file_format))
-                    # Add language column for main file (use first stream's language if available)
-                    language = stream.get("tags", {}).get("language", "")
-                    self.file_table.setItem(row, 3, QTableWidgetItem(language))
-                    added_count += 1
-            
-            if added_count > 0:
-                self.status_label.setText(f"Added {added_count} file(s) to the list")
-            else:
-                self.status_label.setText("No new files were added")
+            self._import_files(files)
+
+    def _import_files(self, file_paths, via=""):
+        """Add files to the list; they are looked up in the background, then the unknown ones are probed"""
+        known = {record.path for record in self.catalog} | self.probing_files
+        probe_cache = self.probe_cache
+        lookup = BackgroundCall(lambda: (via, lookup_files(file_paths, known, probe_cache)), self)
+        lookup.finished.connect(self._on_files_looked_up)
+        lookup.finished.connect(lookup.deleteLater)
+        lookup.start()
+        self.status_label.setText("Adding files...")
+
+    def _on_files_looked_up(self, result):
+        """Add the rows of looked-up files in one batch, with placeholders for the ones still to probe"""
+        via, found = result
+        found = [(f, info) for f, info in found if f not in self.catalog and f not in self.probing_files]
+        if not found:
+            self.status_label.setText("No new files were added")
+            return
 
-    def toggle_expand_row(self, row, column):
-        # Only expand/collapse if clicking on the name column and is a video file
-        if column != 0:
+        if not self.probing_files:
+            self._probe_stats = ProbeStats()
+        self._probe_via = via
+
+        # Subtitles read natively and files known to the probe cache are added without running ffprobe
+        cached_count = 0
+        rows = []
+        to_probe = []
+        for file_path, info in found:
+            if info is None:
+                rows.append((file_path, None))
+                to_probe.append(file_path)
+                continue
+            streams = self._store_probe_info(file_path, info)
+            if streams:
+                rows.append((file_path, streams))
+                cached_count += 1
+        self.file_model.add_files(rows)
+
+        for file_path in to_probe:
+            self.probing_files.add(file_path)
+            self.probe_queue.submit(Job(probe_command(file_path), f"Probe {os.path.basename(file_path)}",
+                                        input_file=file_path))
+            self._probe_stats.total += 1
+
+        if self.probing_files:
+            self.status_label.setText(f"Added {cached_count} cached file(s), probing {len(self.probing_files)} file(s)...")
+        elif cached_count:
+            self.status_label.setText(f"Added {cached_count} file(s) to the list{via} (from probe cache)")
+        else:
+            self.status_label.setText("No new files were added")
+
+    def _on_probe_changed(self, job):
+        if job.finished:
+            self._on_probe_finished(job)
+
+    def _on_probe_finished(self, job):
+        file_path = job.input_file
+        if file_path not in self.probing_files:
+            return  # List was cleared while the probe was running
+        self.probing_files.discard(file_path)
+
+        info = {}
+        error = job.error or job.stderr
+        if job.state == DONE:
+            try:
+                info = parse_probe_output(job.stdout)
+            except ValueError as e:
+                error = e
+        streams = info.get("streams", [])
+        if job.state != CANCELLED and not streams and error:
+            logger.error(f"Error probing file {file_path}: {str(error)}")
+
+        if job.state != CANCELLED:
+            self._store_probe_info(file_path, info)
+        if streams:
+            self.file_model.set_streams(file_path, streams)
+            self._probe_stats.added += 1
+        else:
+            self.file_model.remove_file(file_path)
+        self._probe_stats.record(job.duration)
+
+        stats = self._probe_stats
+        if self.probing_files:
+            self.status_label.setText(
+                f"Probed {stats.done}/{stats.total} file(s) - {stats.rate():.1f} files/s, "
+                f"avg latency {stats.average_latency() * 1000:.0f} ms"
+            )
+        elif stats.added > 0:
+            self.status_label.setText(
+                f"Added {stats.added} file(s) to the list{self._probe_via} "
+                f"({stats.rate():.1f} files/s, avg latency {stats.average_latency() * 1000:.0f} ms)"
+            )
+        else:
+            self.status_label.setText("No new files were added")
+
+    def _cache_probe(self, job):
+        """Keep a successful probe in the probe cache; a probe_queue listener, so it runs on the worker thread"""
+        if job.state != DONE:
             return
-        file_type_item = self.file_table.item(row, 1)
-        if not file_type_item or file_type_item.text().lower() != "video":
+        try:
+            info = parse_probe_output(job.stdout)
+            if info.get("streams"):
+                self.probe_cache.put(job.input_file, info)
+        except ValueError:
+            pass  # Reported by _on_probe_finished
+        except sqlite3.Error as e:
+            logger.warning(f"Cannot cache the probe of {job.input_file}: {e}")
+
+    def _store_probe_info(self, file_path, info):
+        """Catalog the streams and container duration of a probed file; returns the streams"""
+        return self.catalog.add(file_path, info).raw_streams
+
+    def _request_preview(self, file_path):
+        """Show a video file's previews, generating whatever is not cached yet"""
+        record = self.catalog.get(file_path)
+        if self.thumbnail_cache is None or record is None:
             return
-
-        # Check if this video file is expandable (has multiple streams)
-        main_item = self.file_table.item(row, 0)
-        if not main_item or main_item.data(Qt.UserRole + 2) != "expandable":
+        try:
+            job = self.thumbnail_cache.preview_job(record)
+        except OSError as e:
+            logger.warning(f"Cannot prepare previews of {file_path}: {e}")
             return
+        if job is None:
+            self._show_previews(record)
+        else:
+            self.preview_queue.submit(job)
 
-        # Collapse if already expanded
-        if row in self.expanded_rows:
-            # Remove all expanded stream rows below this video row
-            while (row + 1 < self.file_table.rowCount() and
-                   self.file_table.item(row + 1, 0) and
-                   self.file_table.item(row + 1, 0).data(Qt.UserRole) == "stream"):
-                self.file_table.removeRow(row + 1)
-            # Change caret to right (collapsed)
-            original_text = main_item.data(Qt.UserRole + 1)
-            if original_text:
-                main_item.setText("▶ " + original_text)
-                main_item.setData(Qt.UserRole + 1, original_text)  # Keep stored text
-            self.expanded_rows.remove(row)
+    def _on_preview_changed(self, job):
+        if not job.finished:
             return
-
-        # Expand: insert new rows below, one for each stream
-        file_name = self._get_original_filename(row)
-        input_file = next((f for f in self.file_streams.keys() if os.path.basename(f) == file_name), None)
-        if input_file is None:
+        if job.state == DONE:
+            self.thumbnail_cache.commit(job)
+        elif job.state == FAILED:
+            error = str(job.error) if job.error else job.stderr
+            logger.warning(f"Cannot make previews of {job.input_file}: {error[-500:]}")
+        record = self.catalog.get(job.input_file)
+        if record is not None:
+            self._show_previews(record)
+
+    def _show_previews(self, record):
+        previews = {}
+        for stream in record.of_type("video"):
+            images = self.thumbnail_cache.get(record.path, stream.index)
+            if images:
+                previews[stream.index] = images
+        if previews:
+            self.file_model.set_previews(record.path, previews)
+
+    def _show_contact_sheet(self, index):
+        node = self.file_model.node(index)
+        preview = self.file_model.preview(node) if node is not None else None
+        if preview is None:
             return
-
-        streams = self.file_streams.get(input_file, [])
-        insert_at = row + 1
-        for s in streams:
-            name = s.get("tags", {}).get("title", f"Stream {s.get('index', '')}")
-            stream_type = s.get("codec_type", "unknown").capitalize()
-            stream_format = s.get("codec_name", "unknown").upper()
-            language = s.get("tags", {}).get("language", "")
-            self.file_table.insertRow(insert_at)
-            stream_item = QTableWidgetItem(name)
-            stream_item.setData(Qt.UserRole, "stream")
-            self.file_table.setItem(insert_at, 0, stream_item)           # Name column - index 0
-            self.file_table.setItem(insert_at, 1, QTableWidgetItem(stream_type))
-            self.file_table.setItem(insert_at, 2, QTableWidgetItem(stream_format))
-            self.file_table.setItem(insert_at, 3, QTableWidgetItem(language))
-            insert_at += 1
-
-        # Change caret to down (expanded)
-        original_text = main_item.data(Qt.UserRole + 1) or file_name
-        main_item.setText("▼ " + original_text)
-        main_item.setData(Qt.UserRole + 1, original_text)  # Store original text
-        self.expanded_rows.add(row)
+        path = node.path if isinstance(node, FileNode) else node.file.path
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f"Preview - {os.path.basename(path)}")
+        label = QLabel()
+        label.setPixmap(QPixmap(preview[1]))
+        scroll = QScrollArea()
+        scroll.setWidget(label)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(scroll)
+        dialog.resize(1000, 640)
+        dialog.exec_()
 
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
             event.acceptProposedAction()
 
     def dropEvent(self, event):
-        added_count = 0
-        for url in event.mimeData().urls():
-            file_path = url.toLocalFile()
-            if os.path.isfile(file_path):
-                if file_path not in self.file_streams:
-                    self.file_streams[file_path] = get_media_streams(file_path)
-                    streams = self.file_streams[file_path]
-                    if not streams:
-                        continue
-                    stream = streams[0]
-                    file_type = stream.get("codec_type", "unknown").capitalize()
-                    file_format = stream.get("codec_name", "unknown").upper()
-                    row = self.file_table.rowCount()
-                    self.file_table.insertRow(row)
-                    name_item = QTableWidgetItem(os.path.basename(file_path))
-                    # Make main file rows bold
-                    font = name_item.font()
-                    font.setBold(True)
-                    name_item.setFont(font)
-                    
-                    # Add caret icon for video files with multiple streams
-                    if file_type.lower() == "video" and len(streams) > 1:
-                        name_item.setText("▶ " + os.path.basename(file_path))
-                        name_item.setData(Qt.UserRole + 2, "expandable")  # Mark as expandable
-                    
-                    self.file_table.setItem(row, 0, name_item)
-                    self.file_table.setItem(row, 1, QTableWidgetItem(file_type))
-                    self.file_table.setItem(row, 2, QTableWidgetItem(file_format))
-                    # Add language column for main file
-                    language = stream.get("tags", {}).get("language", "")
-                    self.file_table.setItem(row, 3, QTableWidgetItem(language))
-                    added_count += 1
-        
-        if added_count > 0:
-            self.status_label.setText(f"Added {added_count} file(s) via drag and drop")
+        file_paths = [url.toLocalFile() for url in event.mimeData().urls()]
+        self._import_files(file_paths, " via drag and drop")
         event.acceptProposedAction()
 
+    def _selected_nodes(self):
+        """Model nodes of the selected rows, in display order"""
+        indexes = self.file_tree.selectionModel().selectedRows()
+        nodes = [self.file_model.node(index) for index in indexes]
+        return sorted((n for n in nodes if n is not None and not (isinstance(n, FileNode) and n.probing)), key=_node_order)
+
+    def _selected_streams(self, stream_type, all_from_files=False):
+        """(input_file, stream) pairs of the given type for the selection.
+
+        Stream rows contribute their own stream; file rows contribute their
+        first stream of that type, or every one if all_from_files is set.
+        """
+        selected = []
+        for node in self._selected_nodes():
+            if isinstance(node, StreamNode):
+                if node.stream.get("codec_type") == stream_type:
+                    selected.append((node.file.path, node.stream))
+                continue
+            matching = [s for s in node.streams if s.get("codec_type") == stream_type]
+            selected += [(node.path, s) for s in (matching if all_from_files else matching[:1])]
+        return selected
+
     def extract_video(self):
-        selected_rows = self.file_table.selectionModel().selectedRows()
-        if not selected_rows:
+        if not self._selected_nodes():
             QMessageBox.warning(self, "No File Selected", "Please select a video stream or file to extract.")
             return
-
-        video_streams_to_extract = []
-
-        for row_index in [row.row() for row in selected_rows]:
-            stream_name_item = self.file_table.item(row_index, 0)
-            # Check if this is a stream row (expanded)
-            if stream_name_item and stream_name_item.data(Qt.UserRole) == "stream":
-                print(f"Processing stream row {row_index} with name '{stream_name_item.text()}'")
-                # This is a stream row, get the parent video file
-
-                # Find the main file row above this stream row
-                parent_row = row_index - 1
-                while parent_row >= 0:
-                    parent_type_item = self.file_table.item(parent_row, 0)
-                    if parent_type_item and parent_type_item.data(Qt.UserRole) == "main_file":
-                        break
-                    parent_row -= 1
-                if parent_row < 0:
-                    print(f"Could not find parent main file row for stream row {row_index}")
-                    continue
-                parent_file_name = self._get_original_filename(parent_row)
-
-                print(f"Found parent main file row {parent_row} with name '{parent_file_name}'")
-
-                input_file = next((f for f in self.file_streams.keys() if os.path.basename(f) == parent_file_name), None)
-
-                print(f"Input file for stream row: {input_file}")
-
-                if input_file:
-                    stream_name = stream_name_item.text()
-                    streams = self.file_streams.get(input_file, [])
-                    for s in streams:
-                        name = s.get("tags", {}).get("title", f"Stream {s.get('index', '')}")
-                        if name == stream_name and s.get("codec_type") == "video":
-                            video_streams_to_extract.append((input_file, s))
-                            break
-            else:
-                # Main file row (extract first video stream)
-                file_name = self._get_original_filename(row_index)
-                input_file = next((f for f in self.file_streams.keys() if os.path.basename(f) == file_name), None)
-                if input_file:
-                    streams = self.file_streams.get(input_file, [])
-                    video_stream = next((s for s in streams if s.get("codec_type") == "video"), None)
-                    if video_stream:
-                        video_streams_to_extract.append((input_file, video_stream))
-
+        video_streams_to_extract = self._selected_streams("video")
         if not video_streams_to_extract:
             QMessageBox.warning(self, "No Video Stream", "No video stream found in the selected rows.")
             return
-
-        for input_file, video_stream in video_streams_to_extract:
-            video_index = video_stream.get("index", 0)
-            video_codec = video_stream.get("codec_name", "copy")
-            ext_map = {"h264": ".mp4", "hevc": ".mkv", "vp9": ".webm", "mpeg4": ".mp4"}
-            output_ext = ext_map.get(video_codec, ".mkv")
-            base, _ = os.path.splitext(input_file)
-            lang = video_stream.get("tags", {}).get("language", "")
-            title = video_stream.get("tags", {}).get("title", f"video_{video_index}")
-            # Make output file unique per stream
-            output_file = f"{base}_video_{video_index}{output_ext}"
-
-            # Overwrite dialog
-            if os.path.exists(output_file):
-                if not confirm_overwrite_dialog(self, output_file):
-                    self.status_label.setText("Extraction cancelled by user.")
-                    continue
-
-            self.status_label.setText(f"Extracting video stream {video_index} to {output_file}...")
-            QApplication.processEvents()
-
-            # Find type-relative index for video
-            rel_index = self._get_type_relative_index(input_file, "video", video_index)
-
-            cmd = [
-                "ffmpeg",
-                "-i", input_file,
-                "-an",  # no audio
-                "-map", f"0:v:{rel_index}",
-                "-c:v", "copy",
-                output_file,
-                "-y"
-            ]
-
-            try:
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.status_label.setText(f"Video extracted: {output_file}")
-                else:
-                    self.status_label.setText("Error extracting video.")
-                    log_file = os.path.join(os.path.dirname(input_file), "ffmpeg_error.log")
-                    logger = get_logger(log_file)
-                    logger.error(f"FFmpeg error extracting video stream {video_index} from {input_file}: {result.stderr}")
-                    QMessageBox.critical(self, "FFmpeg Error", f"An error occurred. See log: {log_file}")
-            except Exception as e:
-                self.status_label.setText("Error extracting video.")
-                log_file = os.path.join(os.path.dirname(input_file), "ffmpeg_error.log")
-                logger = get_logger(log_file)
-                logger.error(f"Exception extracting video stream {video_index} from {input_file}: {str(e)}")
-                QMessageBox.critical(self, "Error", f"An error occurred. See log: {log_file}")
+        self._run_extraction(video_streams_to_extract, "video")
 
     def extract_audio(self):
-        selected_rows = self.file_table.selectionModel().selectedRows()
-        if not selected_rows:
+        if not self._selected_nodes():
             QMessageBox.warning(self, "No File Selected", "Please select an audio stream or file to extract.")
             return
-
-        audio_streams_to_extract = []
-
-        for row_index in [row.row() for row in selected_rows]:
-            stream_name_item = self.file_table.item(row_index, 0)
-            # Check if this is a stream row (expanded)
-            if stream_name_item and stream_name_item.data(Qt.UserRole) == "stream":
-                print(f"Processing stream row {row_index} with name '{stream_name_item.text()}'")
-                # This is a stream row, get the parent video file
-
-                # Find the main file row above this stream row
-                parent_row = row_index - 1
-                while parent_row >= 0:
-                    parent_type_item = self.file_table.item(parent_row, 0)
-                    if parent_type_item and parent_type_item.data(Qt.UserRole) == "main_file":
-                        break
-                    parent_row -= 1
-                if parent_row < 0:
-                    print(f"Could not find parent main file row for stream row {row_index}")
-                    continue
-                parent_file_name = self._get_original_filename(parent_row)
-
-                print(f"Found parent main file row {parent_row} with name '{parent_file_name}'")
-
-                input_file = next((f for f in self.file_streams.keys() if os.path.basename(f) == parent_file_name), None)
-
-                print(f"Input file for stream row: {input_file}")
-
-                if input_file:
-                    stream_name = stream_name_item.text()
-                    streams = self.file_streams.get(input_file, [])
-                    for s in streams:
-                        name = s.get("tags", {}).get("title", f"Stream {s.get('index', '')}")
-                        if name == stream_name and s.get("codec_type") == "audio":
-                            audio_streams_to_extract.append((input_file, s))
-                            break
-            else:
-                # Main file row (extract first audio stream)
-                file_name = self._get_original_filename(row_index)
-                input_file = next((f for f in self.file_streams.keys() if os.path.basename(f) == file_name), None)
-                if input_file:
-                    streams = self.file_streams.get(input_file, [])
-                    audio_stream = next((s for s in streams if s.get("codec_type") == "audio"), None)
-                    if audio_stream:
-                        audio_streams_to_extract.append((input_file, audio_stream))
-
+        audio_streams_to_extract = self._selected_streams("audio")
         if not audio_streams_to_extract:
             QMessageBox.warning(self, "No Audio Stream", "No audio stream found in the selected rows.")
             return
-
-        for input_file, audio_stream in audio_streams_to_extract:
-            audio_index = audio_stream.get("index", 0)
-            audio_codec = audio_stream.get("codec_name", "aac")
-            ext_map = {"aac": ".aac", "mp3": ".mp3", "ac3": ".ac3", "opus": ".opus", "flac": ".flac", "wav": ".wav"}
-            output_ext = ext_map.get(audio_codec, ".mka")
-            base, _ = os.path.splitext(input_file)
-            lang = audio_stream.get("tags", {}).get("language", "")
-            title = audio_stream.get("tags", {}).get("title", f"audio_{audio_index}")
-            
-            # Use language code in filename if available, otherwise use index
-            if lang:
-                output_file = f"{base}_audio_{lang}{output_ext}"
-            else:
-                output_file = f"{base}_audio_{audio_index}{output_ext}"
-
-            # Overwrite dialog
-            if os.path.exists(output_file):
-                if not confirm_overwrite_dialog(self, output_file):
-                    self.status_label.setText("Extraction cancelled by user.")
-                    continue
-
-            self.status_label.setText(f"Extracting audio stream {audio_index} to {output_file}...")
-            QApplication.processEvents()
-
-            cmd = [
-                "ffmpeg",
-                "-i", input_file,
-                "-vn",  # no video
-                "-map", f"0:a:{self._get_type_relative_index(input_file, 'audio', audio_index)}",
-                "-c:a", "copy",
-                output_file,
-                "-y"
-            ]
-
-            try:
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.status_label.setText(f"Audio extracted: {output_file}")
-                else:
-                    self.status_label.setText("Error extracting audio.")
-                    log_file = os.path.join(os.path.dirname(input_file), "ffmpeg_error.log")
-                    logger = get_logger(log_file)
-                    logger.error(f"FFmpeg error extracting audio stream {audio_index} from {input_file}: {result.stderr}")
-                    QMessageBox.critical(self, "FFmpeg Error", f"An error occurred. See log: {log_file}")
-            except Exception as e:
-                self.status_label.setText("Error extracting audio.")
-                log_file = os.path.join(os.path.dirname(input_file), "ffmpeg_error.log")
-                logger = get_logger(log_file)
-                logger.error(f"Exception extracting audio stream {audio_index} from {input_file}: {str(e)}")
-                QMessageBox.critical(self, "Error", f"An error occurred. See log: {log_file}")
+        self._run_extraction(audio_streams_to_extract, "audio")
 
     def extract_subtitle(self):
-        selected_rows = self.file_table.selectionModel().selectedRows()
-        if not selected_rows:
+        if not self._selected_nodes():
             QMessageBox.warning(self, "No File Selected", "Please select a subtitle stream or file to extract.")
             return
-
-        subtitle_streams_to_extract = []
-
-        for row_index in [row.row() for row in selected_rows]:
-            stream_name_item = self.file_table.item(row_index, 0)
-            # Check if this is a stream row (expanded)
-            if stream_name_item and stream_name_item.data(Qt.UserRole) == "stream":
-                print(f"Processing stream row {row_index} with name '{stream_name_item.text()}'")
-                # This is a stream row, get the parent video file
-
-                # Find the main file row above this stream row
-                parent_row = row_index - 1
-                while parent_row >= 0:
-                    parent_type_item = self.file_table.item(parent_row, 0)
-                    if parent_type_item and parent_type_item.data(Qt.UserRole) == "main_file":
-                        break
-                    parent_row -= 1
-                if parent_row < 0:
-                    print(f"Could not find parent main file row for stream row {row_index}")
-                    continue
-                parent_file_name = self._get_original_filename(parent_row)
-
-                print(f"Found parent main file row {parent_row} with name '{parent_file_name}'")
-
-                input_file = next((f for f in self.file_streams.keys() if os.path.basename(f) == parent_file_name), None)
-
-                print(f"Input file for stream row: {input_file}")
-
-                if input_file:
-                    stream_name = stream_name_item.text()
-                    streams = self.file_streams.get(input_file, [])
-                    for s in streams:
-                        name = s.get("tags", {}).get("title", f"Stream {s.get('index', '')}")
-                        if name == stream_name and s.get("codec_type") == "subtitle":
-                            subtitle_streams_to_extract.append((input_file, s))
-                            break
-            else:
-                # Main file row (extract all subtitle streams)
-                file_name = self._get_original_filename(row_index)
-                input_file = next((f for f in self.file_streams.keys() if os.path.basename(f) == file_name), None)
-                if input_file:
-                    streams = self.file_streams.get(input_file, [])
-                    for s in streams:
-                        if s.get("codec_type") == "subtitle":
-                            subtitle_streams_to_extract.append((input_file, s))
-
+        # A file row extracts all of its subtitle streams
+        subtitle_streams_to_extract = self._selected_streams("subtitle", all_from_files=True)
         if not subtitle_streams_to_extract:
             QMessageBox.warning(self, "No Subtitle Stream", "No subtitle stream found in the selected rows.")
             return
+        self._run_extraction(subtitle_streams_to_extract, "subtitle")
 
-        success_count = 0
-
-        for input_file, subtitle_stream in subtitle_streams_to_extract:
-            subtitle_index = subtitle_stream.get("index", 0)
-            lang = subtitle_stream.get("tags", {}).get("language", "")
-            base, _ = os.path.splitext(input_file)
-            
-            # Use language code in filename if available, otherwise use index
-            if lang:
-                output_file = f"{base}_subtitle_{lang}.srt"
-            else:
-                output_file = f"{base}_subtitle_{subtitle_index}.srt"
-
-            # Overwrite dialog
-            if os.path.exists(output_file):
-                if not confirm_overwrite_dialog(self, output_file):
-                    self.status_label.setText("Extraction cancelled by user.")
-                    continue
-
-            self.status_label.setText(f"Extracting subtitle stream {subtitle_index} to {output_file}...")
-            QApplication.processEvents()
-
-            # Find type-relative index for subtitle
-            rel_index = self._get_type_relative_index(input_file, "subtitle", subtitle_index)
+    def normalize_audio(self):
+        """Measure the selected audio streams (one ffmpeg pass per file), then normalize each in its own job"""
+        if not self._selected_nodes():
+            QMessageBox.warning(self, "No File Selected", "Please select an audio stream or file to normalize.")
+            return
+        selected = {}
+        # A file row normalizes all of its audio streams
+        for input_file, stream in self._selected_streams("audio", all_from_files=True):
+            selected.setdefault(input_file, set()).add(stream.get("index", 0))
+        if not selected:
+            QMessageBox.warning(self, "No Audio Stream", "No audio stream found in the selected rows.")
+            return
 
-            cmd = [
-                "ffmpeg",
-                "-i", input_file,
-                "-map", f"0:s:{rel_index}",
-                "-c:s", "srt",
-                output_file,
-                "-y"
-            ]
+        for input_file, indexes in selected.items():
+            plan = LoudnessPlan(self.catalog.get(input_file), indexes)
             try:
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    success_count += 1
-                else:
-                    log_file = os.path.join(os.path.dirname(input_file), "ffmpeg_error.log")
-                    logger = get_logger(log_file)
-                    logger.error(f"FFmpeg error extracting subtitle stream {subtitle_index} from {input_file}: {result.stderr}")
-            except Exception as e:
-                log_file = os.path.join(os.path.dirname(input_file), "ffmpeg_error.log")
-                logger = get_logger(log_file)
-                logger.error(f"Exception extracting subtitle stream {subtitle_index} from {input_file}: {str(e)}")
-
-        if success_count:
-            self.status_label.setText(f"Extracted {success_count} subtitle file(s).")
+                plan.outputs = {index: self.output_policy.place(output_file, input_file, "loudness")
+                                for index, output_file in plan.outputs.items()}
+            except OUTPUT_ERRORS as e:
+                self._show_output_error(e)
+                return
+            argv = plan.analysis_command(progress=True)
+            if argv is None:
+                self._submit_normalize_jobs(plan)  # Measured before
+                continue
+            job = Job(argv, f"Measure loudness of {len(plan.pending)} stream(s) of {os.path.basename(input_file)}",
+                      input_file=input_file, media_duration=self.catalog.duration(input_file))
+            self._submit_job(job, lambda job, plan=plan: self._on_loudness_measured(job, plan))
+        self.status_label.setText(f"Measuring loudness of {len(selected)} file(s)...")
+
+    def _on_loudness_measured(self, job, plan):
+        if job.state == CANCELLED:
+            self.status_label.setText("Loudness measurement cancelled.")
+            return
+        try:
+            if job.state != DONE:
+                raise ValueError(f"Loudness measurement of {plan.input_file} failed (job {job.id})")
+            plan.read_analysis(job.stderr)
+        except ValueError as e:
+            logger.error(str(e))
+            self.status_label.setText("Error measuring loudness.")
+            QMessageBox.critical(self, "FFmpeg Error", f"An error occurred. See log: {log_path()}")
+            return
+        # Keep the measurements with the probe data, so normalizing again skips this pass
+        if self.probe_cache:
+            probe_cache, info = self.probe_cache, plan.record.info
+            store = BackgroundCall(lambda: probe_cache.put(plan.input_file, info), self)
+            store.finished.connect(store.deleteLater)
+            store.start()
+        self._submit_normalize_jobs(plan)
+
+    def _submit_normalize_jobs(self, plan):
+        logger.info(plan.summary())
+        jobs = [Job(argv, f"Normalize stream {stream.index} of {os.path.basename(plan.input_file)}",
+                    input_file=plan.input_file, output_files=[output_file],
+                    media_duration=self.catalog.duration(plan.input_file),
+                    estimated_bytes=estimate_output_bytes(plan.record, {stream.index}))
+                for stream, output_file, argv in plan.normalize_commands(progress=True)]
+        self._check_cached_results(jobs, lambda cached: self._queue_normalize_jobs(plan, jobs, cached))
+
+    def _queue_normalize_jobs(self, plan, jobs, cached):
+        queued = 0
+        for job in jobs:
+            output_file = job.output_files[0]
+            if os.path.exists(output_file) and job.id not in cached \
+                    and not confirm_overwrite_dialog(self, output_file):
+                continue
+            try:
+                self.output_policy.stage(job)
+            except OUTPUT_ERRORS as e:
+                self._show_output_error(e)
+                break
+            self._submit_job(job, self._on_normalize_finished)
+            queued += 1
+        self.status_label.setText(f"Normalizing {queued} audio stream(s) of {os.path.basename(plan.input_file)}...")
+
+    def _on_normalize_finished(self, job):
+        if job.state == DONE:
+            self.status_label.setText(f"Normalized audio created: {job.output_files[0]}")
+        elif job.state == CANCELLED:
+            self.status_label.setText("Normalization cancelled.")
         else:
-            self.status_label.setText("No subtitles extracted.")
-            QMessageBox.warning(self, "Extraction Failed", "No subtitles could be extracted. See log for details.")
+            self.status_label.setText("Error normalizing audio.")
+            logger.error(f"Error normalizing {job.description} (job {job.id})")
+            QMessageBox.critical(self, "FFmpeg Error", f"An error occurred. See log: {log_path()}")
 
     def merge_files(self):
-        selected_rows = self.file_table.selectionModel().selectedRows()
-        if len(selected_rows) < 2:
+        nodes = self._selected_nodes()
+        if len(nodes) < 2:
             QMessageBox.warning(self, "Select Files/Streams", "Please select at least a video stream and one audio or subtitle stream to merge.")
             return
 
@@ -612,227 +597,381 @@ class MainWindow(QMainWindow):
         stream_maps = []
         external_files = []
 
-        for row_index in [row.row() for row in selected_rows]:
-            for col in range(self.file_table.columnCount()):
-                item = self.file_table.item(row_index, col)
-                if item:
-                    print(f"Row {row_index} Col {col}: text='{item.text()}', UserRole={item.data(Qt.UserRole)}")
-            stream_name_item = self.file_table.item(row_index, 0)
-            # Check if this is a stream row (expanded)
-            if stream_name_item and stream_name_item.data(Qt.UserRole) == "stream":
-                print(f"Processing stream row {row_index} with name '{stream_name_item.text()}'")
-                # This is a stream row, get the parent video file
-
-                # Find the main file row above this stream row
-                parent_row = row_index - 1
-                while parent_row >= 0:
-                    parent_type_item = self.file_table.item(parent_row, 0)
-                    if parent_type_item and parent_type_item.data(Qt.UserRole) == "main_file":
-                        break
-                    parent_row -= 1
-                if parent_row < 0:
-                    print(f"Could not find parent main file row for stream row {row_index}")
-                    continue
-                parent_file_name = self._get_original_filename(parent_row)
-
-                print(f"Found parent main file row {parent_row} with name '{parent_file_name}'")
-
-                input_file = next((f for f in self.file_streams.keys() if os.path.basename(f) == parent_file_name), None)
-
-                print(f"Input file for stream row: {input_file}")
-
-                if input_file:
-                    stream_name = stream_name_item.text()
-                    print(f"Selected stream name/title from expanded row: '{stream_name}'")
-                    streams = self.file_streams.get(input_file, [])
-                    for s in streams:
-                        name = s.get("tags", {}).get("title", f"Stream {s.get('index', '')}")
-                        if name == stream_name:
-                            stream_type = s.get("codec_type", "unknown")
-                            stream_index = s.get("index", 0)
-                            print(f"Adding to stream_maps: file={input_file}, type={stream_type}, index={stream_index}, name={name}")
-                            stream_maps.append((input_file, stream_type, stream_index))
-                            if stream_type == "video" and not video_file:
-                                video_file = input_file
-                            break
-            else:
+        for node in nodes:
+            if isinstance(node, StreamNode):
+                stream_type = node.stream.get("codec_type", "unknown")
+                stream_maps.append((node.file.path, stream_type, node.stream.get("index", 0)))
+                if stream_type == "video" and not video_file:
+                    video_file = node.file.path
+            elif node.file_type in ("audio", "subtitle"):
                 # Main file row (external audio/subtitle)
-                print(f"Processing main file row {row_index} with name '{stream_name_item.text()}'")
+                external_files.append((node.path, node.file_type))
 
-                file_name = self._get_original_filename(row_index)
-                input_file = next((f for f in self.file_streams.keys() if os.path.basename(f) == file_name), None)
-
-                print(f"Input file for main row: {input_file}")
+        if not video_file:
+            QMessageBox.warning(self, "No Video", "At least one video stream must be selected.")
+            return
 
-                if input_file:
-                    file_type = self.file_table.item(row_index, 1).text().lower()
+        try:
+            output_file = self.output_policy.place(merged_output_path(video_file), video_file, "merge")
+        except OUTPUT_ERRORS as e:
+            self._show_output_error(e)
+            return
 
-                    print(f"Selected file type: {file_type}")
+        cmd = build_merge_command(video_file, stream_maps, external_files, self.catalog, output_file, progress=True)
+        logger.debug(f"Merge command: {cmd}")
+        selected = {}
+        for path, _, index in stream_maps:
+            selected.setdefault(path, set()).add(index)
+        estimate = sum(estimate_output_bytes(self.catalog.get(path), indexes) or 0 for path, indexes in selected.items())
+        estimate += file_bytes(*(path for path, _ in external_files))
+        job = Job(cmd, f"Merge into {os.path.basename(output_file)}", input_file=video_file,
+                  output_files=[output_file], media_duration=self.catalog.duration(video_file),
+                  estimated_bytes=estimate)
+
+        self._check_cached_results([job], lambda cached: self._queue_merge_job(job, cached))
+
+    def _queue_merge_job(self, job, cached):
+        output_file = job.output_files[0]
+        # Check if output file exists (no need to ask if it is this very merge's earlier result)
+        if os.path.exists(output_file) and job.id not in cached:
+            if not confirm_overwrite_dialog(self, output_file):
+                self.status_label.setText("Merge cancelled by user.")
+                return
 
-                    if file_type in ("audio", "subtitle"):
-                        external_files.append((input_file, file_type))
+        try:
+            self.output_policy.stage(job)
+        except OUTPUT_ERRORS as e:
+            self._show_output_error(e)
+            return
+        self._submit_job(job, self._on_merge_finished)
+        self.status_label.setText(f"Merging to {output_file}...")
 
-        if not video_file:
-            QMessageBox.warning(self, "No Video", "At least one video stream must be selected.")
+    def _on_merge_finished(self, job, action="merging files", done_message="Merged file created"):
+        output_file = job.output_files[0]
+        if job.state == DONE:
+            self.status_label.setText(f"{done_message}: {output_file}")
+        elif job.state == CANCELLED:
+            self.status_label.setText(f"Cancelled {action}.")
+        else:
+            self.status_label.setText(f"Error {action}.")
+            logger.error(f"Error {action} into {output_file} (job {job.id})")
+            QMessageBox.critical(self, "FFmpeg Error", f"An error occurred. See log: {log_path()}")
+
+    def concat_files(self):
+        """Join the selected files in table order, stream-copying every segment that allows it"""
+        input_files = [node.path for node in self._selected_nodes()
+                       if isinstance(node, FileNode) and node.path in self.catalog]
+        if len(input_files) < 2:
+            QMessageBox.warning(self, "Select Files", "Please select at least two files to concatenate.")
             return
 
-        base, _ = os.path.splitext(video_file)
-        output_file = f"{base}_merged.mkv"
-
-        # Check if output file exists
-        if os.path.exists(output_file):
-            reply = QMessageBox.question(
-                self,
-                "Overwrite File?",
-                f"The file '{output_file}' already exists.\nDo you want to overwrite it?",
-                QMessageBox.Yes | QMessageBox.No,
-                QMessageBox.No
-            )
+        base, ext = os.path.splitext(input_files[0])
+        try:
+            output_file = self.output_policy.place(f"{base}_joined{ext}", input_files[0], "concat")
+        except OUTPUT_ERRORS as e:
+            self._show_output_error(e)
+            return
+        plan = ConcatPlan(input_files, {f: self.catalog.get(f).info for f in input_files}, output_file)
+        if not plan.reference:
+            QMessageBox.warning(self, "Cannot Concatenate", plan.summary())
+            return
+        if os.path.exists(output_file) and not confirm_overwrite_dialog(self, output_file):
+            self.status_label.setText("Concatenation cancelled by user.")
+            return
+        if plan.method == REENCODE:
+            reply = QMessageBox.question(self, "Re-encode Segments?", plan.summary() + "\n\nContinue?",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
             if reply != QMessageBox.Yes:
-                self.status_label.setText("Merge cancelled by user.")
+                self.status_label.setText("Concatenation cancelled by user.")
                 return
 
-        # Build ffmpeg input arguments
-        input_args = []
-        map_args = []
-        metadata_args = []
-        input_indices = {}
-        idx = 0
-
-        # Add video file as input
-        input_args += ["-i", video_file]
-        input_indices[video_file] = idx
-        idx += 1
-
-        # Add external files as inputs
-        for ext_file, ext_type in external_files:
-            if ext_file not in input_indices:
-                input_args += ["-i", ext_file]
-                input_indices[ext_file] = idx
-                idx += 1
-
-        # Map selected streams from video file, using type-relative index
-        for (input_file, stream_type, stream_index) in stream_maps:
-            file_idx = input_indices[input_file]
-            streams = self.file_streams.get(input_file, [])
-            type_key = stream_type.lower()
-            # Only streams of the same type
-            type_streams = [s for s in streams if s.get("codec_type", "").lower() == type_key]
-            # Find the type-relative index
-            rel_index = None
-            for idx2, s in enumerate(type_streams):
-                if s.get("index") == stream_index:
-                    rel_index = idx2
-                    break
-            if rel_index is None:
-                print(f"Warning: Could not find type-relative index for {stream_type} stream {stream_index} in {input_file}")
-                continue
-            # Debug: print mapping
-            print(f"Mapping {stream_type} stream: file {input_file}, ffmpeg input {file_idx}, type-relative index {rel_index}")
-            if type_key == "video":
-                map_args.append(f"-map {file_idx}:v:{rel_index}")
-            elif type_key == "audio":
-                map_args.append(f"-map {file_idx}:a:{rel_index}")
-            elif type_key == "subtitle":
-                map_args.append(f"-map {file_idx}:s:{rel_index}")
-
-        # Map all streams from external files
-        for ext_file, ext_type in external_files:
-            file_idx = input_indices[ext_file]
-            if ext_type == "audio":
-                map_args.append(f"-map {file_idx}:a:0")
-            elif ext_type == "subtitle":
-                map_args.append(f"-map {file_idx}:s:0")
-
-        # Add language metadata for subtitle streams if available
-        sub_idx = 0
-        for (input_file, stream_type, stream_index) in stream_maps:
-            if stream_type == "subtitle":
-                streams = self.file_streams.get(input_file, [])
-                s = next((s for s in streams if s.get("index") == stream_index), {})
-
-                tags = s.get("tags", {})
-
-                if not tags:
-                    print(f"Warning: No tags found for subtitle stream {stream_index} in {input_file}, using 'und'")
-                    lang = "und"
-                else:
-                    lang = tags.get("language", "und")
-
-                print(f"Adding metadata for subtitle stream {stream_index} in {input_file}: language={lang}")
-
-                metadata_args += [f"-metadata:s:s:{sub_idx}", f"language={lang}"]
-                sub_idx += 1
-
-        for ext_file, ext_type in external_files:
-            if ext_type == "subtitle":
-                streams = self.file_streams.get(ext_file, [])
-                lang = "und"
-                if streams and "tags" in streams[0] and "language" in streams[0]["tags"]:
-                    lang = streams[0]["tags"]["language"]
-                else:
-                    print(f"Warning: No language tag found for subtitle file {ext_file}, using 'und'")
-
-                print(f"Adding metadata for subtitle file {stream_index} in {input_file}: language={lang}")
-
-                metadata_args += [f"-metadata:s:s:{sub_idx}", f"language={lang}"]
-                sub_idx += 1
-
-        # Output command
-        cmd = ["ffmpeg"]
-        cmd += input_args
-        for m in map_args:
-            cmd += m.split()
-        cmd += metadata_args
-        cmd += ["-c", "copy", output_file, "-y"]
+        self.status_label.setText(plan.summary())
+        normalize_jobs = [
+            Job(argv, f"Re-encode {os.path.basename(segment.path)} for joining", input_file=segment.path,
+                output_files=[segment.join_path], media_duration=self.catalog.duration(segment.path),
+                estimated_bytes=file_bytes(segment.path))
+            for segment, argv in plan.normalize_commands(progress=True)
+        ]
+        pending = {job.id for job in normalize_jobs}
+        failed = False
+
+        def on_segment_finished(job):
+            nonlocal failed
+            pending.discard(job.id)
+            if failed:
+                return  # The first failure already cancelled the rest and reported the error
+            if job.state != DONE:
+                failed = True
+                for other in normalize_jobs:
+                    self.job_queue.cancel(other)
+                plan.cleanup()
+                self._on_merge_finished(job, "concatenating files", "Joined file created")
+            elif not pending:
+                self._submit_concat_job(plan)
+
+        for job in normalize_jobs:
+            self._submit_job(job, on_segment_finished)
+        if not normalize_jobs:
+            self._submit_concat_job(plan)
+
+    def _submit_concat_job(self, plan):
+        duration = sum(self.catalog.duration(s.path) or 0.0 for s in plan.segments) or None
+        job = Job(plan.concat_command(progress=True), f"Join into {os.path.basename(plan.output_file)}",
+                  input_file=plan.segments[0].path, output_files=[plan.output_file], media_duration=duration,
+                  estimated_bytes=file_bytes(*(s.join_path for s in plan.segments)))
+        try:
+            self.output_policy.stage(job)
+        except OUTPUT_ERRORS as e:
+            plan.cleanup()
+            self._show_output_error(e)
+            return
 
-        self.status_label.setText(f"Merging to {output_file}...")
-        QApplication.processEvents()  # Ensure UI updates before starting the process
+        def on_finished(job):
+            plan.cleanup()
+            self._on_merge_finished(job, "concatenating files", "Joined file created")
 
-        try:
-            print(f"Running command: {' '.join(cmd)}")  # Debug: print the full command
-            
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode == 0:
-                self.status_label.setText(f"Merged file created: {output_file}")
+        self._submit_job(job, on_finished)
+
+    def _run_extraction(self, streams_to_extract, stream_type):
+        """Queue extraction of (input_file, stream) pairs, one ffmpeg job per input file.
+
+        Every selected stream of the same source is written by one demux pass,
+        so a file is read once no matter how many of its streams are selected.
+        """
+        planned = []
+        for plan in plan_extraction(streams_to_extract, self.catalog):
+            try:
+                for target in plan.targets:
+                    target.output_file = self.output_policy.place(target.output_file, plan.input_file, "extract")
+            except OUTPUT_ERRORS as e:
+                self._show_output_error(e)
+                if not planned:
+                    return
+                break
+            planned.append((plan, self._extraction_job(plan, stream_type)))
+        jobs = [job for _, job in planned]
+        self._check_cached_results(jobs, lambda cached: self._queue_extraction_jobs(planned, stream_type, cached))
+
+    def _queue_extraction_jobs(self, planned, stream_type, cached):
+        queued = 0
+        for plan, job in planned:
+            # Overwrite dialog, unless the existing files are this very extraction's earlier result
+            if job.id not in cached:
+                confirmed = []
+                for target in plan.targets:
+                    if os.path.exists(target.output_file) and not confirm_overwrite_dialog(self, target.output_file):
+                        self.status_label.setText("Extraction cancelled by user.")
+                        continue
+                    confirmed.append(target)
+                if not confirmed:
+                    continue
+                if len(confirmed) < len(plan.targets):
+                    plan.targets = confirmed
+                    job = self._extraction_job(plan, stream_type)
+
+            indexes = ", ".join(str(t.index) for t in plan.targets)
+            try:
+                self.output_policy.stage(job)
+            except OUTPUT_ERRORS as e:
+                self._show_output_error(e)
+                return
+            self._submit_job(job, lambda job, t=stream_type, i=indexes: self._on_extraction_finished(job, t, i))
+            queued += 1
+
+        if queued:
+            self.status_label.setText(f"Queued {queued} {stream_type} extraction job(s)...")
+        elif stream_type == "subtitle":
+            QMessageBox.warning(self, "Extraction Failed", "No subtitles could be extracted. See log for details.")
+
+    def _extraction_job(self, plan, stream_type):
+        indexes = ", ".join(str(t.index) for t in plan.targets)
+        return Job(
+            plan.command(progress=True),
+            f"Extract {stream_type} stream(s) {indexes} from {os.path.basename(plan.input_file)}",
+            input_file=plan.input_file,
+            output_files=plan.output_files,
+            media_duration=self.catalog.duration(plan.input_file),
+            estimated_bytes=estimate_output_bytes(self.catalog.get(plan.input_file),
+                                                  {t.index for t in plan.targets}),
+        )
+
+    def _check_cached_results(self, jobs, then):
+        """Call then(cached) with the ids of the jobs whose existing outputs are from an identical earlier run.
+
+        Those jobs complete without ffmpeg, so overwriting their outputs needs
+        no confirmation. A lookup hashes the job's inputs, so it runs in the
+        background; then is called right away if no job has all its outputs.
+        """
+        candidates = [job for job in jobs if job.output_files and all(os.path.exists(p) for p in job.output_files)]
+        if self.result_cache is None or not candidates:
+            then(set())
+            return
+        result_cache = self.result_cache
+        check = BackgroundCall(lambda: {job.id for job in candidates if is_cached_result(result_cache, job)}, self)
+        check.finished.connect(then)
+        check.finished.connect(check.deleteLater)
+        check.start()
+        self.status_label.setText("Checking for earlier results...")
+
+    def _on_extraction_finished(self, job, stream_type, indexes):
+        if job.state == DONE:
+            if len(job.output_files) == 1:
+                self.status_label.setText(f"{stream_type.capitalize()} extracted: {job.output_files[0]}")
             else:
-                self.status_label.setText("Error merging files.")
-                log_file = os.path.join(os.path.dirname(video_file), "ffmpeg_error.log")
-                logger = get_logger(log_file)
-                logger.error(f"FFmpeg error merging files: {result.stderr}")
-                QMessageBox.critical(self, "FFmpeg Error", f"An error occurred. See log: {log_file}")
-        except Exception as e:
-            self.status_label.setText("Error merging files.")
-            log_file = os.path.join(os.path.dirname(video_file), "ffmpeg_error.log")
-            logger = get_logger(log_file)
-            logger.error(f"Exception merging files: {str(e)}")
-            QMessageBox.critical(self, "Error", f"An error occurred. See log: {log_file}")
+                self.status_label.setText(f"Extracted {len(job.output_files)} {stream_type} file(s).")
+            return
+        if job.state == CANCELLED:
+            self.status_label.setText("Extraction cancelled.")
+            return
+
+        self.status_label.setText(f"Error extracting {stream_type}.")
+        logger.error(f"Error extracting {stream_type} streams {indexes} from {job.input_file} (job {job.id})")
+        if stream_type == "subtitle":
+            QMessageBox.warning(self, "Extraction Failed", "No subtitles could be extracted. See log for details.")
+        else:
+            QMessageBox.critical(self, "FFmpeg Error", f"An error occurred. See log: {log_path()}")
+
+    def _show_output_error(self, error):
+        """Report an output that cannot be placed or staged, instead of letting the error escape the slot"""
+        logger.error(f"Cannot prepare output: {error}")
+        self.status_label.setText("Cannot prepare the output file.")
+        QMessageBox.critical(self, "Output Error", f"Cannot prepare the output file:\n{error}")
+
+    def _submit_job(self, job, on_finished=None):
+        """Queue a job and track it in the job table; on_finished runs on the GUI thread"""
+        if on_finished is not None:
+            self._job_handlers[job.id] = on_finished
+        row = self.job_table.rowCount()
+        self.job_table.insertRow(row)
+        desc_item = QTableWidgetItem(job.description)
+        desc_item.setData(Qt.UserRole, job.id)
+        desc_item.setToolTip(" ".join(job.command))
+        self.job_table.setItem(row, 0, desc_item)
+        self.job_table.setItem(row, 1, QTableWidgetItem(job.state))
+        if job.progress is not None:
+            progress_bar = QProgressBar()
+            progress_bar.setRange(0, 1000)
+            progress_bar.setValue(0)
+            progress_bar.setFormat("Waiting...")
+            self.job_table.setCellWidget(row, 2, progress_bar)
+        self._job_rows[job.id] = (row, job)
+        return self.job_queue.submit(job)
+
+    def _on_job_changed(self, job):
+        entry = self._job_rows.get(job.id)
+        if entry is not None:
+            status_item = self.job_table.item(entry[0], 1)
+            if status_item:
+                status_item.setText(job.state)
+            progress_bar = self.job_table.cellWidget(entry[0], 2)
+            if progress_bar is not None and job.state != QUEUED:
+                self._update_progress_bar(progress_bar, job)
+        if job.finished:
+            handler = self._job_handlers.pop(job.id, None)
+            if handler is not None:
+                handler(job)
+
+    def _update_progress_bar(self, progress_bar, job):
+        progress = job.progress
+        fraction = progress.fraction
+        if job.state == DONE:
+            progress_bar.setRange(0, 1000)
+            progress_bar.setValue(1000)
+        elif fraction is None and job.state == RUNNING:
+            progress_bar.setRange(0, 0)  # Busy indicator until the duration is known
+        else:
+            progress_bar.setRange(0, 1000)
+            progress_bar.setValue(int((fraction or 0.0) * 1000))
+        if job.finished and job.state != DONE:
+            progress_bar.setFormat(job.state)
+        else:
+            progress_bar.setFormat(progress.summary())
+        progress_bar.setToolTip(progress.summary())
+
+    def cancel_jobs(self):
+        """Cancel the jobs selected in the job table, or every unfinished job if none is selected"""
+        selected = [index.row() for index in self.job_table.selectionModel().selectedRows()]
+        jobs = [job for row, job in self._job_rows.values() if row in selected] if selected else \
+            [job for _, job in self._job_rows.values()]
+        cancelled = 0
+        for job in jobs:
+            if not job.finished:
+                self.job_queue.cancel(job)
+                cancelled += 1
+        self.status_label.setText(f"Cancelling {cancelled} job(s)..." if cancelled else "No running jobs to cancel.")
+
+    def closeEvent(self, event):
+        for bridge in (self.job_bridge, self.probe_bridge, self.preview_bridge):
+            bridge.detach()
+            bridge.job_queue.shutdown(cancel=True, wait=False)
+        if self.probe_cache:
+            self.probe_cache.close()
+        if self.result_cache:
+            self.result_cache.close()
+        super().closeEvent(event)
 
     def clear_list(self):
-        self.file_table.setRowCount(0)
-        self.file_streams.clear()
-        self.expanded_rows.clear()
+        self.file_model.clear()
+        self.catalog.clear()
+        self.probe_queue.cancel_all()
+        self.preview_queue.cancel_all()
+        self.probing_files.clear()
         self.status_label.setText("File list cleared. Ready to add new files.")
 
-    def _get_original_filename(self, row):
-        """Helper to get the original filename from a table row, removing any expand indicators"""
-        item = self.file_table.item(row, 0)
-        if not item:
-            return ""
-        filename = item.data(Qt.UserRole + 1) or item.text()
-        # Remove "▼ " or "▶ " prefix if present
-        if filename.startswith("▼ ") or filename.startswith("▶ "):
-            filename = filename[2:]
-        return filename
-
-    def _get_type_relative_index(self, input_file, stream_type, global_index):
-        """Helper to get the type-relative index for a stream (e.g. 0 for first audio, 1 for second, etc.)"""
-        streams = self.file_streams.get(input_file, [])
-        type_streams = [s for s in streams if s.get("codec_type", "").lower() == stream_type.lower()]
-        for idx, s in enumerate(type_streams):
-            if s.get("index") == global_index:
-                return idx
-        return None
+def lookup_files(file_paths, known, probe_cache=None):
+    """[(path, info or None)] of the media files under file_paths not in known; runs off the GUI thread.
+
+    Subtitles are parsed natively and other files looked up in the probe
+    cache; None marks a file that still needs ffprobe.
+    """
+    found = []
+    for file_path in expand_media_paths(file_paths):
+        if file_path in known:
+            continue
+        info = native_subtitle_info(file_path)
+        if info is None and probe_cache:
+            info = probe_cache.get(file_path)
+        found.append((file_path, info))
+    if probe_cache:
+        probe_cache.flush()
+    return found
+
+
+def is_cached_result(result_cache, job):
+    """True if the job's outputs are from an identical earlier run; runs off the GUI thread"""
+    try:
+        return result_cache.lookup(job)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Result cache lookup failed for {job.description}: {e}")
+        return False
+
+
+def _node_order(node):
+    """Sort key putting selected rows in display order"""
+    if isinstance(node, StreamNode):
+        return (node.file.row, node.row)
+    return (node.row, -1)
+
+class ProbeStats:
+    """Throughput and latency of the current import batch"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.total = 0
+        self.done = 0
+        self.added = 0
+        self.latency_sum = 0.0
+
+    def record(self, latency):
+        self.done += 1
+        self.latency_sum += latency or 0.0
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def average_latency(self):
+        return self.latency_sum / self.done if self.done else 0.0
 
 def confirm_overwrite_dialog(parent, output_file):
     reply = QMessageBox.question(
@@ -843,38 +982,3 @@ def confirm_overwrite_dialog(parent, output_file):
         QMessageBox.No
     )
     return reply == QMessageBox.Yes
-
-def get_logger(log_path):
-    logger = logging.getLogger(log_path)
-    if not logger.handlers:
-        handler = logging.FileHandler(log_path)
-        formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        logger.setLevel(logging.INFO)
-    return logger
-
-def get_media_streams(file_path):
-    cmd = [
-        "ffprobe",
-        "-v", "error",
-        "-show_entries", "stream=index,codec_type,codec_name:stream_tags=language,title",
-        "-of", "json",
-        file_path
-    ]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        info = json.loads(result.stdout)
-        # Log ffprobe output for debugging
-        print(f"ffprobe info for {file_path}:\n{json.dumps(info, indent=2)}")
-        return info.get("streams", [])
-    except Exception as e:
-        log_file = os.path.join(os.path.dirname(file_path), "ffmpeg_error.log")
-        logger = get_logger(log_file)
-        logger.error(f"Error probing file {file_path}: {str(e)}")
-        return []
-
-# Example usage in add_file or when a file is selected:
-# streams = get_media_streams(selected_file)
-# for stream in streams:
-#     print(stream["index"], stream["codec_type"], stream["codec_name"])
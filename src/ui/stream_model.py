@@ -0,0 +1,247 @@
+import os
+
+import html
+
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt, pyqtSignal
+from PyQt5.QtGui import QFont, QIcon
+
+COLUMNS = ["File Name", "Type", "Format", "Language"]
+
+
+class FileNode:
+    """Top-level row: one imported file (a placeholder until its probe finishes)"""
+
+    __slots__ = ("path", "streams", "row", "children", "probing")
+
+    def __init__(self, path, streams=None, row=0):
+        self.path = path
+        self.streams = streams or []
+        self.row = row
+        self.children = None  # Stream rows, created when the file is first expanded
+        self.probing = streams is None
+
+    @property
+    def file_type(self):
+        return self.streams[0].get("codec_type", "unknown") if self.streams else "unknown"
+
+    @property
+    def expandable(self):
+        # Only video files with several streams are expanded into stream rows
+        return self.file_type == "video" and len(self.streams) > 1
+
+
+class StreamNode:
+    """Child row: one stream of a file, pointing straight at its probe data"""
+
+    __slots__ = ("file", "stream", "row")
+
+    def __init__(self, file, stream, row):
+        self.file = file
+        self.stream = stream
+        self.row = row
+
+
+class StreamTreeModel(QAbstractItemModel):
+    """Files -> streams tree with lazily created stream rows and batched inserts.
+
+    Video rows show a thumbnail, and their tooltip a contact sheet. The first
+    time a video file's row is displayed, preview_needed is emitted with its
+    path; set_previews() then fills them in.
+    """
+
+    preview_needed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._files = []
+        self._by_path = {}
+        self._previews = {}  # (path, stream index) -> (thumbnail, contact sheet) image paths
+        self._icons = {}  # thumbnail path -> QIcon
+        self._preview_requested = set()
+
+    # Lookup
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else None
+
+    def file_node(self, path):
+        return self._by_path.get(path)
+
+    def files(self):
+        return list(self._files)
+
+    def __contains__(self, path):
+        return path in self._by_path
+
+    # Mutation
+
+    def add_files(self, entries):
+        """Append files in one batch; entries are (path, streams), streams None for a placeholder"""
+        entries = [(path, streams) for path, streams in entries if path not in self._by_path]
+        if not entries:
+            return
+        first = len(self._files)
+        self.beginInsertRows(QModelIndex(), first, first + len(entries) - 1)
+        for offset, (path, streams) in enumerate(entries):
+            node = FileNode(path, streams, first + offset)
+            self._files.append(node)
+            self._by_path[path] = node
+        self.endInsertRows()
+
+    def set_streams(self, path, streams):
+        """Fill in a placeholder once its probe has finished"""
+        node = self._by_path.get(path)
+        if node is None:
+            return
+        node.streams = streams
+        node.probing = False
+        self.dataChanged.emit(self.index(node.row, 0), self.index(node.row, len(COLUMNS) - 1))
+
+    def set_previews(self, path, previews):
+        """Show the preview images of a file's video streams ({stream index: (thumbnail, contact sheet)})"""
+        node = self._by_path.get(path)
+        if node is None:
+            return
+        for index, images in previews.items():
+            self._previews[(path, index)] = images
+        self.dataChanged.emit(self.index(node.row, 0), self.index(node.row, 0))
+        if node.children:
+            parent = self.index(node.row, 0)
+            self.dataChanged.emit(self.index(0, 0, parent), self.index(len(node.children) - 1, 0, parent))
+
+    def preview(self, node):
+        """(thumbnail, contact sheet) of a video stream row, or of a file row's main video stream, or None"""
+        if isinstance(node, StreamNode):
+            return self._previews.get((node.file.path, node.stream.get("index", 0)))
+        if node.probing or node.file_type != "video":
+            return None
+        if node.path not in self._preview_requested:
+            self._preview_requested.add(node.path)
+            self.preview_needed.emit(node.path)
+        video = next((s for s in node.streams if s.get("codec_type") == "video"
+                      and not s.get("disposition", {}).get("attached_pic")), None)
+        return self._previews.get((node.path, video.get("index", 0))) if video else None
+
+    def remove_file(self, path):
+        node = self._by_path.pop(path, None)
+        if node is None:
+            return
+        self.beginRemoveRows(QModelIndex(), node.row, node.row)
+        del self._files[node.row]
+        for row in range(node.row, len(self._files)):
+            self._files[row].row = row
+        self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._files = []
+        self._by_path = {}
+        self._previews = {}
+        self._icons = {}
+        self._preview_requested = set()
+        self.endResetModel()
+
+    # QAbstractItemModel
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        parent_node = self.node(parent)
+        if parent_node is None:
+            return self.createIndex(row, column, self._files[row])
+        if isinstance(parent_node, FileNode) and parent_node.children is not None:
+            return self.createIndex(row, column, parent_node.children[row])
+        return QModelIndex()
+
+    def parent(self, index):
+        node = self.node(index)
+        if isinstance(node, StreamNode):
+            return self.createIndex(node.file.row, 0, node.file)
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        node = self.node(parent)
+        if node is None:
+            return len(self._files)
+        if isinstance(node, FileNode) and node.children is not None:
+            return len(node.children)
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(COLUMNS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if node is None:
+            return bool(self._files)
+        return isinstance(node, FileNode) and node.expandable
+
+    def canFetchMore(self, parent):
+        node = self.node(parent)
+        return isinstance(node, FileNode) and node.expandable and node.children is None
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        if not self.canFetchMore(parent):
+            return
+        self.beginInsertRows(parent, 0, len(node.streams) - 1)
+        node.children = [StreamNode(node, s, row) for row, s in enumerate(node.streams)]
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        node = self.node(index)
+        if node is None:
+            return None
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if isinstance(node, FileNode):
+                return self._file_text(node, column)
+            return self._stream_text(node.stream, column)
+        if role == Qt.FontRole and isinstance(node, FileNode) and column == 0:
+            font = QFont()
+            # Make main file rows bold, placeholders italic
+            font.setBold(not node.probing)
+            font.setItalic(node.probing)
+            return font
+        if role == Qt.DecorationRole and column == 0:
+            preview = self.preview(node)
+            return self._icon(preview[0]) if preview else None
+        if role == Qt.ToolTipRole:
+            path = node.path if isinstance(node, FileNode) else node.file.path
+            preview = self.preview(node)
+            if preview is None:
+                return path
+            return f'{html.escape(path)}<br><img src="{html.escape(preview[1])}">'
+        return None
+
+    def _icon(self, image):
+        icon = self._icons.get(image)
+        if icon is None:
+            icon = self._icons[image] = QIcon(image)
+        return icon
+
+    def _file_text(self, node, column):
+        if column == 0:
+            return os.path.basename(node.path)
+        if node.probing:
+            return "Probing..." if column == 1 else ""
+        if not node.streams:
+            return ""
+        # Describe the file by its first stream
+        return self._stream_text(node.streams[0], column)
+
+    def _stream_text(self, stream, column):
+        if column == 0:
+            return stream.get("tags", {}).get("title", f"Stream {stream.get('index', '')}")
+        if column == 1:
+            return stream.get("codec_type", "unknown").capitalize()
+        if column == 2:
+            return stream.get("codec_name", "unknown").upper()
+        return stream.get("tags", {}).get("language", "")
@@ -0,0 +1,445 @@
+"""Watch-folder ingest: process media files dropped into hot folders.
+
+Watched directories are rescanned every few seconds, and immediately when
+inotify reports a change (Linux; plain polling elsewhere). A file counts as
+arrived once its size and mtime have stopped changing for `settle` seconds.
+It is then probed and handed to an IngestRule, which turns it into extract
+or merge jobs run on a bounded JobQueue; a video to merge waits until the
+tracks beside it have arrived too. Everything handled (sources, the
+outputs written for them, and external tracks) is appended to a JSON-lines
+journal, so a restarted service skips it. Nothing here needs the GUI.
+"""
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+from app_dirs import user_data_dir
+from disk_scheduler import DiskScheduler
+from extraction import extract_jobs
+from file_handlers import validate_file_type
+from jobs import Job, JobQueue, DONE
+from media_probe import native_subtitle_info, probe_command, parse_probe_output
+from merge_rules import SeriesMergeRule, episode_key, plan_series_merge, series_jobs
+from probe_cache import file_identity
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 2.0
+DEFAULT_SETTLE = 5.0
+
+# Journal statuses
+PROCESSED = "processed"
+FAILED = "failed"
+SKIPPED = "skipped"
+EXTERNAL = "external"
+OUTPUT = "output"
+
+
+class ProcessedJournal:
+    """Append-only JSON-lines record of files already handled, keyed by path and identity.
+
+    A file whose size or mtime changed since it was recorded is treated as
+    new. The journal is compacted on load when it holds many stale lines.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(user_data_dir(), "watch_journal.jsonl")
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        lines = 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self._entries[entry["path"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning(f"Ignoring malformed line {lines} of {self.path}")
+        except FileNotFoundError:
+            return
+        if lines > 2 * len(self._entries) + 100:
+            self._rewrite()
+
+    def _rewrite(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def seen(self, path, identity):
+        entry = self._entries.get(path)
+        return entry is not None and identity is not None and tuple(entry["identity"]) == tuple(identity[:2])
+
+    def status(self, path):
+        entry = self._entries.get(path)
+        return entry["status"] if entry else None
+
+    def record(self, path, status, outputs=()):
+        identity = file_identity(path)
+        if identity is None:
+            return
+        entry = {"path": path, "identity": list(identity[:2]), "status": status,
+                 "outputs": list(outputs), "time": time.time()}
+        with self._lock:
+            self._entries[path] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class IngestRule:
+    """What to do with each arrived video: extract streams from it, or merge it with its external tracks.
+
+    Saved as JSON, e.g. {"action": "extract", "types": ["audio", "subtitle"]}
+    or {"action": "merge", "select": {"audio": ["eng"]}, "output": "{dir}/{stem}.mkv"}.
+    Merges pick up audio/subtitle files next to the video that share its
+    episode key, the same pairing the series command uses.
+    """
+
+    ACTIONS = ("extract", "merge")
+
+    def __init__(self, action, types=None, streams=None, merge_rule=None, overwrite=True):
+        if action not in self.ACTIONS:
+            raise ValueError(f"Unknown ingest action: {action!r}")
+        self.action = action
+        self.types = types
+        self.streams = streams
+        self.merge_rule = merge_rule or SeriesMergeRule()
+        # A source missing from the journal was never finished, so stale outputs are replaced
+        self.overwrite = overwrite
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(spec.get("action"), spec.get("types"), spec.get("streams"),
+                   SeriesMergeRule.from_dict(spec), spec.get("overwrite", True))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def jobs(self, video_file, infos, externals=(), policy=None):
+        # Job builders are shared with the batch CLI; skipped outputs are logged
+        if self.action == "extract":
+            return extract_jobs([video_file], infos, self.types, self.streams, self.overwrite, policy)
+        specs = plan_series_merge([video_file], list(externals), infos, self.merge_rule)
+        return series_jobs(specs, infos, self.overwrite, policy)
+
+
+class InotifyWakeup:
+    """Calls notify() as soon as a file is written, moved or created in a watched directory (Linux only)"""
+
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, notify):
+        self._notify = notify
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watched = set()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._read_events, name="inotify", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def create(cls, notify):
+        """An InotifyWakeup, or None where inotify is unavailable"""
+        try:
+            return cls(notify)
+        except (OSError, AttributeError, TypeError):
+            return None
+
+    def watch(self, directory):
+        if directory in self._watched:
+            return
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.MASK) >= 0:
+            self._watched.add(directory)
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join(timeout=2)
+        os.close(self._fd)
+
+    def _read_events(self):
+        while not self._stopped.is_set():
+            readable, _, _ = select.select([self._fd], [], [], 1.0)
+            if not readable:
+                continue
+            try:
+                while os.read(self._fd, 64 * 1024):
+                    pass
+            except BlockingIOError:
+                pass
+            self._notify()
+
+
+class WatchService:
+    """Scan, settle, probe and process loop for a set of hot folders.
+
+    State is only touched by the thread running run(); job listeners and the
+    inotify thread just post events to it.
+    """
+
+    def __init__(self, directories, rule, journal=None, max_workers=2, interval=DEFAULT_INTERVAL,
+                 settle=DEFAULT_SETTLE, recursive=True, cache=None, use_inotify=True, policy=None):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.rule = rule
+        self.journal = journal if journal is not None else ProcessedJournal()
+        self.interval = interval
+        self.settle = settle
+        self.recursive = recursive
+        self.cache = cache
+        self.policy = policy  # Output root, name templates and staging (see output_policy)
+        self.queue = JobQueue(max_workers=max_workers, scheduler=DiskScheduler())
+        # Probes get their own pool so new arrivals are not stuck behind long remuxes
+        self.probe_queue = JobQueue(max_workers=max_workers)
+        self._events = queue.SimpleQueue()
+        for job_queue in (self.queue, self.probe_queue):
+            job_queue.add_listener(self._on_job_changed)
+        self._stop = threading.Event()
+        self._inotify = InotifyWakeup.create(lambda: self._events.put(None)) if use_inotify else None
+        self._candidates = {}  # path -> (identity, monotonic time it was last seen changing)
+        self._probing = {}  # job id -> path
+        self._probing_paths = set()  # The paths of _probing, for the per-file checks of every scan
+        self._probed = {}  # path -> probe info, waiting to be processed
+        self._track_infos = {}  # path -> probe info of the audio/subtitle files recorded as external tracks
+        self._source_jobs = {}  # source path -> the jobs processing it
+        self._job_sources = {}  # job id -> source path
+        self._in_flight_outputs = set()
+
+    def stop(self):
+        self._stop.set()
+        self._events.put(None)
+
+    @property
+    def busy(self):
+        return bool(self._candidates or self._probing or self._probed or self._source_jobs)
+
+    def run(self, once=False):
+        """Process files until stop() is called; with once, return when no work is left"""
+        logger.info(f"Watching {', '.join(self.directories)}"
+                    f"{' (inotify)' if self._inotify else ''}, journal {self.journal.path}")
+        try:
+            while not self._stop.is_set():
+                self._scan()
+                self._start_processing()
+                if once and not self.busy:
+                    break
+                self._wait_for_events()
+        finally:
+            for job_queue in (self.probe_queue, self.queue):
+                job_queue.shutdown(cancel=True)
+            if self._inotify:
+                self._inotify.close()
+
+    def _wait_for_events(self):
+        try:
+            event = self._events.get(timeout=self.interval)
+        except queue.Empty:
+            return
+        while True:
+            if event is not None:
+                self._on_job_finished(event)
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                return
+
+    def _on_job_changed(self, job):
+        # Worker thread: hand finished jobs over to the service loop
+        if job.finished:
+            self._events.put(job)
+
+    def _scan(self):
+        """Track media files under the watched directories and probe those that have settled"""
+        now = time.monotonic()
+        present = set()
+        for path in self._media_files():
+            present.add(path)
+            if path in self._in_flight_outputs or path in self._probed or path in self._source_jobs:
+                continue
+            if path in self._probing_paths:
+                continue
+            identity = file_identity(path)
+            if identity is None or self.journal.seen(path, identity):
+                self._candidates.pop(path, None)
+                continue
+            previous = self._candidates.get(path)
+            if previous is None or previous[0] != identity:
+                self._candidates[path] = (identity, now)
+            elif now - previous[1] >= self.settle:
+                del self._candidates[path]
+                self._probe(path)
+        for path in list(self._candidates):
+            if path not in present:
+                del self._candidates[path]
+        for path in list(self._track_infos):
+            if path not in present:
+                del self._track_infos[path]
+
+    def _media_files(self):
+        for directory in self.directories:
+            stack = [directory]
+            while stack:
+                current = stack.pop()
+                if self._inotify:
+                    self._inotify.watch(current)
+                try:
+                    entries = list(os.scandir(current))
+                except OSError as e:
+                    logger.warning(f"Cannot scan {current}: {e}")
+                    continue
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue  # Hidden files, and the temp directories of running jobs
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive:
+                            stack.append(entry.path)
+                    elif entry.is_file() and validate_file_type(entry.name.lower()):
+                        yield entry.path
+
+    def _probe(self, path):
+        info = native_subtitle_info(path)
+        if info is None and self.cache:
+            info = self.cache.get(path)
+        if info is not None:
+            self._probed[path] = info
+            return
+        job = self.probe_queue.submit(Job(probe_command(path), f"Probe {os.path.basename(path)}", input_file=path))
+        self._probing[job.id] = path
+        self._probing_paths.add(path)
+
+    def _on_job_finished(self, job):
+        path = self._probing.pop(job.id, None)
+        if path is not None:
+            self._probing_paths.discard(path)
+            info = {}
+            if job.state == DONE:
+                try:
+                    info = parse_probe_output(job.stdout)
+                except ValueError as e:
+                    logger.error(f"Error probing file {path}: {e}")
+            if info.get("streams"):
+                if self.cache:
+                    self.cache.put(path, info)
+                self._probed[path] = info
+            else:
+                logger.error(f"Error probing file {path}: {str(job.error or job.stderr).strip()}")
+                self.journal.record(path, FAILED)
+            return
+
+        source = self._job_sources.pop(job.id, None)
+        jobs = self._source_jobs.get(source)
+        if jobs is None or not all(j.finished for j in jobs):
+            return
+        del self._source_jobs[source]
+        outputs = [o for j in jobs for o in j.output_files]
+        failed = any(j.state != DONE for j in jobs)
+        for output in outputs:
+            self._in_flight_outputs.discard(output)
+            if os.path.exists(output):
+                self.journal.record(output, OUTPUT)
+        self.journal.record(source, FAILED if failed else PROCESSED, outputs)
+        logger.info(f"{'Failed' if failed else 'Processed'} {source}")
+
+    def _start_processing(self):
+        """Apply the rule to every probed file as soon as it can be planned.
+
+        Audio/subtitle files are recorded first, so that a video probed in the
+        same pass is merged with them. A video to merge waits while a file that
+        could be one of its external tracks is still settling or being probed,
+        and while tracks recorded by an earlier run are probed again (usually
+        from the cache); other files never wait for unrelated probes.
+        """
+        for path, info in list(self._probed.items()):
+            streams = info.get("streams", [])
+            if not streams or streams[0].get("codec_type") != "video":
+                # Standalone audio/subtitle tracks are only used as merge inputs
+                del self._probed[path]
+                self._track_infos[path] = info
+                self.journal.record(path, EXTERNAL)
+        for path in list(self._probed):
+            siblings = self._sibling_files(path) if self.rule.action == "merge" else []
+            if any(self._arriving(sibling) for sibling in siblings):
+                continue
+            earlier = [sibling for sibling in siblings if sibling not in self._probed
+                       and sibling not in self._track_infos and self.journal.status(sibling) == EXTERNAL]
+            if earlier:
+                for sibling in earlier:
+                    if sibling not in self._probing_paths:
+                        self._probe(sibling)
+                continue
+            self._process(path, self._probed.pop(path), siblings)
+
+    def _arriving(self, path):
+        """True if path has not settled and been probed yet (it may still be copying)"""
+        if path in self._probed:
+            return False
+        identity = file_identity(path)
+        return identity is not None and not self.journal.seen(path, identity)
+
+    def _process(self, path, info, siblings=()):
+        infos = {path: info}
+        externals = []
+        if siblings:
+            infos.update(self._sibling_infos(siblings))
+            externals = [f for f, i in infos.items()
+                         if f != path and i.get("streams") and i["streams"][0].get("codec_type") in ("audio", "subtitle")]
+        try:
+            jobs = self.rule.jobs(path, infos, externals, self.policy)
+        except (ValueError, KeyError) as e:
+            logger.error(f"Cannot process {path}: {e}")
+            self.journal.record(path, FAILED)
+            return
+        if not jobs:
+            self.journal.record(path, SKIPPED)
+            return
+        self._source_jobs[path] = jobs
+        for job in jobs:
+            self._in_flight_outputs.update(job.output_files)
+            self._job_sources[job.id] = path
+            self.queue.submit(job)
+        logger.info(f"Queued {len(jobs)} job(s) for {path}")
+
+    def _sibling_infos(self, siblings):
+        """Probe info of the siblings probed so far"""
+        infos = {}
+        for sibling in siblings:
+            if sibling in self._probed:
+                infos[sibling] = self._probed[sibling]
+            elif sibling in self._track_infos:
+                infos[sibling] = self._track_infos[sibling]
+        return infos
+
+    def _sibling_files(self, video_file):
+        """Media files next to a video that share its episode key (candidate external tracks)"""
+        directory = os.path.dirname(video_file)
+        key = episode_key(video_file)
+        siblings = []
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError:
+            return siblings
+        for entry in entries:
+            if (entry.path != video_file and entry.is_file() and not entry.name.startswith(".")
+                    and validate_file_type(entry.name.lower()) and entry.path not in self._in_flight_outputs
+                    and self.journal.status(entry.path) != OUTPUT and episode_key(entry.path) == key):
+                siblings.append(entry.path)
+        return siblings
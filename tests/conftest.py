@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# Modules are imported flat from src/, as main.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+@pytest.fixture
+def media_record():
+    """Build a MediaRecord from a list of ffprobe stream dicts"""
+    from media_catalog import MediaRecord
+
+    def build(streams, duration=60.0, start_time=0.0, path="movie.mkv", keyframes=None):
+        info = {"streams": [dict(s, index=n) for n, s in enumerate(streams)],
+                "format": {"duration": str(duration), "start_time": str(start_time)}}
+        if keyframes is not None:
+            info["keyframes"] = {"0": list(keyframes)}  # Of stream 0, the main video stream
+        return MediaRecord(path, info)
+
+    return build
@@ -0,0 +1,73 @@
+from concat import COPY, REENCODE, ConcatPlan, layout_differences, reencode_args, stream_layout
+from result_cache import concat_list_files
+
+H264 = {"codec_type": "video", "codec_name": "h264", "profile": "High", "width": 1920, "height": 1080,
+        "pix_fmt": "yuv420p", "r_frame_rate": "25/1", "time_base": "1/12800"}
+AAC = {"codec_type": "audio", "codec_name": "aac", "profile": "LC", "sample_rate": "48000", "channels": 2,
+       "channel_layout": "stereo", "time_base": "1/48000"}
+SUBTITLE = {"codec_type": "subtitle", "codec_name": "subrip"}
+
+
+def _info(*streams):
+    return {"streams": [dict(s, index=n) for n, s in enumerate(streams)]}
+
+
+def test_stream_layout_ignores_subtitles():
+    assert [t for t, _ in stream_layout(_info(H264, SUBTITLE, AAC)["streams"])] == ["video", "audio"]
+
+
+def test_layout_differences_name_the_mismatched_parameters():
+    reference = stream_layout([H264, AAC])
+    assert layout_differences(reference, stream_layout([H264, AAC])) == []
+    assert layout_differences(reference, stream_layout([dict(H264, width=1280), dict(AAC, sample_rate="44100")])) \
+        == ["video 0 width 1280 != 1920", "audio 0 sample_rate 44100 != 48000"]
+    assert layout_differences(reference, stream_layout([H264])) == ["stream layout video differs from video+audio"]
+
+
+def test_matching_files_are_joined_by_stream_copy(tmp_path):
+    files = [str(tmp_path / f"part{n}.mkv") for n in range(3)]
+    plan = ConcatPlan(files, {f: _info(H264, AAC) for f in files}, str(tmp_path / "joined.mkv"))
+    try:
+        assert plan.method == COPY
+        assert plan.normalize_commands() == []
+        argv = plan.concat_command()
+        list_path = argv[argv.index("-i") + 1]
+        assert concat_list_files(list_path) == files
+        assert argv[argv.index("-c") + 1] == "copy"
+    finally:
+        plan.cleanup()
+
+
+def test_only_mismatched_files_are_reencoded_to_the_first(tmp_path):
+    files = [str(tmp_path / f"part{n}.mkv") for n in range(3)]
+    infos = {files[0]: _info(H264, AAC), files[1]: _info(dict(H264, width=1280, height=720), AAC),
+             files[2]: _info(H264, AAC)}
+    plan = ConcatPlan(files, infos, str(tmp_path / "joined.mkv"))
+    try:
+        assert plan.method == REENCODE
+        [(segment, argv)] = plan.normalize_commands()
+        assert segment.path == files[1]
+        assert "scale=1920:1080" in argv
+        assert argv[-1] == segment.join_path
+        argv = plan.concat_command()
+        list_path = argv[argv.index("-i") + 1]
+        assert concat_list_files(list_path) == [files[0], segment.join_path, files[2]]
+    finally:
+        plan.cleanup()
+    assert plan.work_dir is None
+
+
+def test_unprobed_segment_is_reported():
+    plan = ConcatPlan(["a.mkv", "b.mkv"], {"a.mkv": _info(H264)}, "out.mkv")
+    assert plan.segments[1].reasons == ["not probed"]
+    assert ConcatPlan(["b.mkv"], {}, "out.mkv").summary().startswith("Cannot concatenate")
+
+
+def test_reencode_args_match_the_reference_layout():
+    maps, codecs, options = reencode_args(stream_layout([H264, AAC, dict(AAC, channels=6)]), "out.mp4")
+    assert maps == ["0:v:0", "0:a:0", "0:a:1"]
+    assert codecs == {"v:0": "libx264", "a:0": "aac", "a:1": "aac"}
+    assert options[options.index("-ac:a:1") + 1] == "6"
+    assert options[options.index("-video_track_timescale") + 1] == "12800"
+    maps, _, _ = reencode_args(stream_layout([H264, AAC]), "out.mkv", input_index=1, source_indexes=[0, 2])
+    assert maps == ["1:v:0", "1:a:2"]
@@ -0,0 +1,92 @@
+import pytest
+
+import disk_scheduler
+from disk_scheduler import DiskScheduler, DiskSpaceError, estimate_output_bytes
+from jobs import Job
+from media_catalog import MediaRecord
+from output_policy import OutputPolicy
+
+MB = 1000 * 1000
+
+
+@pytest.fixture
+def free_space(monkeypatch):
+    """Pretend every directory has this many free bytes"""
+    space = {"free": 100 * MB}
+    monkeypatch.setattr(disk_scheduler, "_free_bytes", lambda directory: space["free"])
+    return space
+
+
+def _job(tmp_path, name, size, input_file=None):
+    return Job(["ffmpeg"], name, input_file=input_file, output_files=[str(tmp_path / name)], estimated_bytes=size)
+
+
+def test_running_jobs_reserve_their_estimated_output(tmp_path, free_space):
+    scheduler = DiskScheduler(per_device=10, margin=1.0, min_free=0)
+    first, second = _job(tmp_path, "first.mkv", 60 * MB), _job(tmp_path, "second.mkv", 60 * MB)
+    assert scheduler.admit(first)
+    assert not scheduler.admit(second)  # Would fit alone, not next to the first one's output
+    scheduler.release(first)
+    assert scheduler.admit(second)
+
+
+def test_job_that_can_never_fit_is_refused(tmp_path, free_space):
+    scheduler = DiskScheduler(min_free=10 * MB)
+    with pytest.raises(DiskSpaceError):
+        scheduler.admit(_job(tmp_path, "huge.mkv", 95 * MB))
+
+
+def test_overwritten_output_counts_as_free_space(tmp_path, free_space):
+    (tmp_path / "movie.mkv").write_bytes(b"x" * 1000)
+    free_space["free"] = 500
+    scheduler = DiskScheduler(per_device=10, margin=1.0, min_free=0)
+    assert scheduler.admit(_job(tmp_path, "movie.mkv", 1200))  # Written in place
+
+
+def test_per_device_limit(tmp_path, free_space):
+    scheduler = DiskScheduler(per_device=1, margin=1.0, min_free=0)
+    source = tmp_path / "source.mkv"
+    source.write_bytes(b"media")
+    first = _job(tmp_path, "a.mka", MB, str(source))
+    second = _job(tmp_path, "b.mka", MB, str(source))
+    assert scheduler.admit(first)
+    assert not scheduler.admit(second)
+    scheduler.release(first)
+    assert scheduler.admit(second)
+
+
+def test_staged_overwrite_frees_nothing_until_published(tmp_path, free_space):
+    (tmp_path / "movie.mkv").write_bytes(b"x" * 1000)
+    free_space["free"] = 500
+    scheduler = DiskScheduler(per_device=10, margin=1.0, min_free=0)
+    with pytest.raises(DiskSpaceError):
+        scheduler.admit(OutputPolicy().stage(_job(tmp_path, "movie.mkv", 1200)))
+
+
+def test_reading_a_shared_source_is_not_limited(tmp_path, free_space, monkeypatch):
+    # The source is on its own device; every output on another one
+    source = str(tmp_path / "source.mkv")
+    monkeypatch.setattr(disk_scheduler, "device_of", lambda path: 1 if path == source else hash(path))
+    scheduler = DiskScheduler(per_device=1, margin=1.0, min_free=0)
+    assert scheduler.admit(_job(tmp_path, "chunk1.mkv", MB, source))
+    assert scheduler.admit(_job(tmp_path, "chunk2.mkv", MB, source))
+
+
+def test_jobs_without_an_estimate_only_need_the_minimum(tmp_path, free_space):
+    free_space["free"] = 20 * MB
+    assert DiskScheduler(min_free=10 * MB).admit(_job(tmp_path, "unknown.mkv", None))
+    with pytest.raises(DiskSpaceError):
+        DiskScheduler(min_free=30 * MB).admit(_job(tmp_path, "unknown.mkv", None))
+
+
+def test_estimate_output_bytes_shares_the_unknown_bit_rate():
+    record = MediaRecord("movie.mkv", {
+        "streams": [{"index": 0, "codec_type": "video"},
+                    {"index": 1, "codec_type": "audio", "bit_rate": "200000"},
+                    {"index": 2, "codec_type": "audio"}],
+        "format": {"duration": "100", "bit_rate": "2200000"}})
+    assert estimate_output_bytes(record, {1}) == 200000 * 100 // 8
+    assert estimate_output_bytes(record, {0}) == 1000000 * 100 // 8
+    assert estimate_output_bytes(record) == 2200000 * 100 // 8
+    assert estimate_output_bytes(record, {1}, duration=10) == 200000 * 10 // 8
+    assert estimate_output_bytes(None) is None
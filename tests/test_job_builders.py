@@ -0,0 +1,46 @@
+from extraction import extract_jobs, select_streams
+from merge_rules import MergeSpec, series_jobs
+
+VIDEO = {"codec_type": "video", "codec_name": "h264"}
+AUDIO = {"codec_type": "audio", "codec_name": "aac", "tags": {"language": "eng"}}
+SUBTITLE = {"codec_type": "subtitle", "codec_name": "subrip", "tags": {"language": "fre"}}
+DATA = {"codec_type": "data"}
+
+
+def _info(*streams):
+    return {"streams": [dict(s, index=n) for n, s in enumerate(streams)], "format": {"duration": "60"}}
+
+
+def test_select_streams_by_type_and_index():
+    streams = _info(VIDEO, AUDIO, SUBTITLE, DATA)["streams"]
+    assert [s["index"] for s in select_streams(streams)] == [0, 1, 2]
+    assert [s["index"] for s in select_streams(streams, types=["audio", "subtitle"])] == [1, 2]
+    assert [s["index"] for s in select_streams(streams, indexes=[0, 2])] == [0, 2]
+
+
+def test_extract_jobs_write_every_stream_of_a_file_in_one_job(tmp_path):
+    movie = str(tmp_path / "movie.mkv")
+    jobs = extract_jobs([movie], {movie: _info(VIDEO, AUDIO, SUBTITLE)}, types=["audio", "subtitle"])
+    assert len(jobs) == 1
+    assert jobs[0].output_files == [str(tmp_path / "movie_audio_eng.aac"), str(tmp_path / "movie_subtitle_fre.srt")]
+
+
+def test_extract_jobs_report_existing_outputs_instead_of_printing(tmp_path, capsys):
+    movie = str(tmp_path / "movie.mkv")
+    (tmp_path / "movie_audio_eng.aac").write_bytes(b"old")
+    messages = []
+    jobs = extract_jobs([movie], {movie: _info(VIDEO, AUDIO)}, types=["audio"], report=messages.append)
+    assert jobs == []
+    assert messages and "movie_audio_eng.aac" in messages[0]
+    assert capsys.readouterr() == ("", "")
+
+
+def test_series_jobs_skip_episodes_that_cannot_be_merged(tmp_path, capsys):
+    episode = str(tmp_path / "show.s01e01.mkv")
+    audio_only = str(tmp_path / "show.s01e02.mkv")
+    infos = {episode: _info(VIDEO, AUDIO), audio_only: _info(AUDIO)}
+    specs = [MergeSpec(episode, None, [], str(tmp_path / "out1.mkv")),
+             MergeSpec(audio_only, None, [], str(tmp_path / "out2.mkv"))]
+    jobs = series_jobs(specs, infos)
+    assert [job.output_files for job in jobs] == [[str(tmp_path / "out1.mkv")]]
+    assert capsys.readouterr() == ("", "")
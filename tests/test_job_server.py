@@ -0,0 +1,131 @@
+import sys
+import threading
+import urllib.request
+
+import pytest
+
+import job_server
+from job_server import JobServer, Worker, job_from_spec, job_spec
+from jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, Job
+from output_policy import OutputPolicy
+
+
+def _job(name="job"):
+    return Job(["ffmpeg", "-i", "in.mkv", "out.mkv"], name, input_file="in.mkv", output_files=["out.mkv"])
+
+
+def _post(server, path, worker, **request):
+    return server.handle("POST", path, dict(request, worker=worker))
+
+
+def test_jobs_are_leased_in_order_up_to_the_limit():
+    server = JobServer(max_workers=2)
+    jobs = [server.submit(_job(f"job {n}")) for n in range(3)]
+    status, reply = _post(server, "/lease", "w1")
+    assert status == 200 and reply["job"]["id"] == jobs[0].id
+    assert _post(server, "/lease", "w2")[1]["job"]["id"] == jobs[1].id
+    assert _post(server, "/lease", "w3") == (204, None)
+    assert [j.state for j in jobs] == [RUNNING, RUNNING, QUEUED]
+    assert server.workers() == ["w1", "w2", "w3"]
+
+
+def test_results_are_only_accepted_from_the_lease_holder():
+    server = JobServer()
+    job = server.submit(_job())
+    _post(server, "/lease", "w1")
+    assert _post(server, "/result", "w2", job=job.id, state=DONE) == (200, {"accepted": False})
+    assert _post(server, "/heartbeat", "w2", job=job.id) == (200, {"cancel": True})
+    assert _post(server, "/result", "w1", job=job.id, state=FAILED, returncode=1, stderr="boom",
+                 error="exit 1") == (200, {"accepted": True})
+    assert job.state == FAILED and job.stderr == "boom" and str(job.error) == "exit 1"
+    assert server.wait(timeout=0)
+
+
+def test_cancel_reaches_the_worker_with_its_next_heartbeat():
+    server = JobServer()
+    leased, queued = server.submit(_job("leased")), server.submit(_job("queued"))
+    _post(server, "/lease", "w1")
+    assert _post(server, "/heartbeat", "w1", job=leased.id) == (200, {"cancel": False})
+    server.cancel(leased)
+    assert leased.state == RUNNING
+    assert _post(server, "/heartbeat", "w1", job=leased.id) == (200, {"cancel": True})
+    server.cancel(queued)
+    assert queued.state == CANCELLED
+    assert _post(server, "/lease", "w2") == (204, None)
+
+
+def test_bad_requests():
+    server = JobServer()
+    assert server.handle("POST", "/lease", {})[0] == 400
+    assert server.handle("POST", "/unknown", {"worker": "w1"})[0] == 404
+    assert server.handle("GET", "/status", None) == (200, {"jobs": [], "workers": ["w1"]})
+
+
+def test_lost_worker_jobs_are_leased_again_then_failed(monkeypatch):
+    monkeypatch.setattr(job_server, "HEARTBEAT_INTERVAL", 0.01)
+    server = JobServer(port=0, lease_timeout=0.05, max_lost=1).start()
+    try:
+        changed = threading.Condition()
+
+        def on_changed(job):
+            with changed:
+                changed.notify_all()
+
+        server.add_listener(on_changed)
+        job = server.submit(_job())
+        for expected in (QUEUED, FAILED):
+            assert _post(server, "/lease", "w1")[0] == 200
+            with changed:
+                assert changed.wait_for(lambda: job.state == expected, timeout=5)
+        assert "lost" in str(job.error)
+        # The lost worker's late result is ignored
+        assert _post(server, "/result", "w1", job=job.id, state=DONE)[1] == {"accepted": False}
+    finally:
+        server.stop()
+
+
+def test_token_is_required_over_http():
+    server = JobServer(port=0, token="secret").start()
+    try:
+        request = urllib.request.Request(f"http://127.0.0.1:{server.port}/status")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request, timeout=5)
+        assert error.value.code == 401
+        request.add_header("Authorization", "Bearer secret")
+        with urllib.request.urlopen(request, timeout=5) as response:
+            assert response.status == 200
+    finally:
+        server.stop()
+
+
+def test_workers_only_run_ffmpeg_and_ffprobe():
+    spec = job_spec(_job())
+    assert job_from_spec(spec).command == spec["command"]
+    with pytest.raises(ValueError):
+        job_from_spec(dict(spec, command=["rm", "-rf", "/"]))
+
+
+def test_staged_jobs_are_sent_with_their_final_outputs(tmp_path):
+    job = OutputPolicy().stage(Job(["ffmpeg", "-i", "in.mkv", str(tmp_path / "out.mkv")],
+                                   output_files=[str(tmp_path / "out.mkv")]))
+    spec = job_spec(job)
+    assert spec["command"][-1] == str(tmp_path / "out.mkv") and spec["stage"]
+    assert list(job_from_spec(spec).staged.values()) == [str(tmp_path / "out.mkv")]
+
+
+def test_worker_runs_a_leased_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_server, "ALLOWED_PROGRAMS", (sys.executable,))
+    server = JobServer(port=0).start()
+    stop = threading.Event()
+    try:
+        marker = tmp_path / "ran"
+        job = server.submit(Job([sys.executable, "-c", f"open({str(marker)!r}, 'w').close()"], "remote"))
+        worker = Worker(f"http://127.0.0.1:{server.port}", name="w1", poll_interval=0.05)
+        thread = threading.Thread(target=worker.run, args=(stop,), daemon=True)
+        thread.start()
+        assert server.wait(timeout=10)
+        assert job.state == DONE
+        assert marker.exists()
+    finally:
+        stop.set()
+        server.stop()
@@ -0,0 +1,105 @@
+import sys
+import threading
+
+from jobs import CANCELLED, DONE, FAILED, QUEUED, Job, JobQueue
+
+QUICK = [sys.executable, "-c", "pass"]
+
+
+class RecordingScheduler:
+    """Admits jobs like a DiskScheduler, checking that the queue lock is free while it does"""
+
+    def __init__(self, refuse=(), hold=()):
+        self.refuse = set(refuse)
+        self.hold = set(hold)
+        self.queue = None
+        self.admitted = []
+        self.released = []
+        self.locked_during_admit = False
+
+    def admit(self, job):
+        self.locked_during_admit |= self.queue._lock.locked()
+        if job.description in self.refuse:
+            raise OSError("no space")
+        if job.description in self.hold:
+            return False
+        self.admitted.append(job.description)
+        return True
+
+    def release(self, job):
+        self.released.append(job.description)
+
+
+def test_jobs_are_admitted_outside_the_queue_lock():
+    scheduler = RecordingScheduler(refuse={"refused"})
+    queue = JobQueue(max_workers=2, scheduler=scheduler)
+    scheduler.queue = queue
+    jobs = [queue.submit(Job(QUICK, name)) for name in ("a", "refused", "b", "c")]
+    assert queue.wait(timeout=10)
+    assert not scheduler.locked_during_admit
+    assert [job.state for job in jobs] == [DONE, FAILED, DONE, DONE]
+    assert isinstance(jobs[1].error, OSError)
+    assert sorted(scheduler.admitted) == ["a", "b", "c"]
+
+
+def test_held_jobs_are_passed_over_for_later_ones():
+    scheduler = RecordingScheduler(hold={"held"})
+    queue = JobQueue(max_workers=1, scheduler=scheduler)
+    scheduler.queue = queue
+    later_done = threading.Event()
+    queue.add_listener(lambda job: job.description == "later" and job.finished and later_done.set())
+    held = queue.submit(Job(QUICK, "held"))
+    later = queue.submit(Job(QUICK, "later"))
+    assert later_done.wait(10)
+    assert later.state == DONE
+    assert held.state == QUEUED
+    queue.cancel(held)
+    assert held.state == CANCELLED
+    assert queue.wait(timeout=10)
+
+
+def test_job_cancelled_during_admission_is_released_and_not_run():
+    queue = JobQueue(max_workers=1)
+    job = Job(QUICK, "slow admission")
+    admitting = threading.Event()
+    proceed = threading.Event()
+
+    class SlowScheduler(RecordingScheduler):
+        def admit(self, job):
+            admitting.set()
+            proceed.wait(5)
+            return super().admit(job)
+
+    scheduler = SlowScheduler()
+    scheduler.queue = queue
+    queue._scheduler = scheduler
+    submitter = threading.Thread(target=queue.submit, args=(job,))
+    submitter.start()
+    assert admitting.wait(5)
+    queue.cancel(job)
+    proceed.set()
+    submitter.join(5)
+    assert job.state == CANCELLED
+    assert scheduler.released == ["slow admission"]
+    assert queue.wait(timeout=5)
+
+
+def test_cancel_before_the_process_starts_is_not_lost(tmp_path):
+    marker = tmp_path / "ran"
+
+    class CancellingCache:
+        """Result cache whose lookup is interrupted by a cancel, just before the process would start"""
+
+        def lookup(self, job):
+            queue.cancel(job)
+            return False
+
+        def store(self, job):
+            pass
+
+    queue = JobQueue(max_workers=1, result_cache=CancellingCache())
+    job = queue.submit(Job([sys.executable, "-c", f"open({str(marker)!r}, 'w').close()"], "cancelled",
+                           output_files=[str(tmp_path / "out")]))
+    assert queue.wait(timeout=10)
+    assert job.state == CANCELLED
+    assert not marker.exists()
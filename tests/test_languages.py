@@ -0,0 +1,36 @@
+from languages import language_from_filename, language_from_text, normalize_language
+
+
+def test_normalize_language_maps_to_iso_639_2():
+    assert normalize_language("it") == "ita"
+    assert normalize_language(" GER ") == "deu"
+    assert normalize_language("eng") == "eng"
+    assert normalize_language("xx") == "xx"
+    assert normalize_language("") is None
+
+
+def test_language_from_filename():
+    assert language_from_filename("Show.S01E01.it.srt") == "ita"
+    assert language_from_filename("Show.S01E01.en.forced.srt") == "eng"
+    assert language_from_filename("/media/Show.S01E01.pt_BR.srt") == "por"
+    assert language_from_filename("Show.S01E01.srt") is None
+    assert language_from_filename("it.srt") is None  # A bare code is the stem, not a suffix
+    assert language_from_filename("Dr.No.mkv") is None
+    assert language_from_filename("Dr.No.nor.srt") == "nor"
+
+
+def test_language_from_text_by_common_words():
+    english = "What is that? I have not seen it. You and me, we are the ones that it was for. " * 3
+    italian = "Non ho capito cosa che mi hai detto, ma questo è per te e non per lui. " * 3
+    assert language_from_text(english) == "eng"
+    assert language_from_text(italian) == "ita"
+
+
+def test_language_from_text_by_script():
+    assert language_from_text("Привет, как дела? Всё хорошо.") == "rus"
+    assert language_from_text("こんにちは、元気ですか。") == "jpn"
+
+
+def test_language_from_text_is_none_when_unclear():
+    assert language_from_text("OK. Yes. 123") is None
+    assert language_from_text("") is None
@@ -0,0 +1,44 @@
+import subprocess
+
+import pytest
+
+import media_probe
+from media_probe import media_duration, native_subtitle_info, parse_packets, probe_files, probe_packets
+
+SRT = "1\n00:00:01,000 --> 00:00:02,500\nHello\n\n2\n00:00:03,000 --> 00:00:04,000\nWorld\n"
+
+
+def test_native_subtitle_info_reads_srt(tmp_path):
+    path = tmp_path / "movie.it.srt"
+    path.write_text(SRT, encoding="utf-8")
+    info = native_subtitle_info(str(path))
+    assert info["streams"][0]["codec_type"] == "subtitle"
+    assert native_subtitle_info(str(tmp_path / "movie.mkv")) is None
+
+
+def test_probe_files_reads_subtitles_without_ffprobe(tmp_path, monkeypatch):
+    path = tmp_path / "movie.srt"
+    path.write_text(SRT, encoding="utf-8")
+    monkeypatch.setattr(media_probe, "probe_command", lambda f: (_ for _ in ()).throw(AssertionError(f)))
+    infos = probe_files([str(path)])
+    assert infos[str(path)]["streams"][0]["codec_name"] == "subrip"
+
+
+def test_parse_packets():
+    assert parse_packets("0.000000,1200,K__\nN/A,300,__\n0.040000,400,__\n") == [
+        (0.0, 1200, True), (None, 300, False), (0.04, 400, False)]
+
+
+def test_failed_packet_probe_raises_value_error(monkeypatch):
+    def run(argv, **kwargs):
+        raise subprocess.CalledProcessError(1, argv, stderr="movie.mkv: Invalid data found when processing input\n")
+
+    monkeypatch.setattr(media_probe.subprocess, "run", run)
+    with pytest.raises(ValueError, match="Invalid data"):
+        probe_packets("movie.mkv", 0)
+
+
+def test_media_duration_falls_back_to_longest_stream():
+    assert media_duration({"format": {"duration": "12.5"}}) == 12.5
+    assert media_duration({"streams": [{"duration": "3"}, {"duration": "7.5"}, {}]}) == 7.5
+    assert media_duration({}) is None
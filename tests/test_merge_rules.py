@@ -0,0 +1,46 @@
+from merge_rules import SeriesMergeRule, StreamRule, episode_key, pair_externals, plan_series_merge
+
+VIDEO_INFO = {"streams": [
+    {"index": 0, "codec_type": "video"},
+    {"index": 1, "codec_type": "audio", "tags": {"language": "eng"}},
+    {"index": 2, "codec_type": "audio", "tags": {"language": "ita"}},
+    {"index": 3, "codec_type": "subtitle", "tags": {"language": "eng"}},
+]}
+
+
+def test_episode_key_patterns():
+    assert episode_key("/tv/Show.S01E02.1080p.mkv") == "s01e02"
+    assert episode_key("Show 1x02.mkv") == episode_key("show.s01e02.it.srt")
+    assert episode_key("Movie.it.srt") == episode_key("Movie.mkv")
+
+
+def test_pair_externals_by_episode():
+    pairs = pair_externals(["Show.S01E01.mkv", "Show.S01E02.mkv"],
+                           ["Show.S01E01.it.srt", "Show.S01E02.en.srt", "Show.S01E03.en.srt"])
+    assert pairs == {"Show.S01E01.mkv": ["Show.S01E01.it.srt"], "Show.S01E02.mkv": ["Show.S01E02.en.srt"]}
+
+
+def test_stream_rule_by_index_and_language():
+    rule = StreamRule([1, "it"])
+    assert rule.matches(1, None)
+    assert rule.matches(0, "ita")
+    assert not rule.matches(0, "eng")
+    assert StreamRule("none").matches(0, "eng") is False
+    assert not StreamRule("none").accepts_external("eng")
+
+
+def test_series_rule_selects_streams_by_type_relative_index_and_language():
+    rule = SeriesMergeRule(audio=["it"], subtitle="none")
+    assert rule.select_streams(VIDEO_INFO["streams"]) == [0, 2]
+    assert SeriesMergeRule(audio=[0]).select_streams(VIDEO_INFO["streams"]) == [0, 1, 3]
+
+
+def test_plan_series_merge_filters_externals_through_the_rule():
+    infos = {"Show.S01E01.mkv": VIDEO_INFO,
+             "Show.S01E01.it.srt": {"streams": [{"codec_type": "subtitle"}]},
+             "Show.S01E01.en.srt": {"streams": [{"codec_type": "subtitle"}]}}
+    rule = SeriesMergeRule(subtitle=["it"], output="{dir}/{key}.mkv")
+    [spec] = plan_series_merge(["Show.S01E01.mkv"], ["Show.S01E01.it.srt", "Show.S01E01.en.srt"], infos, rule)
+    assert spec.add_files == ["Show.S01E01.it.srt"]
+    assert spec.stream_indexes == [0, 1, 2]
+    assert spec.output_file == "./s01e01.mkv"
@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from jobs import Job
+from output_policy import OutputPolicy, discard_staged, partial_name, publish_staged
+
+
+def test_place_defaults_to_beside_the_input():
+    assert OutputPolicy().place("/media/movie_audio_eng.ac3", "/media/movie.mkv", "extract") == \
+        "/media/movie_audio_eng.ac3"
+
+
+def test_place_with_root_and_template(tmp_path):
+    policy = OutputPolicy(str(tmp_path), {"extract": "{dir}/{stem}/{base}{ext}"})
+    assert policy.place("/media/movie_audio_eng.ac3", "/media/movie.mkv", "extract") == \
+        os.path.join(str(tmp_path), "movie", "movie_audio_eng.ac3")
+    assert policy.place("/media/movie_merged.mkv", "/media/movie.mkv", "merge") == \
+        os.path.join(str(tmp_path), "movie_merged.mkv")
+
+
+@pytest.mark.parametrize("templates", [{"extract": "{dir}/{title}"}, {"extract": "{dir}/{0}"},
+                                       {"extract": "{dir/"}, {"extract": 3}, {"remux": "{dir}/{name}"}])
+def test_invalid_templates_are_rejected(templates):
+    with pytest.raises(ValueError):
+        OutputPolicy(templates=templates)
+
+
+def test_load_reports_the_policy_file(tmp_path):
+    path = tmp_path / "policy.json"
+    path.write_text(json.dumps({"templates": {"merge": "{dir}/{movie}{ext}"}}))
+    with pytest.raises(ValueError, match="policy.json"):
+        OutputPolicy.load(str(path))
+    path.write_text(json.dumps({"root": str(tmp_path), "templates": {"merge": "{dir}/{stem}.merged{ext}"}}))
+    assert OutputPolicy.load(str(path)).templates == {"merge": "{dir}/{stem}.merged{ext}"}
+
+
+def test_stage_and_publish(tmp_path):
+    final = str(tmp_path / "out" / "movie.mkv")
+    job = OutputPolicy().stage(Job(["ffmpeg", "-i", "in.mkv", final], output_files=[final]))
+    (temp,) = job.staged
+    assert os.path.basename(temp) == partial_name("movie.mkv")
+    assert job.command[-1] == temp
+    with open(temp, "w") as f:
+        f.write("data")
+    publish_staged(job)
+    assert os.listdir(tmp_path / "out") == ["movie.mkv"]
+
+
+def test_stage_through_scratch_and_discard(tmp_path):
+    final = str(tmp_path / "out.mkv")
+    job = OutputPolicy(scratch_dir=str(tmp_path / "scratch")).stage(Job(["ffmpeg", final], output_files=[final]))
+    (temp,) = job.staged
+    assert temp.startswith(str(tmp_path / "scratch"))
+    with open(temp, "w") as f:
+        f.write("data")
+    discard_staged(job)
+    assert os.listdir(tmp_path / "scratch") == []
+    assert not os.path.exists(final)
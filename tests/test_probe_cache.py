@@ -0,0 +1,115 @@
+import os
+import sqlite3
+
+import pytest
+
+from probe_cache import ProbeCache
+
+INFO = {"streams": [{"index": 0, "codec_type": "video"}], "format": {"duration": "10"}}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ProbeCache(str(tmp_path / "probes.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def _last_access(cache, path):
+    db = sqlite3.connect(cache.db_path)
+    try:
+        row = db.execute("SELECT last_access FROM probes WHERE path = ?", (os.path.abspath(path),)).fetchone()
+    finally:
+        db.close()
+    return row[0] if row else None
+
+
+def _write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_hit_returns_info_without_writing(cache, tmp_path):
+    media = _write(tmp_path / "a.mkv", "data")
+    cache.put(media, INFO)
+    stored = _last_access(cache, media)
+    assert cache.get(media) == INFO
+    assert _last_access(cache, media) == stored
+
+
+def test_access_time_is_written_on_flush(cache, tmp_path):
+    media = _write(tmp_path / "a.mkv", "data")
+    cache.put(media, INFO)
+    stored = _last_access(cache, media)
+    cache.get(media)
+    cache.flush()
+    assert _last_access(cache, media) >= stored
+    assert not cache._accessed
+
+
+def test_changed_file_misses_and_is_dropped_on_flush(cache, tmp_path):
+    media = _write(tmp_path / "a.mkv", "data")
+    cache.put(media, INFO)
+    _write(media, "longer data")
+    assert cache.get(media) is None
+    assert _last_access(cache, media) is not None
+    cache.flush()
+    assert _last_access(cache, media) is None
+
+
+def test_close_flushes(tmp_path):
+    cache = ProbeCache(str(tmp_path / "probes.sqlite3"))
+    media = _write(tmp_path / "a.mkv", "data")
+    cache.put(media, INFO)
+    _write(media, "changed")
+    cache.get(media)
+    cache.close()
+    assert _last_access(cache, media) is None
+
+
+def test_put_after_stale_lookup_keeps_new_entry(cache, tmp_path):
+    media = _write(tmp_path / "a.mkv", "data")
+    cache.put(media, INFO)
+    _write(media, "changed")
+    assert cache.get(media) is None
+    cache.put(media, INFO)
+    cache.flush()
+    assert cache.get(media) == INFO
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ProbeCache(str(tmp_path / "probes.sqlite3"), max_entries=2)
+    try:
+        paths = [_write(tmp_path / f"{n}.mkv", "data") for n in range(3)]
+        cache.put(paths[0], INFO)
+        cache.put(paths[1], INFO)
+        cache._db.execute("UPDATE probes SET last_access = 0 WHERE path = ?", (os.path.abspath(paths[1]),))
+        cache._db.commit()
+        cache.get(paths[0])  # Pending access time is written before evicting
+        cache.put(paths[2], INFO)
+        assert cache.get(paths[1]) is None
+        assert cache.get(paths[0]) == INFO
+        assert cache.get(paths[2]) == INFO
+    finally:
+        cache.close()
+
+
+def test_byte_cap_counts_replaced_and_reopened_entries_once(tmp_path):
+    size = len('{"streams":[{"index":0,"codec_type":"video"}],"format":{"duration":"10"}}')
+    db_path = str(tmp_path / "probes.sqlite3")
+    paths = [_write(tmp_path / f"{n}.mkv", "data") for n in range(3)]
+    cache = ProbeCache(db_path, max_bytes=2 * size)
+    cache.put(paths[0], INFO)
+    cache.put(paths[0], INFO)  # Replacing an entry does not grow the total
+    cache.put(paths[1], INFO)
+    cache.close()
+    cache = ProbeCache(db_path, max_bytes=2 * size)
+    try:
+        assert cache.get(paths[0]) == INFO
+        assert cache.get(paths[1]) == INFO
+        cache.put(paths[2], INFO)  # Totals were read back on open, so this goes over the cap
+        assert [cache.get(path) is None for path in paths].count(True) == 1
+        assert cache.get(paths[2]) == INFO
+    finally:
+        cache.close()
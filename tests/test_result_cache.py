@@ -0,0 +1,77 @@
+import pytest
+
+import result_cache
+from ffmpeg_utils import concat_command, write_concat_list
+from jobs import Job
+from result_cache import ResultCache, concat_list_files
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "ffmpeg_version", lambda: "ffmpeg version test")
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    yield cache
+    cache.close()
+
+
+def extract_job(input_file, output_file):
+    return Job(["ffmpeg", "-hide_banner", "-y", "-i", str(input_file), "-map", "0:a:0", "-c", "copy",
+                str(output_file)], output_files=[str(output_file)])
+
+
+def test_job_key_ignores_overwrite_and_progress_options(cache, tmp_path):
+    source = tmp_path / "in.mkv"
+    source.write_bytes(b"media")
+    job = extract_job(source, tmp_path / "out.aac")
+    other = Job(job.command[:2] + ["-n", "-progress", "pipe:1", "-nostats"] + job.command[3:],
+                output_files=job.output_files)
+    assert cache.job_key(job) == cache.job_key(other)
+
+
+def test_job_key_follows_input_content(cache, tmp_path):
+    source = tmp_path / "in.mkv"
+    source.write_bytes(b"media")
+    job = extract_job(source, tmp_path / "out.aac")
+    key = cache.job_key(job)
+    source.write_bytes(b"other media")
+    assert cache.job_key(job) != key
+
+
+def test_job_key_is_none_for_missing_input(cache, tmp_path):
+    assert cache.job_key(extract_job(tmp_path / "missing.mkv", tmp_path / "out.aac")) is None
+
+
+def test_concat_list_files_unquotes_and_resolves_paths(tmp_path):
+    names = ["a.ts", "with space's.ts"]
+    list_path = write_concat_list([str(tmp_path / n) for n in names], str(tmp_path / "list.txt"))
+    assert concat_list_files(list_path) == [str(tmp_path / n) for n in names]
+    (tmp_path / "relative.txt").write_text("ffconcat version 1.0\nfile part1.ts\nduration 5\n")
+    assert concat_list_files(str(tmp_path / "relative.txt")) == [str(tmp_path / "part1.ts")]
+
+
+def test_concat_job_key_follows_segment_content(cache, tmp_path):
+    segments = [tmp_path / "s1.ts", tmp_path / "s2.ts"]
+    for segment in segments:
+        segment.write_bytes(b"segment")
+    list_path = write_concat_list([str(s) for s in segments], str(tmp_path / "list.txt"))
+    output = str(tmp_path / "joined.ts")
+    job = Job(concat_command(list_path, output).argv(), output_files=[output])
+    key = cache.job_key(job)
+    assert key is not None
+    segments[0].write_bytes(b"re-recorded segment")
+    assert cache.job_key(job) != key
+    segments[1].unlink()
+    assert cache.job_key(job) is None
+
+
+def test_lookup_hits_until_output_changes(cache, tmp_path):
+    source = tmp_path / "in.mkv"
+    source.write_bytes(b"media")
+    output = tmp_path / "out.aac"
+    output.write_bytes(b"audio")
+    job = extract_job(source, output)
+    assert not cache.lookup(job)
+    cache.store(job)
+    assert cache.lookup(extract_job(source, output))
+    output.write_bytes(b"edited audio")
+    assert not cache.lookup(extract_job(source, output))
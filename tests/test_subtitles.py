@@ -0,0 +1,109 @@
+import pytest
+
+from subtitles import (ASS, SRT, Cue, convert_subtitles, detect_encoding, format_ass_time, format_srt_time,
+                       open_subtitles, parse_ass_time, shift_cues, retime_cues, subtitle_info)
+
+SRT_TEXT = ("1\n00:00:01,000 --> 00:00:02,500\n<i>Hello</i>\nthere\n\n"
+            "2\n00:00:03.5 --> 00:00:04,000\nWorld\n"
+            "3\n00:00:05,000 --> 00:00:06,000\nNo blank line before this cue\n")
+
+ASS_TEXT = """[Script Info]
+ScriptType: v4.00+
+
+[V4+ Styles]
+Style: Default,Arial,16
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Comment: 0,0:00:00.00,0:00:01.00,Default,,0,0,0,,ignored
+Dialogue: 0,0:00:01.00,0:00:02.50,Default,,0,0,0,,{\\i1}Hello{\\i0}\\Nthere, friend
+Dialogue: 0,0:00:03.00,0:00:04.00,Sign,,0,0,0,,World
+"""
+
+
+def _write(tmp_path, name, text, encoding="utf-8"):
+    path = tmp_path / name
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def test_srt_reader_tolerates_loose_files(tmp_path):
+    with open_subtitles(_write(tmp_path, "movie.srt", SRT_TEXT)) as reader:
+        cues = list(reader)
+    assert [(c.start, c.end) for c in cues] == [(1.0, 2.5), (3.5, 4.0), (5.0, 6.0)]
+    assert [c.text for c in cues] == ["<i>Hello</i>\nthere", "World", "No blank line before this cue"]
+    assert cues[0].plain_text() == "Hello\nthere"
+
+
+def test_ass_reader_keeps_header_and_skips_comments(tmp_path):
+    with open_subtitles(_write(tmp_path, "movie.ass", ASS_TEXT)) as reader:
+        cues = list(reader)
+        assert reader.header[0] == "[Script Info]"
+        assert reader.header[-1].startswith("Format:")
+    assert [(c.start, c.end) for c in cues] == [(1.0, 2.5), (3.0, 4.0)]
+    assert cues[0].text == "{\\i1}Hello{\\i0}\\Nthere, friend"
+    assert cues[0].plain_text() == "Hello\nthere, friend"
+    assert cues[1].fields["Style"] == "Sign"
+
+
+def test_detect_encoding():
+    assert detect_encoding(b"\xef\xbb\xbfabc") == "utf-8-sig"
+    assert detect_encoding("perché".encode("utf-8")) == "utf-8"
+    assert detect_encoding("perché".encode("utf-8")[:-1]) == "utf-8"  # Sample cut inside a character
+    assert detect_encoding("perché".encode("cp1252")) == "utf-8"  # Could be a cut UTF-8 character
+    assert detect_encoding("perché".encode("cp1252"), complete=True) == "cp1252"
+    assert detect_encoding("perché?".encode("cp1252")) == "cp1252"
+
+
+def test_reader_detects_legacy_encoding_of_short_file(tmp_path):
+    with open_subtitles(_write(tmp_path, "movie.srt", "1\n00:00:01,000 --> 00:00:02,000\nperché", "cp1252")) as reader:
+        assert reader.encoding == "cp1252"
+        assert [c.text for c in reader] == ["perché"]
+
+
+def test_time_formats_round_trip():
+    assert format_srt_time(3723.5) == "01:02:03,500"
+    assert format_ass_time(3723.5) == "1:02:03.50"
+    assert parse_ass_time("1:02:03.50") == 3723.5
+    assert parse_ass_time("bad") is None
+
+
+def test_shift_drops_cues_before_zero_and_clamps_partial_ones():
+    cues = [Cue(0.5, 1.0, "gone"), Cue(1.5, 3.0, "clamped"), Cue(5.0, 6.0, "moved")]
+    shifted = list(shift_cues(cues, -2.0))
+    assert [(c.start, c.end, c.text) for c in shifted] == [(0.0, 1.0, "clamped"), (3.0, 4.0, "moved")]
+
+
+def test_retime_for_pal_speed_up():
+    [cue] = retime_cues([Cue(25.0, 50.0, "x")], 25.0, 24.0)
+    assert (cue.start, cue.end) == pytest.approx((26.041667, 52.083333))
+
+
+def test_convert_srt_to_ass_and_back(tmp_path):
+    source = _write(tmp_path, "movie.srt", SRT_TEXT, "cp1252")
+    ass = str(tmp_path / "movie.ass")
+    assert convert_subtitles(source, ass, shift=1.0) == 3
+    with open_subtitles(ass) as reader:
+        assert reader.format == ASS
+        cues = list(reader)
+    assert cues[0].start == 2.0
+    assert cues[0].text == "{\\i1}Hello{\\i0}\\Nthere"
+
+    back = str(tmp_path / "back.srt")
+    assert convert_subtitles(ass, back, output_format=SRT) == 3
+    with open_subtitles(back) as reader:
+        assert [c.text for c in reader][0] == "<i>Hello</i>\nthere"
+
+
+def test_subtitle_info_looks_like_ffprobe(tmp_path):
+    info = subtitle_info(_write(tmp_path, "movie.en.forced.srt", SRT_TEXT))
+    [stream] = info["streams"]
+    assert stream["codec_name"] == "subrip"
+    assert stream["tags"] == {"NUMBER_OF_FRAMES": "3", "language": "eng"}
+    assert stream["disposition"]["forced"] == 1
+    assert float(info["format"]["duration"]) == 6.0
+
+
+def test_subtitle_info_rejects_files_without_cues(tmp_path):
+    with pytest.raises(ValueError):
+        subtitle_info(_write(tmp_path, "movie.srt", "not a subtitle file\n"))
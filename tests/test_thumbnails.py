@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from thumbnails import THUMBNAIL_POSITION, ThumbnailCache
+
+VIDEO = {"codec_type": "video", "codec_name": "h264"}
+COVER = {"codec_type": "video", "codec_name": "mjpeg", "disposition": {"attached_pic": 1}}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ThumbnailCache(str(tmp_path / "thumbs"), max_bytes=1000)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "movie.ts"
+    path.write_bytes(b"media")
+    return str(path)
+
+
+def inputs(job):
+    """(input options, path) of every ffmpeg input; each has the same five seek options"""
+    return [(job.command[i - 5:i], job.command[i + 1]) for i, arg in enumerate(job.command) if arg == "-i"]
+
+
+def seek_times(job):
+    return [float(options[options.index("-ss") + 1]) for options, _ in inputs(job)]
+
+
+def test_preview_job_skips_cover_art(cache, source, media_record):
+    job = cache.preview_job(media_record([VIDEO, COVER], path=source))
+    assert len(job.output_files) == 2
+    assert ":v:1]" not in job.command[job.command.index("-filter_complex") + 1]
+
+
+def test_every_input_is_seeked_to_a_keyframe(cache, source, media_record):
+    job = cache.preview_job(media_record([VIDEO], duration=160.0, path=source))
+    assert len(inputs(job)) == cache.columns * cache.rows + 1
+    for options, path in inputs(job):
+        assert path == source
+        assert options[:2] == ["-skip_frame", "nokey"] and "-ss" in options
+    assert seek_times(job)[:3] == [5.0, 15.0, 25.0]
+
+
+def test_thumbnail_time_ignores_the_start_time(cache, source, media_record):
+    job = cache.preview_job(media_record([VIDEO], duration=100.0, start_time=5000.0, path=source))
+    assert seek_times(job)[-1] == pytest.approx(100.0 * THUMBNAIL_POSITION)
+    assert max(seek_times(job)) < 100.0
+
+
+def test_cached_previews_are_not_made_again(cache, source, media_record):
+    record = media_record([VIDEO], path=source)
+    for path in cache.paths(source, 0):
+        with open(path, "wb") as f:
+            f.write(b"jpeg")
+    assert cache.get(source, 0) == cache.paths(source, 0)
+    assert cache.preview_job(record) is None
+
+
+def test_changed_file_gets_new_preview_paths(cache, source):
+    paths = cache.paths(source, 0)
+    with open(source, "ab") as f:
+        f.write(b" more")
+    assert cache.paths(source, 0) != paths
+
+
+def test_commit_evicts_least_recently_used(cache, tmp_path, media_record):
+    for n in range(4):
+        image = os.path.join(cache.directory, f"{n}.thumb.jpg")
+        with open(image, "wb") as f:
+            f.write(b"x" * 400)
+        os.utime(image, (n, n))
+
+    class Finished:
+        output_files = []
+    cache.commit(Finished())
+    assert sorted(os.listdir(cache.directory)) == ["2.thumb.jpg", "3.thumb.jpg"]
@@ -0,0 +1,60 @@
+import subprocess
+
+import cli
+import media_probe
+from transcode import MIN_CHUNK_SECONDS, TranscodePlan, chunk_bounds
+from trim import SEEK_NUDGE
+
+KEYFRAMES = [float(t) for t in range(0, 120, 4)]
+
+
+def option(argv, name):
+    return argv[argv.index(name) + 1] if name in argv else None
+
+
+def test_chunk_bounds_start_on_keyframes():
+    bounds = chunk_bounds(KEYFRAMES, 120.0, 4)
+    assert bounds == [(0.0, 28.0), (28.0, 60.0), (60.0, 88.0), (88.0, 120.0)]
+
+
+def test_chunk_bounds_keep_chunks_above_the_minimum_length():
+    bounds = chunk_bounds(KEYFRAMES, 120.0, 40)
+    assert all(end - start >= MIN_CHUNK_SECONDS for start, end in bounds)
+    assert all(start in KEYFRAMES for start, _ in bounds)
+    assert bounds[-1][1] == 120.0
+    assert chunk_bounds(KEYFRAMES, 15.0, 4) == [(0.0, 15.0)]
+
+
+STREAMS = [{"codec_type": "video", "codec_name": "h264"}, {"codec_type": "audio", "codec_name": "aac"}]
+
+
+def test_chunks_count_from_the_start_of_the_file(media_record):
+    record = media_record(STREAMS, 120.0, 600.0, "movie.ts", [600.0 + t for t in KEYFRAMES])
+    plan = TranscodePlan(record, "out.mkv", chunks=4)
+    assert [(c.start, c.end) for c in plan.chunks] == chunk_bounds(KEYFRAMES, 120.0, 4)
+
+
+def test_chunk_commands_seek_just_before_each_keyframe(media_record):
+    plan = TranscodePlan(media_record(STREAMS, 120.0, path="movie.ts", keyframes=KEYFRAMES), "out.mkv", chunks=4)
+    plan.work_dir = "work"
+    commands = [argv for _, argv in plan.chunk_commands()]
+    assert option(commands[0], "-ss") is None
+    assert float(option(commands[0], "-t")) == 28.0 - SEEK_NUDGE
+    assert float(option(commands[1], "-ss")) == 28.0 - SEEK_NUDGE
+    assert float(option(commands[1], "-t")) == 32.0
+    assert option(commands[-1], "-t") is None
+    assert option(commands[1], "-map") == "0:v:0"
+
+
+def test_failed_keyframe_probe_is_reported(tmp_path, monkeypatch, capsys, media_record):
+    source = str(tmp_path / "movie.ts")
+    info = media_record(STREAMS, 120.0).info
+
+    def run(argv, **kwargs):
+        raise subprocess.CalledProcessError(1, argv, stderr="Invalid data found when processing input")
+
+    monkeypatch.setattr(cli, "setup_logging", lambda *args, **kwargs: None)
+    monkeypatch.setattr(cli, "probe_files", lambda paths, **kwargs: {source: info})
+    monkeypatch.setattr(media_probe.subprocess, "run", run)
+    assert cli.main(["transcode", source, "--no-cache", "-o", str(tmp_path / "out.mkv")]) == 2
+    assert "Invalid data" in capsys.readouterr().err
@@ -0,0 +1,74 @@
+import pytest
+
+from trim import TrimPlan, keyframe_at_or_after, keyframe_at_or_before, parse_timestamp, plan_split
+
+VIDEO = {"codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080, "pix_fmt": "yuv420p",
+         "r_frame_rate": "25/1", "time_base": "1/1000"}
+AAC = {"codec_type": "audio", "codec_name": "aac", "sample_rate": "48000", "channels": 2, "time_base": "1/1000",
+       "tags": {"language": "ita"}}
+AC3 = {"codec_type": "audio", "codec_name": "ac3", "sample_rate": "48000", "channels": 6, "time_base": "1/1000",
+       "tags": {"language": "eng"}}
+KEYFRAMES = [0.0, 10.0, 20.0, 30.0, 40.0, 50.0]
+
+
+def option(argv, name):
+    return argv[argv.index(name) + 1]
+
+
+def values(argv, name):
+    return [argv[i + 1] for i, arg in enumerate(argv) if arg == name]
+
+
+@pytest.mark.parametrize("text, seconds", [("90", 90.0), ("90.5", 90.5), ("1:30", 90.0), ("0:01:30.5", 90.5)])
+def test_parse_timestamp(text, seconds):
+    assert parse_timestamp(text) == seconds
+
+
+@pytest.mark.parametrize("text", ["", "1:2:3:4", "-5", "abc"])
+def test_parse_timestamp_rejects_invalid(text):
+    with pytest.raises(ValueError):
+        parse_timestamp(text)
+
+
+def test_keyframe_lookup_tolerates_rounding():
+    assert keyframe_at_or_before(KEYFRAMES, 19.9995) == 20.0
+    assert keyframe_at_or_before(KEYFRAMES, 19.5) == 10.0
+    assert keyframe_at_or_after(KEYFRAMES, 20.001) == 20.0
+    assert keyframe_at_or_after(KEYFRAMES, 51.0) is None
+
+
+def test_copy_cut_snaps_back_to_keyframe(media_record):
+    plan = TrimPlan(media_record([VIDEO, AAC], keyframes=KEYFRAMES), 15.0, 35.0, "out.mkv")
+    assert [(s.start, s.end, s.reencode) for s in plan.segments] == [(10.0, 35.0, False)]
+
+
+def test_exact_cut_reencodes_only_the_boundaries(media_record):
+    plan = TrimPlan(media_record([VIDEO, AAC], keyframes=KEYFRAMES), 15.0, 35.0, "out.mkv", exact=True)
+    assert [(s.start, s.end, s.reencode) for s in plan.segments] == [
+        (15.0, 20.0, True), (20.0, 30.0, False), (30.0, 35.0, True)]
+
+
+def test_exact_cut_maps_selected_streams_by_their_own_indexes(media_record):
+    record = media_record([VIDEO, AAC, AC3], keyframes=KEYFRAMES)
+    plan = TrimPlan(record, 15.0, 35.0, "out.mkv", exact=True, streams=[0, 2])
+    plan.work_dir = "work"
+    commands = [argv for _, argv in plan.segment_commands()]
+    for argv in commands:
+        assert values(argv, "-map") == ["0:v:0", "0:a:1"]
+    head = commands[0]
+    assert option(head, "-c:a:0") == "ac3"
+    assert option(head, "-ac:a:0") == "6"
+
+
+def test_split_covers_the_whole_file(media_record):
+    plans = plan_split(media_record([VIDEO, AAC], keyframes=KEYFRAMES), [15.0, 35.0])
+    assert [(p.start, p.end) for p in plans] == [(0.0, 10.0), (10.0, 30.0), (30.0, 60.0)]
+
+
+def test_cuts_count_from_the_start_of_the_file(media_record):
+    # MPEG-TS recordings start at an arbitrary timestamp; keyframes are probed as absolute times
+    record = media_record([VIDEO, AAC], start_time=1000.0, keyframes=[1000.0 + t for t in KEYFRAMES])
+    plan = TrimPlan(record, 15.0, 35.0, "out.mkv", exact=True)
+    assert [(s.start, s.end) for s in plan.segments] == [(15.0, 20.0), (20.0, 30.0), (30.0, 35.0)]
+    plans = plan_split(record, [15.0])
+    assert [(p.start, p.end) for p in plans] == [(0.0, 10.0), (10.0, 60.0)]
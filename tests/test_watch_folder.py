@@ -0,0 +1,106 @@
+import pytest
+
+from watch_folder import EXTERNAL, PROCESSED, SKIPPED, ProcessedJournal, WatchService
+from probe_cache import file_identity
+
+VIDEO_INFO = {"streams": [{"index": 0, "codec_type": "video"}], "format": {"duration": "60"}}
+SUBTITLE_INFO = {"streams": [{"index": 0, "codec_type": "subtitle"}]}
+SRT = "1\n00:00:01,000 --> 00:00:02,500\nHello\n"
+
+
+class RecordingRule:
+    """Stands in for an IngestRule; remembers what it was asked to plan"""
+
+    def __init__(self, action="merge"):
+        self.action = action
+        self.calls = []
+
+    def jobs(self, video_file, infos, externals=(), policy=None):
+        self.calls.append((video_file, sorted(externals)))
+        return []
+
+
+@pytest.fixture
+def service(tmp_path):
+    def build(action="merge"):
+        service = WatchService([str(tmp_path)], RecordingRule(action),
+                               ProcessedJournal(str(tmp_path / ".journal.jsonl")), use_inotify=False)
+        services.append(service)
+        return service
+
+    services = []
+    yield build
+    for service in services:
+        for job_queue in (service.queue, service.probe_queue):
+            job_queue.shutdown(cancel=True)
+
+
+def _touch(path):
+    path.write_bytes(b"media")
+    return str(path)
+
+
+def test_video_waits_for_a_track_that_is_still_arriving(service, tmp_path):
+    watcher = service()
+    video = _touch(tmp_path / "show.s01e01.mkv")
+    subtitle = _touch(tmp_path / "show.s01e01.eng.srt")
+    watcher._probed[video] = VIDEO_INFO
+    watcher._start_processing()
+    assert watcher.rule.calls == []
+    assert video in watcher._probed
+
+    watcher._probed[subtitle] = SUBTITLE_INFO
+    watcher._start_processing()
+    assert watcher.rule.calls == [(video, [subtitle])]
+    assert watcher.journal.status(subtitle) == EXTERNAL
+    assert watcher.journal.status(video) == SKIPPED
+    assert not watcher.busy
+
+
+def test_tracks_recorded_earlier_are_paired_without_waiting(service, tmp_path):
+    watcher = service()
+    video = _touch(tmp_path / "show.s01e02.mkv")
+    subtitle = _touch(tmp_path / "show.s01e02.eng.srt")
+    other = _touch(tmp_path / "show.s01e03.eng.srt")  # Another episode: never waited for
+    watcher.journal.record(subtitle, EXTERNAL)
+    watcher._track_infos[subtitle] = SUBTITLE_INFO
+    watcher._probed[video] = VIDEO_INFO
+    watcher._start_processing()
+    assert watcher.rule.calls == [(video, [subtitle])]
+    assert watcher.journal.status(other) is None
+
+
+def test_tracks_recorded_by_an_earlier_run_are_probed_again_first(service, tmp_path):
+    watcher = service()
+    video = _touch(tmp_path / "show.s01e05.mkv")
+    subtitle = tmp_path / "show.s01e05.eng.srt"
+    subtitle.write_text(SRT, encoding="utf-8")
+    watcher.journal.record(str(subtitle), EXTERNAL)
+    watcher._probed[video] = VIDEO_INFO
+    watcher._start_processing()
+    assert watcher.rule.calls == []
+    assert str(subtitle) in watcher._probed  # Read natively, no ffprobe job needed
+
+    watcher._start_processing()
+    assert watcher.rule.calls == [(video, [str(subtitle)])]
+
+
+def test_extract_does_not_wait_for_other_probes(service, tmp_path):
+    watcher = service("extract")
+    video = _touch(tmp_path / "show.s01e04.mkv")
+    _touch(tmp_path / "show.s01e04.eng.srt")
+    watcher._probing[1] = str(tmp_path / "other.mkv")
+    watcher._probing_paths.add(str(tmp_path / "other.mkv"))
+    watcher._probed[video] = VIDEO_INFO
+    watcher._start_processing()
+    assert watcher.rule.calls == [(video, [])]
+
+
+def test_journal_treats_a_changed_file_as_new(tmp_path):
+    journal = ProcessedJournal(str(tmp_path / "journal.jsonl"))
+    media = _touch(tmp_path / "movie.mkv")
+    journal.record(media, PROCESSED)
+    assert journal.seen(media, file_identity(media))
+    (tmp_path / "movie.mkv").write_bytes(b"longer media")
+    assert not journal.seen(media, file_identity(media))
+    assert ProcessedJournal(journal.path).status(media) == PROCESSED